@@ -4,12 +4,23 @@
 - 블룸버그 xbbg로 주요 지표를 조회하고, 1일/10일 변화율(또는 bp/pp) 기반 임계수준 초과 여부를 점검
 - 특정 항목은 월평균(MTD/PrevM/3M-ago) 기준으로 스프레드/변동률 임계치 점검
 - ⚠️ "현재 값이 나오는 지표만" alerts에 반영 (데이터 미수급 시 해당 블록은 코드에서 주석 처리 예시를 남김)
-- 결과를 엑셀 파일(요약 alerts + 원시 raw_data)로 저장
+- 결과를 열 단위 파일(alerts / raw_data, parquet·feather)로 저장 + 엑셀 파일(요약 alerts + 원시 raw_data) 내보내기
+- (선택) BACKTEST=True: 모든 룰의 날짜별 초과 여부/발생 통계 (risk_backtest_YYYYMMDD.xlsx)
+- (선택) SWEEP=True: THRESHOLDS 후보값별 과거 발생 빈도/시점 민감도 표 (risk_sweep_YYYYMMDD.xlsx)
+- (선택) BACKFILL=True: 빠진 날짜의 risk_thresholds_YYYYMMDD.xlsx 를 히스토리 캐시로 재생성
+- (선택) LIVE_MONITOR=True: 장중 실시간 구독으로 틱마다 해당 룰만 재평가
 
 환경 유의:
 - Bloomberg Desktop + xbbg (터미널 로그인 상태) 필요
 - pip: xbbg, pandas, numpy, openpyxl 등
 - Windows 경로는 반드시 pathlib.Path 사용 또는 / 슬래시
+- BDH 원시값은 HIST_CACHE_DIR 에 (ticker, field) 단위로 캐시 → 매일 증분만 조회
+  (과거치 수정 반영이 필요하면 FULL_REFRESH=True)
+- 블룸버그 없이 실행/벤치마크: DATA_SOURCE_MODE="record"로 한 번 녹화 → "replay"로 재생
+- 계속 실패하는 티커는 자동 격리(quarantine.json) → 결과 엑셀 fetch_issues 시트 확인
+- 63일 평균/n영업일 변화/연속일 판정은 rolling_state.json 에 이어서 갱신 (어제 상태 + 새 행만 반영)
+- 룰별 초과 상태는 alert_state.json 에 누적 → alert_state 시트 (new/ongoing/cleared)
+- 날짜별 alerts 행은 risk_archive.sqlite 에 누적 (최신일/기간/지표 이력 조회, C1 업데이트 셀이 사용)
 
 임계수준 요약:
 - 원화금리(국고3Y): 1일 ±15bp, 10일 ±50bp
@@ -36,19 +47,19 @@
 
 from pathlib import Path  # ✅ 윈도우에서도 안전한 경로 처리
 from datetime import timedelta
+import re
+import json
+import hashlib
+import sqlite3
+import contextlib
+import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 
-# Bloomberg
-try:
-    from xbbg import blp
-except ImportError as e:
-    raise SystemExit(
-        "xbbg가 설치되어 있지 않습니다. 다음을 먼저 실행해주세요:\n"
-        "    pip install xbbg pandas numpy openpyxl\n"
-        f"원본 에러: {e}"
-    )
-
 # -----------------------------
 # 0) 공통 설정
 # -----------------------------
@@ -60,6 +71,253 @@ END_DATE = pd.Timestamp(TODAY).strftime("%Y-%m-%d")
 # 💾 저장 경로 (실행 폴더)
 output_path = Path(r"C:/Users/amongpapa/chartup/raw_data") / f"risk_thresholds_{pd.Timestamp(TODAY).strftime('%Y%m%d')}.xlsx"
 
+# 🗃 기본 출력: alerts / raw_data 를 열 단위 파일로 (열 타입 유지, 압축) → COLUMNAR_DIR
+# - COLUMNAR_FORMAT: "parquet" | "feather" (pyarrow 필요, 없으면 pickle 로 저장하고 경고)
+# - EXCEL_EXPORT: 엑셀(risk_thresholds_YYYYMMDD.xlsx)은 선택 내보내기 - 같은 프로세스의 텔레그램 셀은
+#   메모리 레코드(ALERT_RECORDS)를 쓰지만, 따로 실행할 때는 이 엑셀을 읽으므로 기본 켜짐
+# - EXCEL_STREAMING: openpyxl write-only 모드로 행 단위 기록 (셀 서식 객체 없이 → 빠르고 메모리 적음)
+# - OUTPUT_BENCH: 저장 형식별 쓰기 시간/파일 크기 비교 출력
+COLUMNAR_OUTPUT = True
+COLUMNAR_FORMAT = "parquet"
+COLUMNAR_DIR = Path(r"C:/Users/amongpapa/chartup/raw_data/columnar")
+EXCEL_EXPORT = True
+EXCEL_STREAMING = True
+OUTPUT_BENCH = False
+
+# 🗄 일별 결과 아카이브 (SQLite): 매일 alerts 행을 (date, metric) 키로 누적 → 최신/기간/지표 이력 조회
+# - C1 업데이트 셀은 엑셀 폴더를 뒤지지 않고 여기서 최신일 행을 읽음 (아카이브가 없으면 기존 엑셀 방식)
+# - 처음 만들 때 raw_data 폴더의 기존 risk_thresholds 엑셀을 1번 가져옴
+ARCHIVE = True
+ARCHIVE_PATH = Path(r"C:/Users/amongpapa/chartup/raw_data/risk_archive.sqlite")
+
+# 📊 실행 리포트(JSON): 키별 조회 지연/수신 행 수/채택 필드/ffill·bfill 보정 비율 (엑셀 옆에 저장)
+RUN_REPORT_PATH = output_path.with_name(output_path.stem + "_run.json")
+
+# 💾 BDH 히스토리 캐시 (티커별 파일 1개, 컬럼=필드 → (ticker, field) 단위 보관)
+# - 매일 전체 420일을 다시 받지 않고, 마지막 저장일 이후(증분)만 조회해서 병합
+# - 과거치 수정(revision) 반영이 필요하면 FULL_REFRESH=True 로 1회 실행
+HIST_CACHE_DIR = Path(r"C:/Users/amongpapa/chartup/raw_data/hist_cache")
+FULL_REFRESH = False
+CACHE_OVERLAP_DAYS = 5   # 증분 조회 시 마지막 저장일 이전 N일을 겹쳐 받아 최근 수정치 반영
+HIST_COVERAGE_PATH = HIST_CACHE_DIR / "_coverage.json"   # (ticker, field)별 조회 완료 구간
+
+# 🎯 필드 학습 캐시: 키별로 실제 채택된 필드만 다음 실행에서 요청 (BDH 요청 행렬 축소)
+LEARN_FIELD_WINNERS = True
+FIELD_WINNERS_PATH = HIST_CACHE_DIR / "field_winners.json"
+FIELD_STALE_DAYS = 10    # 학습 필드가 이 기간 이상 값이 없으면 전체 후보 필드로 재조회
+
+# 🧪 백테스트 (기본 꺼짐): 모든 룰의 초과 여부를 전 기간 날짜별로 한 번에 계산 → THRESHOLDS 보정용
+# - BACKTEST_FROM_CACHE=True: 히스토리 캐시에 쌓인 전체 기간 / False: 이번 조회 구간(START_DATE~)
+BACKTEST = False
+BACKTEST_FROM_CACHE = True
+BACKTEST_PATH = output_path.with_name(f"risk_backtest_{pd.Timestamp(TODAY).strftime('%Y%m%d')}.xlsx")
+
+# 🔁 롤링 상태 (rolling_state.json): 키별 최근 63영업일 링 버퍼+합계, 시장 영업일 lag 버퍼, 연속일 카운터
+# - 어제 저장한 상태에 새로 생긴 행만 반영 → 일일 판정(마지막 시점)은 히스토리 전체를 다시 계산하지 않음
+# - 저장된 버퍼가 이번 패널 값과 다르면(과거치 수정/늦게 들어온 값) 해당 키만 패널에서 재구성
+ROLLING_STATE = True
+ROLLING_STATE_PATH = HIST_CACHE_DIR / "rolling_state.json"
+
+# 🔔 알림 상태 (alert_state.json): 룰/슬롯별 첫 초과일, 연속 영업일, 마지막 해소일, 심각도(|값|/|임계|)
+# - 실행마다 그날 결과로 증분 갱신 → new(신규) / ongoing(지속) / cleared(해소) 를 엑셀 alert_state 시트로
+# - 텔레그램 단계는 이 시트를 읽어 신규/해소만 전송 (지속 중인 초과는 건수만)
+ALERT_STATE = True
+ALERT_STATE_PATH = HIST_CACHE_DIR / "alert_state.json"
+
+# 🎚 임계값 민감도 스윕 (기본 꺼짐): THRESHOLDS 후보값별 과거 발생 빈도/시점 → risk_sweep_YYYYMMDD.xlsx
+# - SWEEP_GRID: {임계 키: [후보값, ...]}, None 이면 룰에 쓰인 키마다 현재값 x SWEEP_FACTORS (연속일 n 은 ±2일)
+# - 기간은 백테스트와 같음 (BACKTEST_FROM_CACHE)
+SWEEP = False
+SWEEP_GRID = None                  # 예: {"KOSPI_1d_down_pct": [-2.5, -3.0, -3.5, -4.0], "CDS_prevM_pct_up": [20, 30, 40]}
+SWEEP_FACTORS = (0.5, 0.75, 1.0, 1.25, 1.5)
+SWEEP_PATH = output_path.with_name(f"risk_sweep_{pd.Timestamp(TODAY).strftime('%Y%m%d')}.xlsx")
+
+# 🗂 과거 날짜 재생성 (기본 꺼짐): 빠진 날의 risk_thresholds_YYYYMMDD.xlsx 를 히스토리 캐시로 다시 작성
+# - 날짜마다 그날 일일 실행과 같은 420일 구간으로 패널을 구성해 alerts 재계산 (BDH 조회 없음)
+# - BACKFILL_TO=None 이면 어제까지, 이미 있는 파일은 BACKFILL_OVERWRITE=True 일 때만 다시 씀
+BACKFILL = False
+BACKFILL_FROM = None               # 예: "2025-10-01"
+BACKFILL_TO = None
+BACKFILL_OVERWRITE = False
+BACKFILL_WORKERS = 4
+
+# 🔍 룰 식 그래프 디버그 (기본 꺼짐): 파생 시계열 노드별 계산 시간/재사용 횟수 출력
+EXPR_DEBUG = False
+
+# 🧮 패널 행렬 dtype (float32 로 바꾸면 메모리 절반, 정밀도는 소수 7자리 수준)
+PANEL_DTYPE = np.float64
+
+# 📡 데이터 소스
+# - "live"  : xbbg로 블룸버그 직접 조회 (터미널 필요)
+# - "record": live 조회 + 응답을 RECORD_DIR 에 압축 저장 (재현/벤치마크용 녹화)
+# - "replay": RECORD_DIR 의 녹화본으로만 응답 (블룸버그 없이 리눅스 등에서 실행/프로파일링)
+DATA_SOURCE_MODE = "live"
+RECORD_DIR = Path(r"C:/Users/amongpapa/chartup/raw_data/bdh_records")
+
+# 🔗 공통 조회 계획: 임계치 단계(TICKERS/CDS_TICKERS) + IND 다운로드 단계(indicator.xlsx)의
+#    티커를 합쳐 티커당 1번만 조회하고, 각 단계는 공유 프레임에서 자기 몫만 잘라 사용
+SHARED_FETCH_PLAN = True
+IND_INPUT_PATH = Path(r"C:\Users\amongpapa\chartup\go_scen\data\indicator.xlsx")
+IND_LOOKBACK_DAYS = 365
+
+# 🧯 부분 실패 허용 조회: 티커를 작은 단위로 나눠 조회하고, 실패한 단위만 1개씩 다시 조회
+# - 단위마다 타임아웃/재시도(지수 백오프), 타임아웃 난 단위는 재시도 없이 정상 단위가 끝난 뒤
+#   티커별로 분리 조회 → 고장 난 티커 하나가 다른 티커 조회를 막지 않음
+# - 연속 QUARANTINE_AFTER 회 실패(오류/타임아웃/데이터 없음)한 티커는 QUARANTINE_DAYS 동안 격리
+#   (격리 중에는 캐시 값만 사용, 기간이 지나면 1회 재시도) → 결과 엑셀 fetch_issues 시트로 보고
+FETCH_UNIT_SIZE = 10
+FETCH_WORKERS = 4
+FETCH_TIMEOUT_SEC = 60
+FETCH_ISOLATE_TIMEOUT_SEC = 15     # 실패 단위를 티커 1개씩 다시 조회할 때의 (짧은) 타임아웃
+FETCH_RETRIES = 3
+FETCH_BACKOFF_SEC = 2.0
+QUARANTINE_AFTER = 3
+QUARANTINE_DAYS = 7
+QUARANTINE_PATH = HIST_CACHE_DIR / "quarantine.json"
+
+# ⚡ 장중 실시간 모드 (기본 꺼짐): 일일 결과 저장 후 TICKERS/CDS_TICKERS 를 실시간 구독
+# - 틱이 들어온 키의 마지막 값만 패널에서 제자리 갱신 → 그 키에 걸린 룰만 재평가
+# - "fake" 소스로 터미널 없이 실행/부하 테스트 가능
+LIVE_MONITOR = False
+LIVE_TICK_SOURCE = "blpapi"        # "blpapi" | "fake"
+LIVE_DURATION_SEC = 7 * 60 * 60
+LIVE_QUEUE_MAX = 10_000            # 갱신 대기 큐 상한 (가득 차면 틱 소스가 대기)
+LIVE_BATCH_MAX = 1_000             # 한 번에 꺼내 반영할 최대 키 수 (틱은 키별 최신값으로 합쳐짐)
+LIVE_FIELDS = ["LAST_PRICE", "MID"]  # 실시간 필드 우선순위
+FAKE_TICK_RATE = 2_000             # fake 소스 초당 틱 수
+
+# BDH 옵션 (단계별) - 공통 조회 계획은 옵션이 같은 단계끼리만 합쳐서 조회
+# - 임계치 단계: Fill="P" (같은 요청 안 다른 티커의 거래일에 직전 값을 채움)
+#   adjust="all" 은 지수/금리/환율/CDS 에 영향 없음
+# - IND 다운로드 단계: Fill 없음 → 티커 자신의 거래일만 (IND 셀 단독 조회 _bdh_px_last 와 같은 옵션,
+#   휴일에 채워진 행이 섞이면 변동성 밴드의 60행 평균/σ 가 달라짐)
+BDH_OPTS = {"Per": "D", "Fill": "P", "adjust": "all"}
+IND_BDH_OPTS = {"Per": "D", "adjust": "all"}
+
+# -----------------------------
+# 0-1) 데이터 소스 (live / record / replay)
+# -----------------------------
+def _as_list(x):
+    return [x] if isinstance(x, str) else list(x)
+
+
+def _bdh_request(tickers, flds, start_date, end_date, kwargs):
+    """요청 내용을 정규화한 dict (녹화 파일 키/메타데이터)"""
+    return {
+        "tickers": _as_list(tickers),
+        "flds": _as_list(flds),
+        "start_date": pd.Timestamp(start_date).strftime("%Y-%m-%d"),
+        "end_date": pd.Timestamp(end_date).strftime("%Y-%m-%d"),
+        "kwargs": {k: str(v) for k, v in sorted(kwargs.items())},
+    }
+
+
+def _request_key(req):
+    return hashlib.sha1(json.dumps(req, sort_keys=True).encode("utf-8")).hexdigest()[:20]
+
+
+class XbbgSource:
+    """xbbg.blp.bdh 직접 호출 (블룸버그 터미널 로그인 필요)"""
+    name = "live"
+
+    def __init__(self):
+        try:
+            from xbbg import blp
+        except ImportError as e:
+            raise SystemExit(
+                "xbbg가 설치되어 있지 않습니다. 다음을 먼저 실행해주세요:\n"
+                "    pip install xbbg pandas numpy openpyxl\n"
+                "(블룸버그 없이 실행하려면 DATA_SOURCE_MODE = \"replay\")\n"
+                f"원본 에러: {e}"
+            )
+        self._blp = blp
+
+    def bdh(self, tickers, flds, start_date, end_date, **kwargs):
+        return self._blp.bdh(tickers=tickers, flds=flds, start_date=start_date, end_date=end_date, **kwargs)
+
+
+class RecordingSource:
+    """다른 소스의 응답을 그대로 돌려주면서 RECORD_DIR/<요청키>.pkl.gz 로 녹화"""
+    name = "record"
+
+    def __init__(self, inner, record_dir=RECORD_DIR):
+        self.inner = inner
+        self.record_dir = Path(record_dir)
+        self.record_dir.mkdir(parents=True, exist_ok=True)
+
+    def bdh(self, tickers, flds, start_date, end_date, **kwargs):
+        df = self.inner.bdh(tickers=tickers, flds=flds, start_date=start_date, end_date=end_date, **kwargs)
+        req = _bdh_request(tickers, flds, start_date, end_date, kwargs)
+        pd.to_pickle({"request": req, "data": df},
+                     self.record_dir / f"{_request_key(req)}.pkl.gz", compression="gzip")
+        return df
+
+
+class ReplaySource:
+    """
+    녹화본으로 응답하는 오프라인 소스
+    - 같은 요청이 녹화돼 있으면 그대로 반환
+    - 없으면 같은 옵션(Per/Fill/adjust 등)으로 녹화된 응답들에서 (ticker, field) 조각을 모아 구성
+      (증분 캐시/학습 필드 때문에 요청 모양이 녹화 당시와 달라져도 재생 가능)
+    """
+    name = "replay"
+
+    def __init__(self, record_dir=RECORD_DIR):
+        self.record_dir = Path(record_dir)
+        if not self.record_dir.exists():
+            raise SystemExit(f"녹화 폴더가 없습니다: {self.record_dir} (먼저 DATA_SOURCE_MODE=\"record\"로 실행)")
+        self._records = None
+        self._lock = threading.Lock()
+
+    def _all_records(self):
+        with self._lock:
+            if self._records is None:
+                self._records = [pd.read_pickle(p, compression="gzip")
+                                 for p in sorted(self.record_dir.glob("*.pkl.gz"))]
+        return self._records
+
+    def bdh(self, tickers, flds, start_date, end_date, **kwargs):
+        req = _bdh_request(tickers, flds, start_date, end_date, kwargs)
+        path = self.record_dir / f"{_request_key(req)}.pkl.gz"
+        if path.exists():
+            return pd.read_pickle(path, compression="gzip")["data"]
+
+        known, parts = set(), {}
+        for rec in self._all_records():
+            if rec["request"]["kwargs"] != req["kwargs"]:
+                continue
+            known.update(rec["request"]["tickers"])
+            data = rec["data"]
+            if data is None or data.empty or not isinstance(data.columns, pd.MultiIndex):
+                continue
+            for col in data.columns:
+                if col[0] in req["tickers"] and col[1] in req["flds"]:
+                    parts.setdefault(col, []).append(data[col])
+        if not known.intersection(req["tickers"]):
+            raise KeyError(f"녹화된 응답이 없습니다: {req['tickers'][:3]}... {req['flds']} "
+                           f"{req['start_date']}~{req['end_date']} {req['kwargs']}")
+        if not parts:
+            return pd.DataFrame()
+
+        df = pd.DataFrame({col: pd.concat(p).groupby(level=0).last() for col, p in parts.items()})
+        df.index = pd.to_datetime(df.index, errors="coerce")
+        df = df.loc[(df.index >= req["start_date"]) & (df.index <= req["end_date"])]
+        return df.dropna(how="all").sort_index()
+
+
+def make_data_source(mode=DATA_SOURCE_MODE, record_dir=RECORD_DIR):
+    if mode == "live":
+        return XbbgSource()
+    if mode == "record":
+        return RecordingSource(XbbgSource(), record_dir)
+    if mode == "replay":
+        return ReplaySource(record_dir)
+    raise ValueError(f"알 수 없는 DATA_SOURCE_MODE: {mode!r} (live/record/replay)")
+
+
+DATA_SOURCE = make_data_source()
+print(f"▶ 데이터 소스: {DATA_SOURCE.name}")
+
 # -----------------------------
 # 1) 티커 맵
 # -----------------------------
@@ -122,6 +380,17 @@ CDS_TICKERS = {
     "UAE":            "DPWDU CDS USD SR 5Y D14 Curncy",    # ✅ 요청사항 반영(기업계열)
 }
 
+# 시장 구분 (영업일 달력용): 1D/10D 변화는 '해당 시장 영업일 기준 N일 전' 값과 비교
+# - 시장 영업일 = 그 시장 키 중 하나라도 실제 값이 찍힌 날 (BDH 관측치로 계산 → 휴장일 자동 반영)
+# - 목록에 없는 키(국가별 CDS 등 장외)는 GLOBAL = 평일 전체
+KEY_MARKETS = {
+    **{k: "KR" for k in ["KR1Y", "KR3Y", "KR10Y", "USDKRW", "KOSPI", "VKOSPI", "KRW_IV1Y",
+                         "KRBASERATE", "KRCALL", "KR_CD3M", "KR_FIN1Y_AAA", "KR_CORP3Y_AA-"]},
+    **{k: "US" for k in ["US10Y", "TSFR6M", "TSFR3M", "TSFR1M", "SOFR_OIS_1Y", "SPX", "US_FRAOIS_3M"]},
+    "SX5E": "EU",
+    "JPY_TIBOR3M": "JP",
+}
+
 # -----------------------------
 # 2) 필드 우선순위
 # -----------------------------
@@ -182,99 +451,978 @@ THRESHOLDS = {
     "FRAOIS_prevM_bp": 30.0,
 }
 
+# -----------------------------
+# 3-1) 임계 룰 정의 (선언형) → 6) 에서 1회 컴파일 후 패널 전체에 벡터 평가
+# -----------------------------
+# 룰 1개 = alerts 1행. 새 룰은 아래 표에 항목만 추가 (코드 분기 추가 불필요)
+# - expr     : 시계열 식 "KEY" | "A - B" (스프레드) | "A / B" (비율) — KEY 는 TICKERS/CDS_TICKERS 키
+#              → 식 노드(Expr)로 컴파일, 같은 부분식은 룰이 달라도 실행당 1번만 계산 (EXPR_DEBUG 로 확인)
+# - group    : expr 대신 키 목록 → 키마다 같은 transform/임계값 (행렬 1번 평가, 키별 alerts 행)
+#              metric 의 {key} 는 키 이름으로 치환, 백테스트 등에서 룰 id 는 "id_키"
+# - transform: 값 계산 방식
+#     chg_bp / chg_pct / chg_pp : 시장 영업일 기준 lag 일 변화 (bp / % / pp)
+#     dev_3m                    : (최신값 - 최근 63영업일 평균) x100 bp
+#     mtd_spread                : (MTD 평균(A) - MTD 평균(B)) x100 bp
+#     mtd_vs_prevm              : (MTD 평균 - 전월 평균) x100 bp
+#     mtd_vs_prevm_pct          : MTD 평균 / 전월 평균 - 1 (%)  ("A / B" 면 월평균 비율끼리 비교)
+#     level / level_consec      : (A - B) x100 bp 레벨 (마지막 값 / n 영업일 연속)
+#     dev_mavg_consec           : (값 - months 개월 전 월평균) 이 n 영업일 연속 (월평균이 없으면 행 생략)
+# - checks   : [{"slot": 1d/10d/3m, "cmp": abs>= | abs> | >= | > | <= | <, "thr": THRESHOLDS 키 또는 숫자,
+#                "label": threshold 열 문구(없으면 열 생략, {thr} 사용 가능), "lag"/"n"/"months": transform 인자}]
+# - fmt      : chg 열 표시 형식 (없으면 chg 열 생략) / note, note_na: 비고 (값이 없을 때 note_na)
+#   note 에서 쓸 수 있는 값: {val} {a} {b} {avg} {thr}
+RULE_SPECS = [
+    # ---- (A) 원화금리 - 국고 3년 ----
+    {"id": "kr3y", "metric": "KR 3Y KTB Yield", "expr": "KR3Y", "transform": "chg_bp",
+     "checks": [{"slot": "1d", "lag": 1, "cmp": "abs>=", "thr": "KR3Y_1d_bp", "label": "±15bp"},
+                {"slot": "10d", "lag": 10, "cmp": "abs>=", "thr": "KR3Y_10d_bp", "label": "±50bp"}],
+     "note": "원화 3Y: 수익률 bp 기준"},
+    # ---- (B) 원화금리 - 국고 10년 ----
+    {"id": "kr10y", "metric": "KR 10Y KTB Yield", "expr": "KR10Y", "transform": "chg_bp",
+     "checks": [{"slot": "1d", "lag": 1, "cmp": "abs>=", "thr": "KR10Y_1d_bp", "label": "±15bp"},
+                {"slot": "10d", "lag": 10, "cmp": "abs>=", "thr": "KR10Y_10d_bp", "label": "±45bp"}],
+     "note": "원화 10Y: 수익률 bp 기준"},
+    # ---- (C) 미10Y: 3M 평균 대비 ±100bp ----
+    {"id": "us10y_3m", "metric": "US 10Y vs 3M Avg", "expr": "US10Y", "transform": "dev_3m",
+     "checks": [{"slot": "3m", "cmp": "abs>=", "thr": "G3M_dev_bp"}],
+     "note": "3M avg={avg:.4f}, dev={val:.1f}bp; 임계±{thr}bp", "note_na": "데이터 부족"},
+    # ---- (D) TSFR 6M: 3M 평균 대비 ±100bp ----
+    {"id": "tsfr6m_3m", "metric": "TSFR 6M vs 3M Avg", "expr": "TSFR6M", "transform": "dev_3m",
+     "checks": [{"slot": "3m", "cmp": "abs>=", "thr": "G3M_dev_bp"}],
+     "note": "3M avg={avg:.4f}, dev={val:.1f}bp; 임계±{thr}bp", "note_na": "데이터 부족"},
+    # ---- (E) USDKRW: 1일 ±2%, 10일 ±5% ----
+    {"id": "usdkrw", "metric": "USDKRW Spot", "expr": "USDKRW", "transform": "chg_pct",
+     "checks": [{"slot": "1d", "lag": 1, "cmp": "abs>=", "thr": "USFX_1d_pct", "label": "±2.0%"},
+                {"slot": "10d", "lag": 10, "cmp": "abs>=", "thr": "USFX_10d_pct", "label": "±5.0%"}],
+     "note": "원/달러 환율: % 기준"},
+    # ---- (F) KOSPI: 1일 -3.5%, 10일 -10% (하락만) ----
+    {"id": "kospi", "metric": "KOSPI Index", "expr": "KOSPI", "transform": "chg_pct",
+     "checks": [{"slot": "1d", "lag": 1, "cmp": "<=", "thr": "KOSPI_1d_down_pct", "label": "≤ -3.5%"},
+                {"slot": "10d", "lag": 10, "cmp": "<=", "thr": "KOSPI_10d_down_pct", "label": "≤ -10.0%"}],
+     "note": "하락 방향만 트리거"},
+    # ---- (G) VKOSPI: 1일 +5pp, 10일 +10pp (상승만) ----
+    {"id": "vkospi", "metric": "VKOSPI (Vol Index)", "expr": "VKOSPI", "transform": "chg_pp",
+     "checks": [{"slot": "1d", "lag": 1, "cmp": ">=", "thr": "VKOSPI_1d_up_pp", "label": "≥ +5.0pp"},
+                {"slot": "10d", "lag": 10, "cmp": ">=", "thr": "VKOSPI_10d_up_pp", "label": "≥ +10.0pp"}],
+     "note": "상승만 트리거(pp)"},
+    # ---- (H) USDKRW 1Y IV: 1일 ±5pp, 10일 ±10pp ----
+    {"id": "krw_iv1y", "metric": "USDKRW 1Y Implied Vol", "expr": "KRW_IV1Y", "transform": "chg_pp",
+     "checks": [{"slot": "1d", "lag": 1, "cmp": "abs>=", "thr": "KRWIV_1d_pp", "label": "±5.0pp"},
+                {"slot": "10d", "lag": 10, "cmp": "abs>=", "thr": "KRWIV_10d_pp", "label": "±10.0pp"}],
+     "note": "절대 pp 기준"},
+    # ---- (I) 외화 월평균 장단기: (SOFR OIS 1Y - TSFR 1M) MTD ≥ +150bp ----
+    {"id": "ois1y_tsfr1m_mtd", "metric": "USD OIS 1Y - TSFR 1M (MTD avg)", "expr": "SOFR_OIS_1Y - TSFR1M",
+     "ticker": "{0} vs {1}", "transform": "mtd_spread", "fmt": "{:.1f}bp (MTD spread)",
+     "checks": [{"slot": "1d", "cmp": ">=", "thr": "SPREAD_SOFR1M_vs_OIS1Y_MTD_bp", "label": "≥ +{thr:.0f}bp"}],
+     "note": "MTD OIS1Y={a:.4f}, TSFR1M={b:.4f}", "note_na": "데이터/틱커 확인 필요"},
+    # ---- (J) KR 1Y - 기준금리: 5영업일 연속 < -24bp ----
+    {"id": "kr1y_base", "metric": "KR 1Y - BaseRate (level)", "expr": "KR1Y - KRBASERATE", "transform": "level_consec",
+     "checks": [{"slot": "1d", "n": 5, "cmp": "<", "thr": "KR_1Y_minus_BASE_5d_level_bp", "label": "5영업일 연속 < -24bp"}],
+     "note": "레벨 기준(일별 스프레드)"},
+    # ---- (K) 기준금리 - 콜금리: > +40bp ----
+    {"id": "base_call", "metric": "KR Base - Call (level)", "expr": "KRBASERATE - KRCALL", "transform": "level",
+     "checks": [{"slot": "1d", "cmp": ">", "thr": "BASE_minus_CALL_bp", "label": "> +{thr:.0f}bp"}],
+     "note": "레벨 기준"},
+    # ---- (L) TSFR 3M: MTD-PrevM 절대변화 > 75bp ----
+    {"id": "tsfr3m_prevm", "metric": "TSFR 3M (MTD - PrevM)", "expr": "TSFR3M", "transform": "mtd_vs_prevm",
+     "fmt": "{:.1f}bp (Δavg)",
+     "checks": [{"slot": "1d", "cmp": "abs>", "thr": "TSFR3M_prevM_abs_bp", "label": "abs(Δ) > {thr:.0f}bp"}],
+     "note": "MTD={a:.4f}, PrevM={b:.4f}", "note_na": "데이터/틱커 확인 필요"},
+    # ---- (M) JPY 3M TIBOR: MTD-PrevM 절대변화 > 25bp ----
+    {"id": "tibor3m_prevm", "metric": "JPY TIBOR 3M (MTD - PrevM)", "expr": "JPY_TIBOR3M", "transform": "mtd_vs_prevm",
+     "fmt": "{:.1f}bp (Δavg)",
+     "checks": [{"slot": "1d", "cmp": "abs>", "thr": "JPY_TIBOR3M_prevM_abs_bp", "label": "abs(Δ) > {thr:.0f}bp"}],
+     "note": "MTD={a:.4f}, PrevM={b:.4f}", "note_na": "데이터/틱커 확인 필요"},
+    # ---- (N) 한국 5Y CDS: PrevM +100bp 3D / M-3 +200bp 3D ----
+    {"id": "kr_cds_prevm", "metric": "KR 5Y CDS vs PrevM (3D consec)", "expr": "Korea", "transform": "dev_mavg_consec",
+     "checks": [{"slot": "1d", "months": 1, "n": 3, "cmp": ">", "thr": "KR5YCDS_prevM_bp_3d", "label": "> +{thr:.0f}bp for 3D"}],
+     "note": "PrevM avg={avg:.1f}bp"},
+    {"id": "kr_cds_m3", "metric": "KR 5Y CDS vs M-3 (3D consec)", "expr": "Korea", "transform": "dev_mavg_consec",
+     "checks": [{"slot": "1d", "months": 3, "n": 3, "cmp": ">", "thr": "KR5YCDS_M3ago_bp_3d", "label": "> +{thr:.0f}bp for 3D"}],
+     "note": "M-3 avg={avg:.1f}bp"},
+    # ---- (O) KR Term Spread (10Y-3Y): 5D 역전 지속 ----
+    {"id": "kr_term_spread", "metric": "KR Term Spread 10Y-3Y (5D inversion)", "expr": "KR10Y - KR3Y", "transform": "level_consec",
+     "checks": [{"slot": "1d", "n": "KR_10Y_3Y_inversion_5d", "cmp": "<=", "thr": 0.0, "label": "< 0bp for 5D"}],
+     "note": "10Y-3Y ≤ 0bp 상태 5D 연속"},
+    # ---- (P) 국가별 CDS 17개국: 전월 평균 대비 +30% 상승 (한국은 N 의 bp 기준 3D 연속 로직) ----
+    # - 그룹 룰: (시점 x 국가) 행렬로 1번 평가 → 국가가 늘어도 열만 늘어남, 국가별 스트레스 순위는 cds_stress 시트
+    {"id": "cds", "group": [country for country in CDS_TICKERS if country != "Korea"],
+     "metric": "CDS 5Y: {key} (MTD vs PrevM)", "transform": "mtd_vs_prevm_pct", "latest": True, "fmt": "{:.1f}%",
+     "checks": [{"slot": "1d", "cmp": ">", "thr": "CDS_prevM_pct_up", "label": "> +{thr:.0f}%"}],
+     "note": "MTD={a:.1f}, PrevM={b:.1f}", "note_na": "데이터/틱커 확인 필요"},
+    # ---- (Q) (회사채/국고) 3Y 비율: 전월평균 대비 +16% 상승 ----
+    {"id": "ktb_corp_ratio", "metric": "KTB3Y / Corp(AA-) 3Y (MTD vs PrevM)", "expr": "KR3Y / KR_CORP3Y_AA-",
+     "ticker": "KR3Y / KR_CORP3Y_AA-", "transform": "mtd_vs_prevm_pct", "fmt": "{:.1f}%",
+     "checks": [{"slot": "1d", "cmp": ">", "thr": "CorpAAminus_KTB3Y_ratio_prevM_pct", "label": "> +{thr:.0f}%"}],
+     "note": "MTD={a:.4f}, PrevM={b:.4f}", "note_na": "데이터/틱커 확인 필요"},
+    # ---- (R) 월평균 장단기 (금융채1Y - CD3M): MTD 스프레드 ≥ +70bp ----
+    {"id": "fin1y_cd3m_mtd", "metric": "(MTD) Fin 1Y - CD 3M", "expr": "KR_FIN1Y_AAA - KR_CD3M",
+     "transform": "mtd_spread", "fmt": "{:.1f}bp",
+     "checks": [{"slot": "1d", "cmp": ">=", "thr": "Fin1Y_minus_CD3M_MTD_bp", "label": "≥ +{thr:.0f}bp"}],
+     "note": "MTD Fin1Y={a:.4f}, CD3M={b:.4f}", "note_na": "데이터/틱커 확인 필요"},
+    # ---- (S) Fin1Y AAA - KTB1Y: 5영업일 연속 ≥ +50bp ----
+    {"id": "fin1y_ktb1y", "metric": "Fin 1Y(AAA) - KTB 1Y (5D consec ≥50bp)", "expr": "KR_FIN1Y_AAA - KR1Y",
+     "transform": "level_consec",
+     "checks": [{"slot": "1d", "n": 5, "cmp": ">=", "thr": "Fin1YAAA_minus_KTB1Y_5d_bp", "label": "≥ +{thr:.0f}bp for 5D"}],
+     "note": "레벨 기준(일별 스프레드)"},
+    # ---- (T) S&P 500: 1일 ≤ -3%, 10일 ≤ -12% ----
+    {"id": "spx", "metric": "S&P 500", "expr": "SPX", "transform": "chg_pct",
+     "checks": [{"slot": "1d", "lag": 1, "cmp": "<=", "thr": "SPX_1d_down_pct", "label": "≤ -3.0%"},
+                {"slot": "10d", "lag": 10, "cmp": "<=", "thr": "SPX_10d_down_pct", "label": "≤ -12.0%"}],
+     "note": "하락만 트리거"},
+    # ---- (U) EuroStoxx50: 1일 |Δ| ≥ 3%, 10일 ≤ -12% ----
+    {"id": "sx5e", "metric": "EuroStoxx50", "expr": "SX5E", "transform": "chg_pct",
+     "checks": [{"slot": "1d", "lag": 1, "cmp": "abs>=", "thr": "SX5E_1d_abs_pct", "label": "abs ≥ {thr:.1f}%"},
+                {"slot": "10d", "lag": 10, "cmp": "<=", "thr": "SX5E_10d_down_pct", "label": "≤ -12.0%"}],
+     "note": "1D는 절대값, 10D는 하락만"},
+    # ---- (V) 3M FRA-OIS: PrevM 대비 +30bp ----
+    {"id": "fraois_prevm", "metric": "USD 3M FRA-OIS (MTD - PrevM)", "expr": "US_FRAOIS_3M", "transform": "mtd_vs_prevm",
+     "fmt": "{:.1f}bp (Δavg)",
+     "checks": [{"slot": "1d", "cmp": ">", "thr": "FRAOIS_prevM_bp", "label": "> +{thr:.0f}bp"}],
+     "note": "MTD={a:.2f}, PrevM={b:.2f}", "note_na": "데이터/틱커 확인 필요"},
+]
+
 # -----------------------------
 # 4) 유틸 함수
 # -----------------------------
-def fetch_hist_with_field_prefs(ticker_map, cds_map, field_prefs, start_date, end_date):
-    """
-    멀티 필드로 BDH 조회 후, 가용성이 가장 좋은 필드를 채택하여 단일 시계열로 병합
-    반환: DataFrame(index=Date, columns=keys)
-    """
-    all_pairs = list(ticker_map.items()) + list(cds_map.items())
-    # ★ 요청 필드 = 우선순위 필드 합집합 + Fallback (누락 방지)
-    prefs_fields = {fld for prefs in field_prefs.values() for fld in prefs}
-    all_fields = sorted(prefs_fields | FALLBACK_FIELDS)  # ★ 수정
+# parquet 엔진(pyarrow)이 있으면 parquet, 없으면 pickle 로 캐시 저장
+try:
+    import pyarrow  # noqa: F401
+    _CACHE_EXT = ".parquet"
+except ImportError:
+    _CACHE_EXT = ".pkl"
+
+
+def _write_frame(df, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".parquet":
+        df.to_parquet(path)
+    else:
+        df.to_pickle(path)
+
 
-    raw = blp.bdh(
-        tickers=[t for _, t in all_pairs],
-        flds=all_fields,
+def _read_frame(path):
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def _opts_tag(opts):
+    """BDH 옵션 → 캐시/커버 구간 구분 접미사 (기본 BDH_OPTS 는 '' → 기존 캐시 그대로)"""
+    if opts is None or opts == BDH_OPTS:
+        return ""
+    return "@" + ",".join(f"{k}={v}" for k, v in sorted(opts.items()))
+
+
+def _hist_cache_path(bb_ticker, tag=""):
+    """블룸버그 티커(+옵션 접미사) → 캐시 파일 경로 (공백/특수문자는 '_' 로 치환)"""
+    safe = re.sub(r"[^0-9A-Za-z]+", "_", bb_ticker + tag).strip("_")
+    return HIST_CACHE_DIR / f"{safe}{_CACHE_EXT}"
+
+
+def load_hist_cache(bb_ticker, tag=""):
+    """캐시된 (날짜 x 필드) 원시 시계열. 없거나 깨졌으면 None"""
+    path = _hist_cache_path(bb_ticker, tag)
+    if not path.exists():
+        return None
+    try:
+        df = _read_frame(path)
+    except Exception as e:
+        print(f"⚠️ 캐시 읽기 실패 → 전체 재조회: {path.name} ({e})")
+        return None
+    df.index = pd.to_datetime(df.index, errors="coerce")
+    return df.sort_index()
+
+
+def save_hist_cache(bb_ticker, df, tag=""):
+    _write_frame(df, _hist_cache_path(bb_ticker, tag))
+
+
+def _bdh_raw(tickers, fields, start_date, end_date, opts=None):
+    """BDH 원시 조회(DATA_SOURCE 경유, 옵션 기본 BDH_OPTS) → MultiIndex(ticker, field) 컬럼 + DatetimeIndex 로 정리"""
+    raw = DATA_SOURCE.bdh(
+        tickers=tickers,
+        flds=fields,
         start_date=start_date,
         end_date=end_date,
-        Per="D",
-        Fill="P",
+        **(BDH_OPTS if opts is None else opts),
     )
+    if raw is None or raw.empty:
+        return pd.DataFrame(columns=pd.MultiIndex.from_tuples([], names=[None, None]), dtype=float)
 
     # 일부 환경에서 단일 종목/필드 조합일 때 MultiIndex가 아닐 수 있으므로 방어
     if not isinstance(raw.columns, pd.MultiIndex):
-        raw.columns = pd.MultiIndex.from_product([[all_pairs[0][1]], all_fields])
+        raw.columns = pd.MultiIndex.from_product([[tickers[0]], fields])
 
     raw.index = pd.to_datetime(raw.index, errors="coerce")
-    raw = raw.sort_index()
+    return raw.sort_index()
 
-    out = {}
+
+def _load_json(path, default):
+    if not path.exists():
+        return default
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"⚠️ JSON 읽기 실패 → 초기화: {path.name} ({e})")
+        return default
+
+
+def _save_json(path, obj):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+# 조회 단위 결과/격리 현황 (엑셀 fetch_issues 시트로 보고)
+FETCH_ISSUES = []
+_FETCH_LOCK = threading.Lock()
+# 티커별 조회 계측 (지연시간/시도 횟수/수신 행 수) → 실행 리포트(RUN_REPORT_PATH)
+FETCH_TELEMETRY = {}
+FETCH_STATS = {"units": 0, "attempts": 0}
+_TELEMETRY_LOCK = threading.Lock()
+
+
+def _call_with_timeout(fn, timeout, on_done=None):
+    """
+    fn() 을 별도 스레드에서 실행, timeout 초 안에 끝나지 않으면 TimeoutError (멈춘 호출은 버리고 진행)
+    - on_done: 호출 스레드가 실제로 끝날 때 실행 (타임아웃으로 버려진 뒤 뒤늦게 끝나도 실행)
+      → 공유 세션 잠금을 여기서 풀어, 멈춘 호출이 세션을 쓰는 동안 다음 호출이 끼어들지 않게 함
+    """
+    box = {}
+
+    def target():
+        try:
+            box["value"] = fn()
+        except BaseException as e:
+            box["error"] = e
+        finally:
+            if on_done is not None:
+                on_done()
+
+    th = threading.Thread(target=target, daemon=True)
+    try:
+        th.start()
+    except BaseException:
+        if on_done is not None:
+            on_done()
+        raise
+    th.join(timeout)
+    if th.is_alive():
+        raise TimeoutError(f"{timeout}s 안에 응답 없음")
+    if "error" in box:
+        raise box["error"]
+    return box["value"]
+
+
+def _record_telemetry(tickers, fields, start_date, attempts, latency_ms, df, err):
+    """조회 단위 결과를 티커별 FETCH_TELEMETRY 에 누적 (지연시간은 세션 대기 제외, 단위 전체 기준)"""
+    got = set(df.columns.get_level_values(0)) if df is not None else set()
+    with _TELEMETRY_LOCK:
+        FETCH_STATS["units"] += 1
+        FETCH_STATS["attempts"] += attempts
+        for t in tickers:
+            tel = FETCH_TELEMETRY.setdefault(t, {"requests": 0, "attempts": 0, "latency_ms": 0.0, "rows": 0})
+            tel["requests"] += 1
+            tel["attempts"] += attempts
+            tel["latency_ms"] = round(tel["latency_ms"] + latency_ms, 1)
+            tel["unit_size"] = len(tickers)
+            tel["fields"] = list(fields)
+            tel["start_date"] = start_date
+            if t in got:
+                tel["rows"] += int(df[t].notna().any(axis=1).sum())
+            if err is not None:
+                tel["error"] = err
+
+
+def _fetch_unit(tickers, fields, start_date, end_date, timeout=None, opts=None):
+    """
+    조회 단위 1개: 타임아웃 + 재시도(지수 백오프) → (DataFrame 또는 None, 마지막 에러)
+    - 타임아웃은 재시도하지 않음 (같은 묶음은 또 멈출 가능성이 큼 → run_fetch_units 가 티커별로 분리)
+    """
+    # xbbg 는 세션 1개를 공유하므로 live/record 는 한 번에 1건만 (replay 는 병렬 가능)
+    # 잠금은 BDH 호출 스레드가 실제로 끝날 때 풀림 → 타임아웃으로 버려진 호출이 아직 세션을
+    # 쓰고 있으면 다음 호출은 그 호출이 돌아올 때까지 대기 (세션 동시 사용 방지)
+    lock = _FETCH_LOCK if getattr(DATA_SOURCE, "name", "live") != "replay" else None
+    err, spent, attempt = None, 0.0, 0
+    for attempt in range(1, FETCH_RETRIES + 1):
+        t0 = None
+        try:
+            call = lambda: _bdh_raw(tickers, fields, start_date, end_date, opts)
+            if lock is not None:
+                lock.acquire()
+            t0 = time.perf_counter()
+            df = _call_with_timeout(call, timeout or FETCH_TIMEOUT_SEC,
+                                    on_done=lock.release if lock is not None else None)
+            spent += time.perf_counter() - t0
+            _record_telemetry(tickers, fields, start_date, attempt, spent * 1000.0, df, None)
+            return df, None
+        except Exception as e:
+            if t0 is not None:
+                spent += time.perf_counter() - t0
+            err = f"{type(e).__name__}: {e}"
+            if isinstance(e, TimeoutError):
+                break
+            if attempt < FETCH_RETRIES:
+                wait = FETCH_BACKOFF_SEC * (2 ** (attempt - 1))
+                print(f"  ↻ 재시도 {attempt}/{FETCH_RETRIES - 1} ({wait:.1f}s 후) {tickers[0]} 외 {len(tickers) - 1}개 → {err}")
+                time.sleep(wait)
+    _record_telemetry(tickers, fields, start_date, attempt, spent * 1000.0, None, err)
+    return None, err
+
+
+def run_fetch_units(units, end_date, opts=None):
+    """
+    [(티커들, 필드들, 시작일), ...] 을 스레드 풀로 실행 → (DataFrame 리스트, {실패 티커: 에러})
+    1) 모든 단위를 먼저 조회
+    2) 실패한 여러 티커 단위는 정상 단위가 모두 끝난 뒤 티커 1개씩 FETCH_ISOLATE_TIMEOUT_SEC 로 재조회
+       → 정상 단위가 고장 난 티커의 개별 조회를 기다리지 않음
+    """
+    fetched, failed = [], {}
+    if not units:
+        return fetched, failed
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(units))) as pool:
+        isolate = []
+        futures = [((ts, flds, st), pool.submit(_fetch_unit, ts, flds, st, end_date, None, opts))
+                   for ts, flds, st in units]
+        for (ts, flds, st), fut in futures:
+            df, err = fut.result()
+            if df is not None:
+                fetched.append(df)
+            elif len(ts) == 1:
+                failed[ts[0]] = err
+            else:
+                print(f"  ⚠️ 단위 조회 실패 → 티커 {len(ts)}개 개별 조회 예정: {err}")
+                isolate.extend(([t], flds, st) for t in ts)
+
+        futures = [((ts, flds, st), pool.submit(_fetch_unit, ts, flds, st, end_date, FETCH_ISOLATE_TIMEOUT_SEC, opts))
+                   for ts, flds, st in isolate]
+        for (ts, _, _), fut in futures:
+            df, err = fut.result()
+            if df is None:
+                failed[ts[0]] = err
+            else:
+                fetched.append(df)
+    return fetched, failed
+
+
+def update_quarantine(quarantine, fields_by_ticker, failed, skipped, today_s):
+    """
+    실패 횟수/격리 상태 갱신 후 저장 + FETCH_ISSUES 에 기록
+    - 성공: 기록 삭제 / 실패: 연속 실패(일 단위) +1, QUARANTINE_AFTER 회 이상이면 QUARANTINE_DAYS 동안 격리
+    """
+    until = (pd.Timestamp(today_s) + timedelta(days=QUARANTINE_DAYS)).strftime("%Y-%m-%d")
+    for t in fields_by_ticker:
+        if t in skipped:
+            q = quarantine[t]
+            FETCH_ISSUES.append({"ticker": t, "status": "quarantined", "fails": q["fails"],
+                                 "until": q["until"], "error": q.get("error", "")})
+        elif t in failed:
+            q = quarantine.setdefault(t, {"fails": 0, "since": today_s})
+            if q.get("last_fail") != today_s:   # 같은 날 재조회/재실행은 1회로 계산
+                q["fails"] += 1
+            q["error"] = failed[t]
+            q["last_fail"] = today_s
+            q["until"] = until if q["fails"] >= QUARANTINE_AFTER else ""
+            FETCH_ISSUES.append({"ticker": t, "status": "quarantined" if q["until"] else "failed",
+                                 "fails": q["fails"], "until": q["until"], "error": failed[t]})
+        else:
+            quarantine.pop(t, None)
+    _save_json(QUARANTINE_PATH, quarantine)
+
+    if failed or skipped:
+        print(f"⚠️ 조회 실패 {len(failed)}개 / 격리 중(조회 생략) {len(skipped)}개: "
+              f"{', '.join(sorted(set(failed) | skipped))}")
+
+
+def fetch_raw_incremental(fields_by_ticker, start_date, end_date, full_refresh=FULL_REFRESH, opts=None):
+    """
+    (ticker, field) 캐시를 이용한 증분 BDH 조회
+    - fields_by_ticker: {블룸버그 티커: [요청 필드, ...]} (티커마다 필드 구성이 달라도 됨)
+    - 요청 필드가 모두 캐시(커버 구간 기록)에 있는 티커: (마지막 조회일 - CACHE_OVERLAP_DAYS) 이후만 조회
+    - 캐시가 없거나 부족한 티커 / full_refresh=True: start_date 부터 전체 조회
+    - 새로 받은 값이 기존 값을 덮어쓰고(수정치 반영), 병합 결과를 다시 캐시에 저장
+    - opts: BDH 옵션 (기본 BDH_OPTS), 옵션이 다르면 캐시/커버 구간도 따로 보관
+    반환: 기존 blp.bdh 결과와 같은 모양의 DataFrame(index=Date, columns=(ticker, field))
+    """
+    start_ts, end_ts = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    overlap = timedelta(days=CACHE_OVERLAP_DAYS)
+    tag = _opts_tag(opts)
+    # 커버 구간 기록: {ticker(+옵션 접미사): {field: [조회 시작일, 마지막 조회일]}}
+    coverage = _load_json(HIST_COVERAGE_PATH, {})
+
+    cached, req_start, incremental = {}, {}, set()
+    for t, fields in fields_by_ticker.items():
+        c = None if full_refresh else load_hist_cache(t, tag)
+        if c is not None:
+            cached[t] = c  # 이번에 요청하지 않는 필드의 과거치도 보존
+        cov = coverage.get(t + tag, {})
+        # 시작일 주변(주말/휴일 여유 10일)부터 커버하고, 요청 필드가 모두 있어야 증분 대상
+        if c is not None and all(
+            f in cov and f in c.columns and pd.Timestamp(cov[f][0]) <= start_ts + timedelta(days=10)
+            for f in fields
+        ):
+            through = min(pd.Timestamp(cov[f][1]) for f in fields)
+            req_start[t] = max(through - overlap, start_ts)
+            incremental.add(t)
+        else:
+            req_start[t] = start_ts
+
+    # 격리 중인 티커는 조회하지 않고 캐시 값만 사용
+    today_s = end_ts.strftime("%Y-%m-%d")
+    quarantine = _load_json(QUARANTINE_PATH, {})
+    skipped = {t for t in fields_by_ticker if quarantine.get(t, {}).get("until", "") >= today_s}
+
+    # 필드 구성이 같은 티커끼리, 증분 시작일이 비슷한 티커끼리 묶어서 조회
+    # (오래 멈춘 티커 하나 때문에 전체 구간이 늘어나지 않도록)
+    by_fields = {}
+    for t in sorted(fields_by_ticker, key=lambda x: req_start[x]):
+        if t not in skipped:
+            by_fields.setdefault(tuple(fields_by_ticker[t]), []).append(t)
+    units = []  # [(티커들, 필드들, 시작일), ...]
+    for flds, ts in by_fields.items():
+        groups = []  # [[시작일, [티커...]], ...]
+        for t in ts:
+            if groups and req_start[t] - groups[-1][0] <= overlap:
+                groups[-1][1].append(t)
+            else:
+                groups.append([req_start[t], [t]])
+        for st, group in groups:
+            if st <= end_ts:
+                for i in range(0, len(group), FETCH_UNIT_SIZE):
+                    units.append((group[i:i + FETCH_UNIT_SIZE], list(flds), st.strftime("%Y-%m-%d")))
+    fetched, failed = run_fetch_units(units, end_date, opts)
+
+    if full_refresh:
+        print(f"▶ 히스토리 캐시: FULL_REFRESH → 전체 조회 {len(fields_by_ticker)}개 (BDH 단위 {len(units)}개)")
+    else:
+        print(f"▶ 히스토리 캐시: 증분 {len(incremental)}개, "
+              f"전체 조회 {len(fields_by_ticker) - len(incremental)}개 (BDH 단위 {len(units)}개)")
+
+    frames = {}
+    for t, fields in fields_by_ticker.items():
+        parts = [f[t] for f in fetched if t in f.columns.get_level_values(0)]
+        new = pd.concat(parts).groupby(level=0).last() if parts else None
+        old = cached.get(t)
+        if new is None:
+            merged = old if old is not None else pd.DataFrame(index=pd.DatetimeIndex([]), dtype=float)
+        elif old is None:
+            merged = new
+        else:
+            merged = new.combine_first(old)   # 새 값 우선, 빈 칸만 캐시로 보완
+        cols = list(dict.fromkeys(list(old.columns if old is not None else []) + list(fields)))
+        merged = merged.reindex(columns=cols).astype(float).sort_index()
+        frames[t] = merged.loc[(merged.index >= start_ts) & (merged.index <= end_ts), list(fields)]
+        if t in skipped or t in failed:
+            continue   # 커버 구간을 갱신하지 않음 → 다음 실행에서 다시 전체 조회
+        if frames[t].dropna(how="all").empty:
+            failed[t] = "데이터 없음"   # 조회는 성공 → 커버 구간은 기록(증분), 실패 횟수만 누적
+        save_hist_cache(t, merged, tag)
+
+        cov = coverage.setdefault(t + tag, {})
+        for f in fields:
+            since = cov[f][0] if t in incremental else start_ts.strftime("%Y-%m-%d")
+            cov[f] = [since, end_ts.strftime("%Y-%m-%d")]
+    _save_json(HIST_COVERAGE_PATH, coverage)
+    update_quarantine(quarantine, fields_by_ticker, failed, skipped, today_s)
+
+    raw = pd.concat(frames, axis=1).sort_index()
+    # 원래 BDH 결과처럼 모든 필드가 비어 있는 날짜는 제외
+    return raw.dropna(how="all")
+
+
+class SharedFetchPlan:
+    """
+    여러 단계(consumer)의 BDH 요청을 하나로 합친 조회 계획
+    - add(): 단계별 {티커: [필드]} + 기간 + BDH 옵션 등록
+    - 첫 run() 때 BDH 옵션이 같은 단계끼리 합쳐(티커별 필드 합집합, 가장 넓은 기간) 옵션별 1회 조회
+    - 각 단계는 자기 옵션의 공유 프레임에서 자기 티커/필드/기간만 잘라 받음
+      → 옵션이 같은 단계끼리는 같은 티커를 두 번 조회하지 않음
+      (옵션이 다르면 따로 조회: 예) Fill="P" 임계치 단계 vs Fill 없는 IND 단계)
+    """
+
+    def __init__(self):
+        self.consumers = {}
+        self.raw = None        # {옵션 키: 공유 프레임}
+        self.executed = set()
+
+    @staticmethod
+    def _opts_key(opts):
+        return tuple(sorted((BDH_OPTS if opts is None else opts).items()))
+
+    def add(self, name, fields_by_ticker, start_date, end_date, opts=None):
+        self.consumers[name] = (
+            {t: list(f) for t, f in fields_by_ticker.items()},
+            pd.Timestamp(start_date), pd.Timestamp(end_date),
+            dict(BDH_OPTS if opts is None else opts),
+        )
+
+    def groups(self):
+        """옵션 키 → 그 옵션을 쓰는 단계 이름 목록"""
+        out = {}
+        for name, (_, _, _, opts) in self.consumers.items():
+            out.setdefault(self._opts_key(opts), []).append(name)
+        return out
+
+    def merged(self, names=None):
+        fields, starts, ends = {}, [], []
+        for name, (fbt, st, en, _) in self.consumers.items():
+            if names is not None and name not in names:
+                continue
+            for t, flds in fbt.items():
+                fields.setdefault(t, set()).update(flds)
+            starts.append(st)
+            ends.append(en)
+        return {t: sorted(f) for t, f in fields.items()}, min(starts), max(ends)
+
+    def execute(self, full_refresh=FULL_REFRESH):
+        self.raw = {}
+        for key, names in self.groups().items():
+            fields, st, en = self.merged(names)
+            shared = sum(1 for t in fields if sum(t in self.consumers[n][0] for n in names) > 1)
+            print(f"▶ 공통 조회 계획 [{', '.join(names)} | {', '.join(f'{k}={v}' for k, v in key)}]: "
+                  f"티커 {len(fields)}개 (단계 간 중복 {shared}개는 1회만 조회), {st:%Y-%m-%d}~{en:%Y-%m-%d}")
+            self.raw[key] = fetch_raw_incremental(fields, st.strftime("%Y-%m-%d"), en.strftime("%Y-%m-%d"),
+                                                  full_refresh, opts=dict(key))
+        self.executed = set(self.consumers)
+        return self.raw
+
+    def slice(self, name):
+        fbt, st, en, opts = self.consumers[name]
+        raw = self.raw[self._opts_key(opts)]
+        cols = [c for c in raw.columns if c[0] in fbt and c[1] in fbt[c[0]]]
+        out = raw.loc[(raw.index >= st) & (raw.index <= en), cols]
+        return out.dropna(how="all")
+
+    def run(self, name, fields_by_ticker, start_date, end_date, full_refresh=FULL_REFRESH, opts=None):
+        """단계 등록 후 (아직 조회 전이면 전체 계획을 1회 실행) 해당 단계 몫 반환"""
+        self.add(name, fields_by_ticker, start_date, end_date, opts)
+        # 격리/실패 티커는 공유 프레임에 없을 수 있으므로 '단계 포함 여부'로 재조회 판단
+        if self.raw is None or name not in self.executed:
+            self.execute(full_refresh)
+        return self.slice(name)
+
+
+def load_ind_request(path=IND_INPUT_PATH):
+    """indicator.xlsx → IND 다운로드 단계의 요청 {블룸버그 티커: ["PX_LAST"]}"""
+    df_ind = pd.read_excel(path, dtype=str)
+    tickers = [str(t).strip() for t in df_ind["Bloomberg_Ticker"] if pd.notna(t)]
+    return {t: ["PX_LAST"] for t in dict.fromkeys(tickers) if t}
+
+
+def _ffill_bfill(values):
+    """(T, N) 행렬을 컬럼별로 ffill → bfill (모든 컬럼을 한 번에 처리)"""
+    if values.size == 0:
+        return values
+    rows = np.arange(values.shape[0])[:, None]
+    cols = np.arange(values.shape[1])
+    idx = np.where(np.isnan(values), 0, rows)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    values = values[idx, cols]
+    # bfill = 뒤집어서 ffill (앞부분 결측만 남아 있음)
+    rev = values[::-1]
+    idx = np.where(np.isnan(rev), 0, rows)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return np.ascontiguousarray(rev[idx, cols][::-1])
+
+
+class BusinessCalendar:
+    """
+    시장별 영업일 달력 (패널 공통 영업일 인덱스의 행 번호 기준, 한 번만 계산)
+    - bday_rows[m] : 시장 m 영업일의 행 번호 배열
+    - rank[m]      : 행 t 시점까지 지난 시장 m 영업일 수 - 1 (첫 영업일 전이면 -1)
+    - lag_rows(m, n): 모든 행 t 에 대해 (t 시점 마지막 영업일 행, 그 n영업일 전 행) → (m, n)별 캐시
+      → 특정 시점의 't-N 영업일' 조회는 배열 인덱싱 2번 (O(1))
+    """
+
+    def __init__(self, is_bday):
+        self.is_bday = {m: np.asarray(mask, dtype=bool) for m, mask in is_bday.items()}
+        self.bday_rows = {m: np.flatnonzero(mask) for m, mask in self.is_bday.items()}
+        self.rank = {m: np.cumsum(mask) - 1 for m, mask in self.is_bday.items()}
+        self._lags = {}
+
+    @classmethod
+    def from_observed(cls, observed, keys, markets):
+        """observed: (T, N) 실제 관측 여부, 시장 영업일 = 소속 키 중 하나라도 관측된 날"""
+        n_rows = observed.shape[0]
+        is_bday = {"GLOBAL": np.ones(n_rows, dtype=bool)}
+        for j, key in enumerate(keys):
+            m = markets.get(key, "GLOBAL")
+            if m != "GLOBAL":
+                is_bday[m] = is_bday.get(m, np.zeros(n_rows, dtype=bool)) | observed[:, j]
+        return cls(is_bday)
+
+    def extended(self, n_new):
+        """뒤에 n_new 행(장중 당일 등)을 모든 시장 영업일로 추가한 새 달력"""
+        return BusinessCalendar({m: np.concatenate([mask, np.ones(n_new, dtype=bool)])
+                                 for m, mask in self.is_bday.items()})
+
+    def lag_rows(self, market, n):
+        key = (market, n)
+        if key not in self._lags:
+            rows, rank = self.bday_rows[market], self.rank[market]
+            anchor = np.where(rank >= 0, rows[np.maximum(rank, 0)] if len(rows) else -1, -1)
+            prev = np.where(rank - n >= 0, rows[np.maximum(rank - n, 0)] if len(rows) else -1, -1)
+            self._lags[key] = (anchor, prev)
+        return self._lags[key]
+
+
+class MonthlyAggregates:
+    """
+    달력월 집계표: 키별 월 합계/개수/평균 + 월 내 누적합 (패널당 1번 생성, 모든 월평균 조회가 공유)
+    - month_ids (M,) : year*12+month,  sums (M, N), counts (M,)
+    - row_month (T,) : 행 → 월 순번,   csum (T, N): 월 안에서의 누적합
+    - mean(col, m, row): row 시점의 MTD(m=0) / m개월 전 월평균 → O(1)
+    - update_last(col, old, new): 마지막 행 값이 바뀌면 합계/누적합만 보정 (장중 실시간 모드)
+    """
+
+    def __init__(self, index, values):
+        mid = np.asarray(index.year * 12 + index.month)
+        new_month = np.r_[True, mid[1:] != mid[:-1]] if len(mid) else np.zeros(0, dtype=bool)
+        self.starts = np.flatnonzero(new_month)
+        self.month_ids = mid[self.starts]
+        self.row_month = np.cumsum(new_month) - 1
+        self.counts = np.diff(np.r_[self.starts, len(mid)])
+        self.csum = np.empty_like(values, dtype=float)
+        for s, e in zip(self.starts, np.r_[self.starts[1:], len(mid)]):
+            np.cumsum(values[s:e], axis=0, out=self.csum[s:e])
+        self.sums = self.csum[np.r_[self.starts[1:], len(mid)] - 1] if len(mid) else np.zeros((0, values.shape[1]))
+
+    def _month_pos(self, row, months):
+        """row 시점 기준 m개월 전 달의 순번 (패널에 없으면 -1)"""
+        pos = self.row_month[row] - months
+        target = self.month_ids[self.row_month[row]] - months
+        return np.where((pos >= 0) & (self.month_ids[np.maximum(pos, 0)] == target), pos, -1)
+
+    def mean(self, col, months=0, row=-1):
+        if not len(self.row_month):
+            return np.nan
+        row = row % len(self.row_month)
+        if months == 0:
+            return self.csum[row, col] / (row - self.starts[self.row_month[row]] + 1)
+        pos = int(self._month_pos(row, months))
+        return self.sums[pos, col] / self.counts[pos] if pos >= 0 else np.nan
+
+    def avg_matrix(self, months):
+        """(T, N): 모든 시점 x 모든 키의 MTD(m=0) / m개월 전 월평균"""
+        rows = np.arange(len(self.row_month))
+        if months == 0:
+            return self.csum / (rows - self.starts[self.row_month] + 1)[:, None]
+        pos = self._month_pos(rows, months)
+        out = np.full(self.csum.shape, np.nan)
+        ok = pos >= 0
+        out[ok] = self.sums[pos[ok]] / self.counts[pos[ok]][:, None]
+        return out
+
+    def update_last(self, col, old, new):
+        delta = new - old
+        self.csum[-1, col] += delta
+        self.sums[-1, col] += delta
+
+
+class Panel:
+    """
+    정렬된 시계열 패널: 공통 영업일 인덱스 x 키 의 float 행렬 1개 + 키→컬럼 번호 맵
+    - values : np.ndarray (T, N), 기본 float64 (PANEL_DTYPE=np.float32 로 메모리 절반)
+    - index  : 공통 영업일 DatetimeIndex
+    - columns: {키: 컬럼 번호}
+    - col()/series() 는 행렬의 view 를 그대로 돌려줌 (복사 없음)
+    """
+
+    def __init__(self, values, index, keys, observed=None, last_obs=None, calendar=None, markets=None):
+        self.values = values
+        self.index = index
+        self.keys = list(keys)
+        self.columns = {k: j for j, k in enumerate(self.keys)}
+        # 품질 지표: 컬럼별 실제 관측치 수 / 마지막 관측 행 번호(-1 = 없음), 나머지는 ffill/bfill 로 채운 값
+        self.observed = observed
+        self.last_obs = last_obs
+        # 시장별 영업일 달력 + 키별 시장 (없으면 모든 행을 영업일로 간주)
+        self.calendar = calendar or BusinessCalendar({"GLOBAL": np.ones(len(index), dtype=bool)})
+        self.markets = {k: (markets or {}).get(k, "GLOBAL") for k in self.keys}
+        self._monthly = None
+
+    @property
+    def monthly(self):
+        """달력월 집계표 (처음 쓸 때 1번 생성)"""
+        if self._monthly is None:
+            self._monthly = MonthlyAggregates(self.index, self.values)
+        return self._monthly
+
+    def set_last(self, key, value):
+        """마지막 행 값 제자리 갱신 (월 집계표가 있으면 O(1) 보정)"""
+        j = self.columns[key]
+        old = self.values[-1, j]
+        self.values[-1, j] = value
+        if self._monthly is not None:
+            self._monthly.update_last(j, old, value)
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def col(self, key):
+        return self.values[:, self.columns[key]]
+
+    def series(self, key):
+        return pd.Series(self.col(key), index=self.index, name=key, copy=False)
+
+    def to_frame(self):
+        return pd.DataFrame(self.values, index=self.index, columns=self.keys, copy=False)
+
+    def extend_to(self, date):
+        """마지막 영업일 이후 ~ date 영업일 행을 직전 값으로 추가 (장중 갱신용, 추가 시 행렬 재할당 → True)"""
+        date = pd.Timestamp(date).normalize()
+        if not len(self.index) or self.index[-1] >= date:
+            return False
+        new_index = pd.bdate_range(self.index[-1], date)[1:]
+        if not len(new_index):
+            return False
+        self.values = np.vstack([self.values, np.repeat(self.values[-1:], len(new_index), axis=0)])
+        self.index = self.index.append(new_index)
+        self.calendar = self.calendar.extended(len(new_index))
+        self._monthly = None
+        return True
+
+    def lag_pair(self, key, n, row=-1):
+        """(row 시점 값, 키 소속 시장 기준 n영업일 전 값) - 달력 캐시 조회라 O(1)"""
+        anchor, prev = self.calendar.lag_rows(self.markets[key], n)
+        row = row % len(self.index)
+        a, p = anchor[row], prev[row]
+        j = self.columns[key]
+        return (self.values[a, j] if a >= 0 else np.nan), (self.values[p, j] if p >= 0 else np.nan)
+
+    def lagged(self, n):
+        """(T, N) 행렬 2개: 모든 시점 x 모든 키의 (기준 값, 시장별 n영업일 전 값) - 변화량 벡터 계산용"""
+        cur = np.full(self.values.shape, np.nan, dtype=self.values.dtype)
+        prev = np.full(self.values.shape, np.nan, dtype=self.values.dtype)
+        by_market = {}
+        for k, m in self.markets.items():
+            by_market.setdefault(m, []).append(self.columns[k])
+        for m, cols in by_market.items():
+            a_rows, p_rows = self.calendar.lag_rows(m, n)
+            cols = np.asarray(cols)
+            ok_a, ok_p = a_rows >= 0, p_rows >= 0
+            cur[np.ix_(ok_a, cols)] = self.values[np.ix_(a_rows[ok_a], cols)]
+            prev[np.ix_(ok_p, cols)] = self.values[np.ix_(p_rows[ok_p], cols)]
+        return cur, prev
+
+    @classmethod
+    def from_raw(cls, raw, key_prefs, dtype=np.float64, markets=None):
+        """
+        BDH 원시 프레임(columns=(ticker, field)) → Panel
+        - key_prefs: [(키, 블룸버그 티커, [우선순위 필드...]), ...]
+        - 키마다 데이터가 있는 첫 필드를 채택하고, 채택 컬럼 전체를 한 번에 ffill/bfill
+        - markets: {키: 시장} → 채우기 전 관측 여부로 시장별 영업일 달력 구성
+        반환: (Panel, {키: 채택 필드 또는 None})
+        """
+        if len(raw.index):
+            index = pd.bdate_range(raw.index.min().normalize(), raw.index.max().normalize())
+        else:
+            index = pd.DatetimeIndex([])
+        raw = raw.reindex(index)
+        mat = raw.to_numpy(dtype=dtype, na_value=np.nan)
+        has_data = ~np.isnan(mat).all(axis=0) if len(index) else np.zeros(mat.shape[1], dtype=bool)
+        pos = {c: j for j, c in enumerate(raw.columns)}
+
+        src, chosen = [], {}
+        for key, bb_ticker, prefs in key_prefs:
+            j = next((pos[(bb_ticker, f)] for f in prefs
+                      if (bb_ticker, f) in pos and has_data[pos[(bb_ticker, f)]]), -1)
+            src.append(j)
+            chosen[key] = raw.columns[j][1] if j >= 0 else None
+            # 키별 사용 필드는 실행 리포트(RUN_REPORT_PATH)의 "field" 항목으로 기록
+
+        src = np.asarray(src, dtype=int)
+        values = np.full((len(index), len(src)), np.nan, dtype=dtype)
+        ok = src >= 0
+        values[:, ok] = mat[:, src[ok]]
+        obs = ~np.isnan(values)
+        observed = obs.sum(axis=0)
+        last_obs = np.where(observed > 0, len(index) - 1 - obs[::-1].argmax(axis=0), -1) if len(index) else observed - 1
+        keys = [k for k, _, _ in key_prefs]
+        calendar = BusinessCalendar.from_observed(obs, keys, markets or {})
+        return cls(_ffill_bfill(values), index, keys, observed, last_obs, calendar, markets), chosen
+
+
+def fetch_hist_with_field_prefs(ticker_map, cds_map, field_prefs, start_date, end_date,
+                                full_refresh=FULL_REFRESH, plan=None):
+    """
+    멀티 필드로 BDH 조회 후, 가용성이 가장 좋은 필드를 채택하여 단일 시계열로 병합
+    - 원시 BDH 값은 (ticker, field) 캐시를 통해 증분 조회 (full_refresh=True면 전체 재조회)
+    - 지난 실행에서 채택된 필드(FIELD_WINNERS_PATH)가 있는 키는 그 필드만 요청하고,
+      그 필드가 비었거나 FIELD_STALE_DAYS 이상 멈춘 경우에만 전체 후보 필드로 재조회
+    - plan(SharedFetchPlan)을 넘기면 다른 단계 요청과 합쳐 1회 조회한 공유 프레임에서 잘라 사용
+    반환: Panel (공통 영업일 x keys 행렬, .to_frame() 으로 DataFrame 변환)
+    """
+    all_pairs = list(ticker_map.items()) + list(cds_map.items())
+    # ★ 요청 필드 = 우선순위 필드 합집합 + Fallback (누락 방지)
+    prefs_fields = {fld for prefs in field_prefs.values() for fld in prefs}
+    all_fields = sorted(prefs_fields | FALLBACK_FIELDS)  # ★ 수정
 
     # 공통 fallback (일반자산): PX_LAST → LAST_PRICE → PX_MID → MID
     default_general = ["PX_LAST", "LAST_PRICE", "PX_MID", "MID"]
     # 공통 fallback (CDS): LAST_PRICE → MID → PX_LAST
     default_cds = ["LAST_PRICE", "MID", "PX_LAST"]
 
-    # 일반 틱커
-    for key, bb_ticker in ticker_map.items():
-        prefs = field_prefs.get(key, default_general)  # ★ 수정: 일반도 보강
-        ser = None
-        for fld in prefs:
-            if (bb_ticker, fld) in raw.columns:
-                tmp = pd.to_numeric(raw[(bb_ticker, fld)], errors="coerce").ffill().bfill()
-                if tmp.notna().sum() > 0:
-                    ser = tmp
-                    # print(f"[{key}] 사용 필드: {fld}")  # 디버그용
-                    break
-        out[key] = ser if ser is not None else pd.Series(index=raw.index, dtype=float)
-
-    # CDS(국가명 키)
-    for name, bb_ticker in cds_map.items():
-        prefs = field_prefs.get(name, default_cds)     # ★ 수정: CDS 기본값 고정
-        ser = None
-        for fld in prefs:
-            if (bb_ticker, fld) in raw.columns:
-                tmp = pd.to_numeric(raw[(bb_ticker, fld)], errors="coerce").ffill().bfill()
-                if tmp.notna().sum() > 0:
-                    ser = tmp
-                    # print(f"[CDS:{name}] 사용 필드: {fld}")  # 디버그용
-                    break
-        out[name] = ser if ser is not None else pd.Series(index=raw.index, dtype=float)
+    learn = LEARN_FIELD_WINNERS and not full_refresh
+    prev_winners = _load_json(FIELD_WINNERS_PATH, {})
+    winners = dict(prev_winners) if learn else {}
+
+    def request_map(pairs, use_winners):
+        req = {}
+        for key, bb in pairs:
+            flds = [winners[key]] if (use_winners and key in winners) else all_fields
+            req.setdefault(bb, set()).update(flds)
+        return {bb: sorted(flds) for bb, flds in req.items()}
+
+    key_prefs = (
+        # 일반 틱커
+        [(key, bb, field_prefs.get(key, default_general)) for key, bb in ticker_map.items()]  # ★ 수정: 일반도 보강
+        # CDS(국가명 키)
+        + [(name, bb, field_prefs.get(name, default_cds)) for name, bb in cds_map.items()]  # ★ 수정: CDS 기본값 고정
+    )
+
+    def select(raw):
+        return Panel.from_raw(raw, key_prefs, dtype=PANEL_DTYPE, markets=KEY_MARKETS)
+
+    if plan is None:
+        raw = fetch_raw_incremental(request_map(all_pairs, learn), start_date, end_date, full_refresh)
+    else:
+        raw = plan.run("threshold", request_map(all_pairs, learn), start_date, end_date, full_refresh)
+    panel, chosen = select(raw)
+
+    # ★ 학습 필드가 비었거나(빈 응답) 최근 FIELD_STALE_DAYS 동안 값이 없으면 전체 후보로 재조회
+    if winners:
+        stale_cut = raw.index.max() - timedelta(days=FIELD_STALE_DAYS) if len(raw.index) else None
+        retry = []
+        for key, bb in all_pairs:
+            if key not in winners:
+                continue
+            fld = chosen.get(key)
+            last = raw[(bb, fld)].last_valid_index() if fld is not None else None
+            if last is None or (stale_cut is not None and last < stale_cut):
+                retry.append((key, bb))
+        if retry:
+            print(f"▶ 학습 필드 재확인(전체 후보 재조회): {', '.join(k for k, _ in retry)}")
+            retry_bbs = list(dict.fromkeys(bb for _, bb in retry))
+            raw2 = fetch_raw_incremental(request_map(retry, False), start_date, end_date, full_refresh)
+            raw = pd.concat([raw.drop(columns=retry_bbs, level=0, errors="ignore"), raw2], axis=1)
+            raw = raw.sort_index().dropna(how="all")
+            panel, chosen = select(raw)
+        print(f"▶ 필드 캐시: 학습 필드 사용 {len(all_pairs) - len(retry)}개 / 재조회 {len(retry)}개")
+
+    if LEARN_FIELD_WINNERS:
+        for key, fld in chosen.items():
+            if fld is not None:
+                winners[key] = fld
+            else:
+                winners.pop(key, None)
+        _save_json(FIELD_WINNERS_PATH, winners)
+
+    # 실행 리포트용: 키별 채택 필드 / 지난 실행 대비 필드 변경
+    panel.chosen = chosen
+    panel.key_prefs = key_prefs
+    panel.tickers = {key: bb for key, bb in all_pairs}
+    panel.prev_fields = {key: prev_winners.get(key) for key, _ in all_pairs}
+    switched = [f"{k}({panel.prev_fields[k]}→{f})" for k, f in chosen.items()
+                if panel.prev_fields[k] and f and f != panel.prev_fields[k]]
+    if switched:
+        print(f"⚠️ 채택 필드 변경: {', '.join(switched)}")
+    return panel
+
+def write_run_report(path, panel, elapsed_sec):
+    """
+    실행 리포트(JSON) 저장: 실행 요약 + 키별 품질 지표 + 티커별 조회 계측
+    - keys[].synth_pct : 공통 영업일 중 ffill/bfill 로 채운 비율(%) (100 = 데이터 없음)
+    - keys[].field_changed : 지난 실행 채택 필드와 달라졌는지 (예: YLD_YTM_MID → PX_LAST)
+    - tickers[*].latency_ms : 조회 단위 지연시간 합 (같은 단위의 티커는 같은 값)
+    """
+    issues = {i["ticker"]: i["status"] for i in FETCH_ISSUES}
+    n = len(panel.index)
+    keys = []
+    for key in panel.keys:
+        j = panel.columns[key]
+        bb = panel.tickers.get(key)
+        obs, last = int(panel.observed[j]), int(panel.last_obs[j])
+        tel = FETCH_TELEMETRY.get(bb, {})
+        keys.append({
+            "key": key,
+            "ticker": bb,
+            "field": panel.chosen.get(key),
+            "prev_field": panel.prev_fields.get(key),
+            "field_changed": bool(panel.prev_fields.get(key) and panel.chosen.get(key)
+                                  and panel.chosen[key] != panel.prev_fields[key]),
+            "points": n,
+            "observed": obs,
+            "synth_pct": round(100.0 * (n - obs) / n, 2) if n else None,
+            "last_obs": panel.index[last].strftime("%Y-%m-%d") if last >= 0 else None,
+            "latency_ms": tel.get("latency_ms"),
+            "rows_returned": tel.get("rows"),
+            "status": issues.get(bb, "ok" if obs else "no_data"),
+        })
+    report = {
+        "run_date": pd.Timestamp(TODAY).strftime("%Y-%m-%d"),
+        "generated_at": pd.Timestamp.now(tz="Asia/Seoul").isoformat(timespec="seconds"),
+        "data_source": getattr(DATA_SOURCE, "name", "live"),
+        "elapsed_sec": round(elapsed_sec, 3),
+        "bdh_units": FETCH_STATS["units"],
+        "bdh_attempts": FETCH_STATS["attempts"],
+        "panel": {"start": panel.index[0].strftime("%Y-%m-%d") if n else None,
+                  "end": panel.index[-1].strftime("%Y-%m-%d") if n else None,
+                  "rows": n, "keys": len(panel.keys)},
+        "keys": keys,
+        "tickers": FETCH_TELEMETRY,
+    }
+    _save_json(path, report)
+    return report
 
-    df = pd.DataFrame(out)
-    df.index = pd.to_datetime(df.index, errors="coerce")
-    return df
 
 def last_value(series):
     s = series.dropna()
     return float(s.iloc[-1]) if len(s) else np.nan
 
-def bp_change(series, days=1):
+# 변화율 계산용 패널 (5) 데이터 수집 후 지정) → 패널 시계열은 시장 영업일 기준으로 조회
+BDAY_PANEL = None
+# 롤링 상태 (6) 에서 지정) → 패널 시계열의 63영업일 평균은 상태 버퍼에서 조회
+ROLLING = None
+
+def _lag_pair(series, days):
+    """
+    (최신값, days 영업일 전 값)
+    - BDAY_PANEL 의 시계열(series_map 값): 키 소속 시장 영업일 달력으로 O(1) 조회
+    - 그 외: 결측 제거 후 위치 기준 (기존 방식)
+    """
+    p = BDAY_PANEL
+    if p is not None and series.name in p and len(series) == len(p.index):
+        return p.lag_pair(series.name, days)
     s = series.dropna()
     if len(s) <= days:
+        return np.nan, np.nan
+    return s.iloc[-1], s.iloc[-1 - days]
+
+def bp_change(series, days=1):
+    cur, prev = _lag_pair(series, days)
+    if np.isnan(cur) or np.isnan(prev):
         return np.nan
-    return float((s.iloc[-1] - s.iloc[-1 - days]) * 100.0)
+    return float((cur - prev) * 100.0)
 
 def pct_change(series, days=1):
-    s = series.dropna()
-    if len(s) <= days:
-        return np.nan
-    prev = s.iloc[-1 - days]
-    if prev == 0 or np.isnan(prev):
+    cur, prev = _lag_pair(series, days)
+    if prev == 0 or np.isnan(prev) or np.isnan(cur):
         return np.nan
-    return float((s.iloc[-1] / prev - 1.0) * 100.0)
+    return float((cur / prev - 1.0) * 100.0)
 
 def pp_change(series, days=1):
-    s = series.dropna()
-    if len(s) <= days:
+    cur, prev = _lag_pair(series, days)
+    if np.isnan(cur) or np.isnan(prev):
         return np.nan
-    return float(s.iloc[-1] - s.iloc[-1 - days])
+    return float(cur - prev)
 
 def trailing_3m_avg(series):
-    """최근 3개월(영업일 약 63개) 평균"""
+    """최근 3개월(영업일 약 63개) 평균 (패널 시계열이고 롤링 상태가 최신이면 상태 합계로 O(1))"""
+    p = BDAY_PANEL
+    if ROLLING is not None and p is not None and series.name in p and len(series) == len(p.index) \
+            and ROLLING.covers(p, [series.name]):
+        return float(ROLLING.keys[series.name].trail_avg(10))
     s = series.dropna()
     if len(s) < 10:
         return np.nan
@@ -284,8 +1432,12 @@ def trailing_3m_avg(series):
 def month_avg(series, months_ago=0):
     """
     달력월 평균 (months_ago=0: 당월, 1: 전월, 3: 3개월전)
-    - 인덱스가 datetime 변환 가능한지 안전하게 체크
+    - BDAY_PANEL 의 시계열(series_map 값): 패널 월 집계표에서 O(1) 조회
+    - 그 외: 인덱스가 datetime 변환 가능한지 안전하게 체크
     """
+    p = BDAY_PANEL
+    if p is not None and series.name in p and len(series) == len(p.index):
+        return float(p.monthly.mean(p.columns[series.name], months_ago))
     s = series.dropna()
     if s.empty:
         return np.nan
@@ -313,403 +1465,1820 @@ def has_data(series, min_points=5):
     """데이터 유효성 체크: 결측 제거 후 최소 개수 확보"""
     return series.dropna().shape[0] >= min_points
 
+# -----------------------------
+# 4-1) 룰 엔진: RULE_SPECS → 컴파일된 룰 (패널 전체 x 전 시점 벡터 계산)
+# -----------------------------
+_COMPARATORS = {
+    ">=": np.greater_equal, ">": np.greater, "<=": np.less_equal, "<": np.less,
+    "abs>=": lambda v, t: np.abs(v) >= t, "abs>": lambda v, t: np.abs(v) > t,
+}
+
+def _compare(cmp, values, thr):
+    """시점별 비교 결과 (1.0/0.0, 값이 없으면 NaN) - thr 가 (K, 1) 벡터면 (K x 시점) 로 broadcast"""
+    with np.errstate(invalid="ignore"):
+        out = _COMPARATORS[cmp](values, thr).astype(float)
+    return np.where(np.isnan(values), np.nan, out)
+
+def _consec(values, n, cmp, thr, offset=None):
+    """
+    시점별 'n 영업일 연속 (values - offset) cmp thr' (1.0/0.0, 기존 consec_last_n 과 동일)
+    - 연속 조건 = 구간 최소값(>, >=) / 최대값(<, <=) 한 번 비교 → 시점마다 n개를 다시 보지 않음
+    - offset: 시점별 기준값 (예: 그 시점의 전월 평균)
+    - thr 가 (K, 1) 벡터면 구간 극값은 1번만 구하고 비교만 (K x 시점) 로 broadcast (민감도 스윕)
+    """
+    out = np.zeros(np.broadcast_shapes(np.shape(values), np.shape(thr)))
+    if n <= 0 or len(values) < n:
+        return out
+    absolute = cmp.startswith("abs")
+    base = cmp[3:] if absolute else cmp
+    win = np.lib.stride_tricks.sliding_window_view(np.abs(values) if absolute else values, n, axis=0)
+    ext = win.min(axis=-1) if base in (">", ">=") else win.max(axis=-1)
+    if offset is not None:
+        ext = ext - offset[n - 1:]
+    tail = [slice(None)] * out.ndim
+    tail[out.ndim - np.ndim(values)] = slice(n - 1, None)   # 시간 축
+    with np.errstate(invalid="ignore"):
+        out[tuple(tail)] = _COMPARATORS[base](ext, thr)
+    return out
+
+def _safe_div(a, b):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(b == 0, np.nan, a / b)
+
+
+class Expr:
+    """
+    파생 시계열 식 노드 - 구조가 같은 식은 key 가 같음 → 컨텍스트당 1번만 계산 (공통 부분식 재사용)
+    - 잎  : col(키) / mavg(키, m) / trail(키) / lag(키, n) → (기준 값, n영업일 전 값) / 상수
+    - 연산: + - * /  (나눗셈은 분모 0 → NaN)
+    - at_month(m): 식 안의 col(키) 를 mavg(키, m) 로 바꾼 식 (예: A / B → mavg(A) / mavg(B))
+    """
+    __slots__ = ("op", "args", "key")
+
+    def __init__(self, op, *args):
+        self.op, self.args = op, args
+        self.key = (op,) + tuple(a.key if isinstance(a, Expr) else a for a in args)
+
+    @staticmethod
+    def col(key):
+        return Expr("col", key)
+
+    @staticmethod
+    def mavg(key, months):
+        return Expr("mavg", key, months)
+
+    @staticmethod
+    def trail(key):
+        return Expr("trail", key)
+
+    @staticmethod
+    def lag(key, n):
+        return Expr("lag_cur", key, n), Expr("lag_prev", key, n)
+
+    def _bin(self, op, other, swap=False):
+        other = other if isinstance(other, Expr) else Expr("const", float(other))
+        return Expr(op, other, self) if swap else Expr(op, self, other)
+
+    def __add__(self, other):
+        return self._bin("+", other)
+
+    def __sub__(self, other):
+        return self._bin("-", other)
+
+    def __rsub__(self, other):
+        return self._bin("-", other, swap=True)
+
+    def __mul__(self, other):
+        return self._bin("*", other)
+
+    def __truediv__(self, other):
+        return self._bin("/", other)
+
+    def at_month(self, months):
+        if self.op == "col":
+            return Expr.mavg(self.args[0], months)
+        if self.op in _EXPR_BINARY:
+            return Expr(self.op, *(a.at_month(months) for a in self.args))
+        return self
+
+    def __repr__(self):
+        if self.op in _EXPR_BINARY:
+            return f"({self.args[0]!r} {self.op} {self.args[1]!r})"
+        args = [f"<{len(a)}개 키>" if isinstance(a, tuple) else str(a) for a in self.args]
+        if self.op == "col":
+            return args[0]
+        if self.op == "const":
+            return f"{self.args[0]:g}"
+        return f"{self.op}({', '.join(args)})"
+
+
+_EXPR_LEAVES = {
+    "col": lambda ctx, k: ctx.col(k),
+    "mavg": lambda ctx, k, m: ctx.month_avg(k, m),
+    "trail": lambda ctx, k: ctx.trail_avg(k),
+    "lag_cur": lambda ctx, k, n: ctx.lag(k, n)[0],
+    "lag_prev": lambda ctx, k, n: ctx.lag(k, n)[1],
+}
+_EXPR_BINARY = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": _safe_div}
+
+
+class ExprContext:
+    """
+    Expr 평가 (RuleContext / RollingContext 공통): 처음 요청될 때 계산 → key 별 결과 보관
+    - expr_log: key → {id, 식, 의존 노드 id, 자기 계산 시간(ms, 하위 노드 제외), 재사용 횟수}
+    - dump_graph(): 평가 그래프 텍스트 (EXPR_DEBUG=True 면 일일 실행 때 출력)
+    """
+
+    def _init_exprs(self):
+        self._exprs = {}
+        self.expr_log = {}
+
+    def _idx(self, key):
+        """키 → 패널 컬럼 번호 (그룹 룰의 키 튜플이면 번호 리스트 → (시점 x 멤버) 행렬)"""
+        if isinstance(key, tuple):
+            return [self.panel.columns[k] for k in key]
+        return self.panel.columns[key]
+
+    def eval(self, expr):
+        if expr.op == "const":
+            return expr.args[0]
+        log = self.expr_log.get(expr.key)
+        if log is not None:
+            log["hits"] += 1
+            return self._exprs[expr.key]
+        if expr.op in _EXPR_BINARY:
+            a, b = (self.eval(x) for x in expr.args)
+            t0 = time.perf_counter()
+            out = _EXPR_BINARY[expr.op](a, b)
+        else:
+            t0 = time.perf_counter()
+            out = _EXPR_LEAVES[expr.op](self, *expr.args)
+        ms = (time.perf_counter() - t0) * 1000.0
+        self._exprs[expr.key] = out
+        self.expr_log[expr.key] = {
+            "id": len(self.expr_log), "expr": repr(expr), "ms": ms, "hits": 0,
+            "deps": [self.expr_log[a.key]["id"] for a in expr.args if isinstance(a, Expr) and a.op != "const"],
+        }
+        return out
+
+    def dump_graph(self):
+        logs = sorted(self.expr_log.values(), key=lambda x: x["id"])
+        total = sum(x["ms"] for x in logs)
+        lines = [f"🔍 룰 식 그래프 ({type(self).__name__}): 노드 {len(logs)}개, "
+                 f"재사용 {sum(x['hits'] for x in logs)}회, 계산 {total:.2f}ms"]
+        for x in logs:
+            deps = ",".join(f"#{d}" for d in x["deps"])
+            lines.append(f"  #{x['id']:<3} {x['ms']:7.3f}ms  재사용 {x['hits']:>2}  {x['expr']}"
+                         + (f"  ← {deps}" if deps else ""))
+        return "\n".join(lines)
+
+
+class RuleContext(ExprContext):
+    """
+    패널 1개에 대한 룰 평가 재료 - (시점 x 키) 행렬을 처음 쓸 때 1번만 계산해서 모든 룰이 공유
+    - lag(n)      : 시장 영업일 기준 (기준 값, n영업일 전 값)
+    - month_avg(m): 시점별 m개월 전 달력월 평균 (m=0: 그 시점까지의 MTD) ← 패널 월 집계표
+    - trail_avg() : 시점별 최근 63영업일 평균 (10개 미만이면 NaN)
+    """
+
+    def __init__(self, panel):
+        self.panel = panel
+        self.n_rows = len(panel.index)
+        self._cache = {}
+        self._init_exprs()
+
+    def _memo(self, key, fn):
+        if key not in self._cache:
+            self._cache[key] = fn()
+        return self._cache[key]
+
+    def col(self, key):
+        return self.panel.values[:, self._idx(key)]
+
+    def has(self, key, min_points=5):
+        """has_data 와 같은 기준 (결측 제외 min_points 개 이상)"""
+        return key in self.panel and self._memo(
+            ("has", key), lambda: np.count_nonzero(~np.isnan(self.col(key))) >= min_points)
+
+    def lag(self, key, n):
+        cur, prev = self._memo(("lag", n), lambda: self.panel.lagged(n))
+        j = self._idx(key)
+        return cur[:, j], prev[:, j]
+
+    def month_avg(self, key, months):
+        return self._memo(("mavg", months), lambda: self._month_avg_matrix(months))[:, self._idx(key)]
+
+    def trail_avg(self, key, window=63, min_points=10):
+        return self._memo(("trail", window, min_points),
+                          lambda: self._trail_avg_matrix(window, min_points))[:, self._idx(key)]
+
+    def consec(self, rule, c, values, offset=None):
+        return _consec(values, c["n_value"], c["cmp"], c["thr_value"], offset)
+
+    def _cumsum0(self):
+        v = self.panel.values
+        return self._memo("cumsum0", lambda: np.vstack([np.zeros((1, v.shape[1])), np.cumsum(v, axis=0)]))
+
+    def _month_avg_matrix(self, months):
+        return self.panel.monthly.avg_matrix(months)
+
+    def _trail_avg_matrix(self, window, min_points):
+        rows = np.arange(self.n_rows)
+        lo = np.maximum(0, rows - window + 1)
+        c0 = self._cumsum0()
+        out = (c0[rows + 1] - c0[lo]) / (rows - lo + 1)[:, None]
+        out[rows + 1 < min_points] = np.nan
+        return out
+
+
+def _t_chg(rule, ctx, unit):
+    key = rule.deps[0]
+    slots = []
+    for c in rule.checks:
+        cur, prev = Expr.lag(key, c["lag"])
+        if unit == "bp":
+            val = ctx.eval((cur - prev) * 100.0)
+        elif unit == "pct":
+            val = ctx.eval((cur / prev - 1.0) * 100.0)
+        else:
+            val = ctx.eval(cur - prev)
+        slots.append((val, _compare(c["cmp"], val, c["thr_value"])))
+    return {"latest": ctx.eval(rule.expr), "slots": slots}
+
+def _t_dev_3m(rule, ctx):
+    key, c = rule.deps[0], rule.checks[0]
+    avg = ctx.eval(Expr.trail(key))
+    val = ctx.eval((rule.expr - Expr.trail(key)) * 100.0)
+    return {"latest": ctx.eval(rule.expr), "avg": avg, "slots": [(val, _compare(c["cmp"], val, c["thr_value"]))]}
+
+def _t_mtd_spread(rule, ctx):
+    (ka, kb), c = rule.deps, rule.checks[0]
+    a, b = ctx.eval(Expr.mavg(ka, 0)), ctx.eval(Expr.mavg(kb, 0))
+    val = ctx.eval(rule.expr.at_month(0) * 100.0)
+    return {"a": a, "b": b, "slots": [(val, _compare(c["cmp"], val, c["thr_value"]))]}
+
+def _t_mtd_vs_prevm(rule, ctx):
+    c, mtd, prevm = rule.checks[0], rule.expr.at_month(0), rule.expr.at_month(1)
+    a, b = ctx.eval(mtd), ctx.eval(prevm)
+    val = ctx.eval((mtd - prevm) * 100.0)
+    return {"latest": ctx.eval(rule.expr), "a": a, "b": b, "slots": [(val, _compare(c["cmp"], val, c["thr_value"]))]}
+
+def _t_mtd_vs_prevm_pct(rule, ctx):
+    # "A / B" 면 at_month 가 월평균 비율끼리의 식을 만듦 (latest 없음)
+    c, mtd, prevm = rule.checks[0], rule.expr.at_month(0), rule.expr.at_month(1)
+    a, b = ctx.eval(mtd), ctx.eval(prevm)
+    val = ctx.eval((mtd / prevm - 1.0) * 100.0)
+    latest = ctx.eval(rule.expr) if rule.op is None else None
+    return {"latest": latest, "a": a, "b": b, "slots": [(val, _compare(c["cmp"], val, c["thr_value"]))]}
+
+def _t_level(rule, ctx):
+    c, spr = rule.checks[0], ctx.eval(rule.expr * 100.0)
+    return {"latest": spr, "slots": [(spr, _compare(c["cmp"], spr, c["thr_value"]))]}
+
+def _t_level_consec(rule, ctx):
+    c, spr = rule.checks[0], ctx.eval(rule.expr * 100.0)
+    return {"latest": spr, "slots": [(spr, ctx.consec(rule, c, spr))]}
+
+def _t_dev_mavg_consec(rule, ctx):
+    key, c = rule.deps[0], rule.checks[0]
+    avg_expr = Expr.mavg(key, c["months"])
+    s, avg = ctx.eval(rule.expr), ctx.eval(avg_expr)
+    hit = ctx.consec(rule, c, s, offset=avg)
+    return {"latest": s, "avg": avg, "skip": np.isnan(avg), "slots": [(ctx.eval(rule.expr - avg_expr), hit)]}
+
+_TRANSFORMS = {
+    "chg_bp": lambda r, ctx: _t_chg(r, ctx, "bp"),
+    "chg_pct": lambda r, ctx: _t_chg(r, ctx, "pct"),
+    "chg_pp": lambda r, ctx: _t_chg(r, ctx, "pp"),
+    "dev_3m": _t_dev_3m,
+    "mtd_spread": _t_mtd_spread,
+    "mtd_vs_prevm": _t_mtd_vs_prevm,
+    "mtd_vs_prevm_pct": _t_mtd_vs_prevm_pct,
+    "level": _t_level,
+    "level_consec": _t_level_consec,
+    "dev_mavg_consec": _t_dev_mavg_consec,
+}
+# chg 열 기본 형식 / latest 열 기본 포함 여부 (spec 의 fmt / latest 로 덮어씀)
+_DEFAULT_FMT = {"chg_bp": "{:.1f}bp", "chg_pct": "{:.2f}%", "chg_pp": "{:.2f}pp"}
+_NO_LATEST = {"mtd_spread", "mtd_vs_prevm", "mtd_vs_prevm_pct"}
+
+
+class CompiledRule:
+    """RULE_SPECS 항목 1개 → 식 파싱 / 임계값·문구 조회는 컴파일 때 1번, 평가는 배열 연산만"""
+
+    def __init__(self, spec, thresholds, bb_tickers):
+        self.name = spec["id"]
+        self.metric = spec["metric"]
+        self.transform = spec["transform"]
+        if self.transform not in _TRANSFORMS:
+            raise ValueError(f"알 수 없는 transform: {self.transform} (룰 {self.name})")
+        # 그룹 룰: members 의 키마다 같은 transform/임계값 → (시점 x 멤버) 행렬로 1번 평가, 멤버별 alerts 행
+        self.members = tuple(spec["group"]) if "group" in spec else None
+        if self.members is not None:
+            self.op, self.deps = None, self.members
+            self.expr = Expr.col(self.members)
+            self.tickers = {k: bb_tickers.get(k, k) for k in self.members}
+        else:
+            expr = spec["expr"]
+            self.op = next((op for op in (" - ", " / ") if op in expr), None)
+            self.deps = tuple(k.strip() for k in expr.split(self.op)) if self.op else (expr.strip(),)
+            # 식 노드: 같은 부분식(예: KR3Y 월평균, KR1Y - KRBASERATE)은 룰이 달라도 한 번만 계산
+            leaves = [Expr.col(k) for k in self.deps]
+            self.expr = {None: lambda: leaves[0], " - ": lambda: leaves[0] - leaves[1],
+                         " / ": lambda: leaves[0] / leaves[1]}[self.op]()
+            default_ticker = {None: "{0}", " - ": "{0} - {1}", " / ": "{0} / {1}"}[self.op]
+            self.ticker = spec.get("ticker", default_ticker).format(*[bb_tickers.get(k, k) for k in self.deps])
+        self._views = {}
+
+        def resolve(v):
+            return thresholds[v] if isinstance(v, str) else v
+
+        self.checks = []
+        for c in spec["checks"]:
+            thr = resolve(c["thr"])
+            self.checks.append(dict(
+                c, thr_value=thr, n_value=resolve(c.get("n", 0)),
+                label=c["label"].format(thr=thr) if c.get("label") is not None else None,
+            ))
+        self.fmt = spec.get("fmt", _DEFAULT_FMT.get(self.transform))
+        self.latest = spec.get("latest", self.transform not in _NO_LATEST)
+        self.note = spec.get("note", "")
+        self.note_na = spec.get("note_na")
+
+    def arrays(self, ctx):
+        """
+        전 시점 배열 {"latest", "a", "b", "avg", "skip", "slots": [(값, 초과 1/0/NaN), ...]} (데이터 없으면 None)
+        - 그룹 룰: 데이터 있는 멤버만 모아 배열이 (시점 x 멤버) 행렬, "members" 에 멤버 순서
+        """
+        if self.members is None:
+            if not all(ctx.has(k) for k in self.deps):
+                return None
+            return _TRANSFORMS[self.transform](self, ctx)
+        members = tuple(k for k in self.members if ctx.has(k))
+        if not members:
+            return None
+        if members not in self._views:
+            view = CompiledRule.__new__(CompiledRule)
+            view.__dict__.update(self.__dict__, deps=members, expr=Expr.col(members))
+            self._views[members] = view
+        return dict(_TRANSFORMS[self.transform](self._views[members], ctx), members=members)
+
+    def split(self, arr):
+        """[(룰 id, metric, ticker, 1차원 배열 또는 None), ...] - 그룹 룰은 멤버별 (id = 룰id_멤버)"""
+        if self.members is None:
+            return [(self.name, self.metric, self.ticker, arr)]
+        pos = {k: g for g, k in enumerate(arr["members"])} if arr is not None else {}
+        out = []
+        for k in self.members:
+            a = None
+            if k in pos:
+                g = pos[k]
+                a = {n: (v[:, g] if isinstance(v, np.ndarray) and v.ndim == 2 else v)
+                     for n, v in arr.items() if n not in ("slots", "members")}
+                a["slots"] = [(val[:, g], hit[:, g]) for val, hit in arr["slots"]]
+            out.append((f"{self.name}_{k}", self.metric.format(key=k), self.tickers[k], a))
+        return out
+
+    def row_at(self, arr, t=-1):
+        """배열에서 t 시점 alerts 행 (룰당 0개 또는 1개, 그룹 룰은 데이터 있는 멤버마다 1개)"""
+        return [r for _, metric, ticker, a in self.split(arr) for r in self._row(a, t, metric, ticker)]
+
+    def _row(self, arr, t, metric, ticker):
+        if arr is None or (arr.get("skip") is not None and arr["skip"][t]):
+            return []
+        row = {"metric": metric, "ticker": ticker}
+        if self.latest and arr.get("latest") is not None:
+            row["latest"] = float(arr["latest"][t])
+        for c, (val, hit) in zip(self.checks, arr["slots"]):
+            slot, v, h = c["slot"], val[t], hit[t]
+            if self.fmt:
+                row[f"chg_{slot}"] = self.fmt.format(v) if not np.isnan(v) else np.nan
+            if c["label"] is not None:
+                row[f"threshold_{slot}"] = c["label"]
+            row[f"breach_{slot}"] = bool(h) if not np.isnan(h) else np.nan
+        main = arr["slots"][0][0][t]
+        if self.note_na is not None and np.isnan(main):
+            row["note"] = self.note_na
+        else:
+            row["note"] = self.note.format(
+                val=main, thr=self.checks[0]["thr_value"],
+                **{k: arr[k][t] for k in ("a", "b", "avg") if arr.get(k) is not None},
+            )
+        return [row]
+
+    def rows(self, ctx, t=-1):
+        return self.row_at(self.arrays(ctx), t)
+
+
+def load_cached_raw(key_prefs):
+    """히스토리 캐시(HIST_CACHE_DIR)에 쌓인 전체 기간 BDH 원시 프레임 (columns=(ticker, field), 없으면 None)"""
+    frames = {}
+    for _, bb, _ in key_prefs:
+        if bb not in frames:
+            c = load_hist_cache(bb)
+            if c is not None and len(c):
+                frames[bb] = c
+    if not frames:
+        return None
+    return pd.concat(frames, axis=1).sort_index().dropna(how="all")
+
+
+def load_cached_panel(key_prefs):
+    """히스토리 캐시 전체 기간으로 Panel 구성 (BDH 조회 없음, 백테스트용)"""
+    raw = load_cached_raw(key_prefs)
+    if raw is None:
+        return None
+    panel, _ = Panel.from_raw(raw, key_prefs, dtype=PANEL_DTYPE, markets=KEY_MARKETS)
+    return panel
+
+
+def evaluate_asof(raw, key_prefs, asof, lookback_days=420, rules=None):
+    """
+    asof 날짜의 alerts 행 재계산 - 원시 프레임을 그날 일일 실행과 같은 [asof-lookback_days, asof] 구간으로
+    잘라 패널을 새로 구성 (이후 날짜 값이 ffill/bfill 이나 월평균에 섞이지 않음)
+    반환: (rows, 패널) / 구간에 데이터가 없으면 (None, None)
+    """
+    asof = pd.Timestamp(asof).normalize()
+    window = raw.loc[asof - timedelta(days=lookback_days):asof]
+    if window.empty:
+        return None, None
+    sub, _ = Panel.from_raw(window, key_prefs, dtype=PANEL_DTYPE, markets=KEY_MARKETS)
+    ctx = RuleContext(sub)
+    return [r for rule in (rules or RULES) for r in rule.rows(ctx)], sub
+
+
+def run_backtest(panel, rules):
+    """
+    모든 룰 x 모든 날짜의 초과 여부 (룰마다 전 시점 배열을 한 번 계산 → 날짜 반복 없음)
+    반환: (breaches: index=Date, columns="룰id:슬롯", 값 1/0/NaN(평가 불가),
+           summary: 룰/슬롯별 평가일수, 발생 횟수/비율, 연속 구간 수, 첫/마지막 발생일)
+    """
+    ctx = RuleContext(panel)
+    n_rows = len(panel.index)
+    cols, summary = {}, []
+    for rule in rules:
+        for rid, metric, _, arr in rule.split(rule.arrays(ctx)):
+            for i, c in enumerate(rule.checks):
+                if arr is None:
+                    hit = np.full(n_rows, np.nan)
+                else:
+                    hit = arr["slots"][i][1].copy()
+                    if arr.get("skip") is not None:
+                        hit[arr["skip"]] = np.nan
+                cols[f"{rid}:{c['slot']}"] = hit
+                fired = hit == 1.0
+                fire_rows = np.flatnonzero(fired)
+                days = int(np.count_nonzero(~np.isnan(hit)))
+                summary.append({
+                    "rule": rid,
+                    "metric": metric,
+                    "slot": c["slot"],
+                    "cmp": c["cmp"],
+                    "threshold": c["thr_value"],
+                    "days": days,
+                    "fires": len(fire_rows),
+                    "fire_rate_pct": round(100.0 * len(fire_rows) / days, 2) if days else np.nan,
+                    "episodes": int(np.count_nonzero(fired & ~np.r_[False, fired[:-1]])),
+                    "first_fire": panel.index[fire_rows[0]].strftime("%Y-%m-%d") if len(fire_rows) else None,
+                    "last_fire": panel.index[fire_rows[-1]].strftime("%Y-%m-%d") if len(fire_rows) else None,
+                })
+    breaches = pd.DataFrame(cols, index=panel.index)
+    breaches.index.name = "Date"
+    return breaches, pd.DataFrame(summary)
+
+
+def sweep_grid(rules, thresholds=None, factors=None, grid=None):
+    """
+    스윕 후보값 {임계 키: [후보값, ...]}
+    - grid 를 주면 그대로 (룰에 안 쓰이는 키는 제외)
+    - 없으면 룰에 쓰인 키마다 현재값 x factors, 연속일 인자(n)는 현재값 ±2일
+    """
+    thresholds = THRESHOLDS if thresholds is None else thresholds
+    factors = SWEEP_FACTORS if factors is None else factors
+    thr_keys = {c["thr"] for r in rules for c in r.checks if isinstance(c.get("thr"), str)}
+    n_keys = {c["n"] for r in rules for c in r.checks if isinstance(c.get("n"), str)}
+    if grid is not None:
+        unknown = set(grid) - thr_keys - n_keys
+        if unknown:
+            print(f"⚠️ 스윕: 룰에 쓰이지 않는 임계 키 제외 → {', '.join(sorted(unknown))}")
+        return {k: list(v) for k, v in grid.items() if k not in unknown}
+    out = {}
+    for k in sorted(thr_keys | n_keys):
+        cur = thresholds[k]
+        if k in n_keys:
+            out[k] = sorted({max(1, int(cur) + d) for d in range(-2, 3)})
+        else:
+            out[k] = [round(cur * f, 6) for f in factors]
+    return out
+
+
+def _with_check(rule, i, **values):
+    """i 번째 check 의 thr_value/n_value 만 바꾼 룰 사본 (그룹 멤버 view 캐시는 새로)"""
+    clone = CompiledRule.__new__(CompiledRule)
+    clone.__dict__.update(rule.__dict__, _views={})
+    clone.checks = [dict(c, **values) if j == i else c for j, c in enumerate(rule.checks)]
+    return clone
+
+
+def _fire_stats(hit):
+    """hit (K, 시점): 후보값별 평가일수/발생 횟수/연속 구간 수/첫·마지막 발생 행 (-1 = 없음)"""
+    fired = hit == 1.0
+    starts = fired & ~np.concatenate([np.zeros((len(hit), 1), dtype=bool), fired[:, :-1]], axis=1)
+    n_cols = hit.shape[1]
+    any_fire = fired.any(axis=1)
+    return {
+        "days": np.count_nonzero(~np.isnan(hit), axis=1),
+        "fires": fired.sum(axis=1),
+        "episodes": starts.sum(axis=1),
+        "first": np.where(any_fire, fired.argmax(axis=1), -1),
+        "last": np.where(any_fire, n_cols - 1 - fired[:, ::-1].argmax(axis=1), -1),
+    }
+
+
+def run_sweep(panel, rules, grid):
+    """
+    임계값 민감도: 키별 후보값 K개를 (K, 1) 벡터로 check 에 넣고 룰 transform 을 다시 실행
+    → 값 배열(Expr 메모)은 컨텍스트에서 1번만 계산, 비교만 (K x 시점 [x 멤버]) 로 broadcast
+    - 연속일 인자(n)는 window 길이가 바뀌므로 후보값마다 1번씩 평가
+    반환: DataFrame [threshold, value, current, rule, metric, slot, days, fires, fire_rate_pct, episodes,
+                     avg_episode_days, first_fire, last_fire]
+    """
+    ctx = RuleContext(panel)
+    dates = panel.index.strftime("%Y-%m-%d")
+    out = []
+    for key, values in grid.items():
+        values = np.asarray(values, dtype=float)
+        for rule in rules:
+            for i, c in enumerate(rule.checks):
+                if c.get("thr") == key:
+                    shape = (len(values), 1, 1) if rule.members is not None else (len(values), 1)
+                    arrs = [_with_check(rule, i, thr_value=values.reshape(shape)).arrays(ctx)]
+                elif c.get("n") == key:
+                    arrs = [_with_check(rule, i, n_value=int(v)).arrays(ctx) for v in values]
+                else:
+                    continue
+                if arrs[0] is None:
+                    continue
+                hits = []
+                for arr in arrs:
+                    hit = arr["slots"][i][1]
+                    if arr.get("skip") is not None:
+                        hit = np.where(arr["skip"], np.nan, hit)
+                    hits.append(hit)
+                # (K, 시점 [, 멤버]) - n 스윕은 후보값별 배열을 쌓음
+                hit = hits[0] if len(hits) == 1 else np.stack(hits)
+                parts = [(rule.name, rule.metric, hit)]
+                if rule.members is not None:
+                    parts = [(f"{rule.name}_{k}", rule.metric.format(key=k), hit[:, :, g])
+                             for g, k in enumerate(arrs[0]["members"])]
+                for rid, metric, h in parts:
+                    st = _fire_stats(h)
+                    for k, v in enumerate(values):
+                        days, fires, eps = int(st["days"][k]), int(st["fires"][k]), int(st["episodes"][k])
+                        out.append({
+                            "threshold": key, "value": v, "current": bool(np.isclose(v, THRESHOLDS[key])),
+                            "rule": rid, "metric": metric, "slot": c["slot"], "days": days, "fires": fires,
+                            "fire_rate_pct": round(100.0 * fires / days, 2) if days else np.nan,
+                            "episodes": eps, "avg_episode_days": round(fires / eps, 2) if eps else np.nan,
+                            "first_fire": dates[st["first"][k]] if st["first"][k] >= 0 else None,
+                            "last_fire": dates[st["last"][k]] if st["last"][k] >= 0 else None,
+                        })
+    return pd.DataFrame(out)
+
+
+def group_stress_table(rule, ctx, t=-1):
+    """
+    그룹 룰의 멤버별 스트레스 순위 (t 시점): 첫 슬롯 값(예: MTD/전월 평균 상승률) 큰 순
+    - thr_gap: 임계값까지 남은 거리 (양수면 초과)
+    """
+    arr = rule.arrays(ctx)
+    cols = ["rank", "member", "ticker", "latest", "mtd", "prevm", "value", "thr_gap", "breach"]
+    if arr is None or rule.members is None:
+        return pd.DataFrame(columns=cols)
+    c, (val, hit) = rule.checks[0], arr["slots"][0]
+    df = pd.DataFrame({
+        "member": arr["members"],
+        "ticker": [rule.tickers[k] for k in arr["members"]],
+        "latest": arr["latest"][t] if arr.get("latest") is not None else np.nan,
+        "mtd": arr["a"][t] if arr.get("a") is not None else np.nan,
+        "prevm": arr["b"][t] if arr.get("b") is not None else np.nan,
+        "value": val[t],
+        "thr_gap": val[t] - c["thr_value"],
+        "breach": hit[t] == 1.0,
+    }).sort_values("value", ascending=False, na_position="last", kind="stable")
+    df.insert(0, "rank", np.arange(1, len(df) + 1))
+    return df[cols].reset_index(drop=True)
+
+
+def compile_rules(specs, thresholds=None, bb_tickers=None):
+    """RULE_SPECS → [CompiledRule, ...] (순서 = alerts 행 순서)"""
+    thresholds = THRESHOLDS if thresholds is None else thresholds
+    bb_tickers = {**TICKERS, **CDS_TICKERS} if bb_tickers is None else bb_tickers
+    rules = [CompiledRule(spec, thresholds, bb_tickers) for spec in specs]
+    dup = {r.name for r in rules if sum(x.name == r.name for x in rules) > 1}
+    if dup:
+        raise ValueError(f"룰 id 중복: {', '.join(sorted(dup))}")
+    return rules
+
+# -----------------------------
+# 4-2) 롤링 상태: 어제 상태 + 새 행 → 마지막 시점 통계 O(1) 갱신 (rolling_state.json)
+# -----------------------------
+def _nan_to_none(values):
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+def _none_to_nan(values):
+    return [np.nan if v is None else float(v) for v in values]
+
+
+class RollingState:
+    """
+    키 1개의 롤링 상태
+    - trail : 최근 window 개 패널 행 값 (링 버퍼) + 합계 → 63영업일 평균, 최근 n행 연속 판정
+    - bday  : 소속 시장 영업일 값 최근 depth 개 → n영업일 전 값 (bp/pct/pp 변화)
+    - rows / valid: 반영한 행 수 / 그중 값이 있는 행 수,  last_date: 마지막 반영 날짜
+    """
+
+    def __init__(self, window, depth):
+        self.trail = deque(maxlen=window)
+        self.trail_sum = 0.0
+        self.trail_nan = 0
+        self.bday = deque(maxlen=depth)
+        self.last_bday = False
+        self.rows = 0
+        self.valid = 0
+        self.last_date = None
+
+    def _add(self, value, sign):
+        if np.isnan(value):
+            self.trail_nan += sign
+        else:
+            self.trail_sum += sign * value
+
+    def push(self, date, value, is_bday):
+        if len(self.trail) == self.trail.maxlen:
+            self._add(self.trail[0], -1)
+        self.trail.append(value)
+        self._add(value, 1)
+        if is_bday:
+            self.bday.append(value)
+        self.last_bday = is_bday
+        self.rows += 1
+        self.valid += not np.isnan(value)
+        self.last_date = date
+
+    def replace_last(self, value):
+        old = self.trail[-1]
+        self._add(old, -1)
+        self._add(value, 1)
+        self.trail[-1] = value
+        if self.last_bday:
+            self.bday[-1] = value
+        self.valid += int(not np.isnan(value)) - int(not np.isnan(old))
+
+    def lag(self, n):
+        """(마지막 영업일 값, n영업일 전 값)"""
+        cur = self.bday[-1] if self.bday else np.nan
+        prev = self.bday[-1 - n] if len(self.bday) > n else np.nan
+        return cur, prev
+
+    def trail_avg(self, min_points=10):
+        if self.rows < min_points or self.trail_nan:
+            return np.nan
+        return self.trail_sum / len(self.trail)
+
+    def tail(self, n):
+        """최근 n개 패널 행 값 (오래된 순)"""
+        n = min(n, len(self.trail))
+        return np.array([self.trail[i] for i in range(len(self.trail) - n, len(self.trail))])
+
+    def to_dict(self):
+        return {"last_date": self.last_date, "rows": int(self.rows), "valid": int(self.valid), "last_bday": self.last_bday,
+                "trail": _nan_to_none(self.trail), "bday": _nan_to_none(self.bday)}
+
+    @classmethod
+    def from_dict(cls, d, window, depth):
+        st = cls(window, depth)
+        for v in _none_to_nan(d["trail"])[-window:]:
+            st.trail.append(v)
+            st._add(v, 1)   # 합계는 버퍼에서 다시 계산 (날마다 누적 오차 초기화)
+        st.bday.extend(_none_to_nan(d["bday"])[-depth:])
+        st.last_bday = bool(d["last_bday"])
+        st.rows, st.valid, st.last_date = int(d["rows"]), int(d["valid"]), d["last_date"]
+        return st
+
+
+class ConsecCounter:
+    """룰 슬롯 1개의 연속 초과 일수 (prev: 마지막 행 반영 전 값 → 마지막 행 교체 시 O(1))"""
+
+    def __init__(self, cmp, thr):
+        self.cmp, self.thr = cmp, thr
+        self.count = 0
+        self.prev = 0
+        self.last_date = None
+
+    def push(self, date, hit):
+        self.prev = self.count
+        self.count = self.count + 1 if hit else 0
+        self.last_date = date
+
+    def replace_last(self, hit):
+        self.count = self.prev + 1 if hit else 0
+
+    def to_dict(self):
+        return {"cmp": self.cmp, "thr": self.thr, "count": int(self.count), "prev": int(self.prev),
+                "last_date": self.last_date}
+
+    @classmethod
+    def from_dict(cls, d):
+        ctr = cls(d["cmp"], d["thr"])
+        ctr.count, ctr.prev, ctr.last_date = int(d["count"]), int(d["prev"]), d["last_date"]
+        return ctr
+
+
+def _run_length(hits):
+    """끝에서부터 연속 True 개수"""
+    miss = np.flatnonzero(~hits)
+    return len(hits) - 1 - miss[-1] if len(miss) else len(hits)
+
+
+class RollingStateStore:
+    """
+    키별 RollingState + 연속 판정 룰 슬롯별 ConsecCounter (rolling_state.json 1개로 저장/복원)
+    - sync(panel, rules): 마지막 반영 날짜 이후 행만 push (보통 하루 1행 → 키/슬롯당 O(1))
+      처음이거나 저장된 버퍼가 패널 값과 다르면 해당 키(와 그 키를 쓰는 카운터)만 패널에서 재구성
+    - replace_last(panel, key): 패널 마지막 행 값이 제자리 갱신됐을 때 (장중 실시간 모드)
+    """
+    VERSION = 1
+
+    def __init__(self, window=63, depth=11):
+        self.window, self.depth = window, depth
+        self.keys = {}
+        self.markets = {}
+        self.counters = {}
+        self._slots = {}   # {카운터 id: (룰, 슬롯)} - sync 때 구성
+
+    @staticmethod
+    def depth_for(rules):
+        """lag 버퍼 길이 = 변화량 룰의 최대 lag + 1"""
+        return 1 + max([c["lag"] for r in rules if r.transform.startswith("chg_") for c in r.checks], default=1)
+
+    @staticmethod
+    def consec_slots(rules):
+        """연속일 카운터를 두는 슬롯 (레벨 스프레드 n영업일 연속)"""
+        return {f"{r.name}:{c['slot']}": (r, c) for r in rules if r.transform == "level_consec" for c in r.checks}
+
+    @classmethod
+    def load(cls, path, rules, window=63):
+        store = cls(window, cls.depth_for(rules))
+        data = _load_json(path, {})
+        if (data.get("version"), data.get("window"), data.get("depth")) != (cls.VERSION, store.window, store.depth):
+            return store
+        store.markets = data.get("markets", {})
+        store.keys = {k: RollingState.from_dict(d, store.window, store.depth) for k, d in data.get("keys", {}).items()}
+        store.counters = {cid: ConsecCounter.from_dict(d) for cid, d in data.get("counters", {}).items()}
+        return store
+
+    def save(self, path):
+        _save_json(path, {
+            "version": self.VERSION, "window": self.window, "depth": self.depth, "markets": self.markets,
+            "keys": {k: st.to_dict() for k, st in self.keys.items()},
+            "counters": {cid: ctr.to_dict() for cid, ctr in self.counters.items()},
+        })
+
+    @staticmethod
+    def _row_of(panel, date):
+        if date is None:
+            return None
+        try:
+            return panel.index.get_loc(pd.Timestamp(date))
+        except KeyError:
+            return None
+
+    def _resume_row(self, panel, key):
+        """이어서 반영할 첫 행 번호 (상태가 없거나 패널과 다르면 None → 재구성)"""
+        st = self.keys.get(key)
+        market = panel.markets[key]
+        row = self._row_of(panel, st.last_date) if st is not None else None
+        if row is None or self.markets.get(key) != market:
+            return None
+        j = panel.columns[key]
+        trail = panel.values[row + 1 - len(st.trail):row + 1, j]
+        bd = panel.calendar.bday_rows[market]
+        k = np.searchsorted(bd, row, side="right")
+        bday = panel.values[bd[max(0, k - len(st.bday)):k], j]
+        if (len(trail) != len(st.trail) or len(bday) != len(st.bday)
+                or st.last_bday != bool(panel.calendar.is_bday[market][row])
+                or not np.array_equal(trail, np.asarray(st.trail), equal_nan=True)
+                or not np.array_equal(bday, np.asarray(st.bday), equal_nan=True)):
+            return None
+        return row + 1
+
+    def _rebuild_key(self, panel, key):
+        """버퍼에 필요한 꼬리 구간만 push (앞부분은 행 수/유효 개수만 집계)"""
+        j, market = panel.columns[key], panel.markets[key]
+        bd = panel.calendar.bday_rows[market]
+        n_rows = len(panel.index)
+        start = max(0, n_rows - self.window)
+        if len(bd):
+            start = min(start, bd[max(0, len(bd) - self.depth)])
+        st = RollingState(self.window, self.depth)
+        st.rows = start
+        st.valid = int(np.count_nonzero(~np.isnan(panel.values[:start, j])))
+        self.keys[key], self.markets[key] = st, market
+        return st, start
+
+    @staticmethod
+    def _hits(panel, rule, c, rows):
+        ka, kb = rule.deps
+        spr = (panel.values[rows, panel.columns[ka]] - panel.values[rows, panel.columns[kb]]) * 100.0
+        return _compare(c["cmp"], spr, c["thr_value"]) == 1.0
+
+    def sync(self, panel, rules):
+        """패널 새 행 반영 → {"resumed": 이어서 갱신한 키 수, "appended": push 행 수, "rebuilt": [키...]}"""
+        n_rows = len(panel.index)
+        dates = {}
+
+        def date_of(r):
+            if r not in dates:
+                dates[r] = panel.index[r].strftime("%Y-%m-%d")
+            return dates[r]
+
+        resumed, appended, rebuilt = 0, 0, []
+        for key in panel.keys:
+            start = self._resume_row(panel, key)
+            if start is None:
+                st, start = self._rebuild_key(panel, key)
+                rebuilt.append(key)
+            else:
+                st = self.keys[key]
+                resumed += 1
+                appended += n_rows - start
+            j, is_bday = panel.columns[key], panel.calendar.is_bday[panel.markets[key]]
+            for r in range(start, n_rows):
+                st.push(date_of(r), float(panel.values[r, j]), bool(is_bday[r]))
+
+        self._slots = {cid: (r, c) for cid, (r, c) in self.consec_slots(rules).items()
+                       if all(k in panel for k in r.deps)}
+        self.counters = {cid: ctr for cid, ctr in self.counters.items() if cid in self._slots}
+        for cid, (rule, c) in self._slots.items():
+            ctr = self.counters.get(cid)
+            row = None
+            if ctr is not None and (ctr.cmp, ctr.thr) == (c["cmp"], c["thr_value"]) \
+                    and not set(rule.deps) & set(rebuilt):
+                row = self._row_of(panel, ctr.last_date)
+            if row is None:
+                hits = self._hits(panel, rule, c, slice(None))
+                ctr = self.counters[cid] = ConsecCounter(c["cmp"], c["thr_value"])
+                ctr.count, ctr.prev = _run_length(hits), _run_length(hits[:-1])
+                ctr.last_date = date_of(n_rows - 1) if n_rows else None
+                continue
+            for r, hit in zip(range(row + 1, n_rows), self._hits(panel, rule, c, slice(row + 1, n_rows))):
+                ctr.push(date_of(r), hit)
+        return {"resumed": resumed, "appended": appended, "rebuilt": rebuilt}
+
+    def replace_last(self, panel, key):
+        """패널 마지막 행의 key 값이 바뀐 뒤 호출: 버퍼/합계/카운터를 O(1) 로 보정"""
+        if key not in self.keys:
+            return
+        self.keys[key].replace_last(float(panel.values[-1, panel.columns[key]]))
+        for cid, (rule, c) in self._slots.items():
+            if key in rule.deps:
+                self.counters[cid].replace_last(bool(self._hits(panel, rule, c, [-1])[0]))
+
+    def covers(self, panel, keys=None):
+        """패널 마지막 날짜까지 반영돼 있는지 (키별 상태 기준)"""
+        if not len(panel.index):
+            return False
+        last = panel.index[-1].strftime("%Y-%m-%d")
+        return all(k in self.keys and self.keys[k].last_date == last for k in (keys or panel.keys))
+
+
+class RollingContext(ExprContext):
+    """
+    RuleContext 와 같은 인터페이스로 마지막 시점 1개만 계산 (길이 1 배열) → 룰 transform 을 그대로 사용
+    - lag / trail_avg / 연속 판정: RollingStateStore 버퍼·카운터,  month_avg: 패널 월 집계표
+    """
+
+    def __init__(self, store, panel):
+        self.store = store
+        self.panel = panel
+        self._init_exprs()
+
+    def col(self, key):
+        return self.panel.values[-1:, self._idx(key)]
+
+    def has(self, key, min_points=5):
+        return key in self.panel and key in self.store.keys and self.store.keys[key].valid >= min_points
+
+    def _per_key(self, key, fn):
+        """키별 상태 조회 → 길이 1 배열 (키 튜플이면 (1, 멤버) 행렬)"""
+        if isinstance(key, tuple):
+            return np.array([[fn(self.store.keys[k]) for k in key]])
+        return np.array([fn(self.store.keys[key])])
+
+    def lag(self, key, n):
+        return self._per_key(key, lambda st: st.lag(n)[0]), self._per_key(key, lambda st: st.lag(n)[1])
+
+    def month_avg(self, key, months):
+        return np.array([self.panel.monthly.mean(self._idx(key), months)])
+
+    def trail_avg(self, key, window=63, min_points=10):
+        if window != self.store.window:
+            raise ValueError(f"롤링 상태 window({self.store.window}) 와 다른 평균 기간: {window}")
+        return self._per_key(key, lambda st: st.trail_avg(min_points))
+
+    def consec(self, rule, c, values, offset=None):
+        if offset is None:
+            ctr = self.store.counters[f"{rule.name}:{c['slot']}"]
+            return np.array([float(ctr.count >= c["n_value"])])
+        # 기준값이 시점마다 다른 연속 판정 (예: 값 - 전월평균) → 최근 n행 버퍼로 같은 식 계산
+        n = c["n_value"]
+        tail = self.store.keys[rule.deps[0]].tail(n)
+        return _consec(tail, n, c["cmp"], c["thr_value"], np.r_[np.full(len(tail) - 1, np.nan), offset])[-1:]
+
+
+# -----------------------------
+# 4-3) 알림 상태: 룰/슬롯별 초과 이력 (alert_state.json) → new / ongoing / cleared
+# -----------------------------
+def alert_observations(rules, ctx, t=-1):
+    """
+    t 시점 룰/슬롯별 관측 [{key, rule, metric, slot, breached, severity}, ...]
+    - key = "룰id:슬롯" (백테스트 breaches 열 이름과 같음, 그룹 룰은 룰id_멤버)
+    - breached: True/False, 평가 불가(값 없음/skip)면 None
+    - severity: |값| / |임계값| (임계값이 0 이거나 값이 없으면 None)
+    """
+    out = []
+    for rule in rules:
+        for rid, metric, _, arr in rule.split(rule.arrays(ctx)):
+            if arr is None:
+                continue
+            skip = arr.get("skip") is not None and bool(arr["skip"][t])
+            for c, (val, hit) in zip(rule.checks, arr["slots"]):
+                v, h, thr = float(val[t]), float(hit[t]), c["thr_value"]
+                sev = abs(v) / abs(thr) if thr and np.isfinite(v) else None
+                out.append({"key": f"{rid}:{c['slot']}", "rule": rid, "metric": metric, "slot": c["slot"],
+                            "breached": None if skip or np.isnan(h) else bool(h),
+                            "severity": round(sev, 3) if sev is not None else None})
+    return out
+
+
+class AlertStateStore:
+    """
+    룰/슬롯별 알림 상태 {key: 항목} - 실행일마다 그날 관측으로 증분 갱신
+    - 항목: active, first_breached, days(첫 초과일~기준일 영업일 수), last_seen, last_cleared,
+            severity(기준일), peak_severity(이번 초과 구간 최대), status, asof
+    - status: new(기준일에 처음 초과) / ongoing(전 실행일부터 계속) / cleared(기준일에 해소) / ""(변화 없음)
+    - 항목마다 '기준일 이전 상태(base)'를 같이 저장 → 같은 날 재실행해도 결과가 같음 (new 가 ongoing 으로 안 바뀜)
+    - notified_asof / notified_active / notified_first: 알림 셀이 전송 성공 후 남기는 전달 기록
+      (갱신 때 그대로 유지 → 알림 셀은 마지막 전달 이후의 변화를 모아 보냄)
+    - 평가 불가(None)인 날은 이전 상태 유지, 한 번도 초과한 적 없는 키는 저장하지 않음
+    """
+
+    VERSION = 1
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self.asof = None
+        self._by_status = {"new": [], "ongoing": [], "cleared": []}
+
+    @classmethod
+    def load(cls, path):
+        data = _load_json(path, {})
+        store = cls(data.get("entries", {}) if data.get("version") == cls.VERSION else {})
+        store.asof = data.get("asof")
+        store._index()
+        return store
+
+    def save(self, path):
+        _save_json(path, {"version": self.VERSION, "asof": self.asof, "entries": self.entries})
+
+    def _index(self):
+        self._by_status = {"new": [], "ongoing": [], "cleared": []}
+        for key, e in self.entries.items():
+            if e.get("asof") == self.asof and e.get("status") in self._by_status:
+                self._by_status[e["status"]].append(key)
+
+    @staticmethod
+    def _step(base, obs, day):
+        """이전 상태 base(없으면 None) + 기준일 관측 → 새 항목 (저장할 필요 없으면 None)"""
+        if obs["breached"] is None or (not obs["breached"] and not (base and base["active"])):
+            return dict(base, status="") if base else None
+        e = dict(base or {"first_breached": None, "days": 0, "last_seen": None, "last_cleared": None,
+                          "peak_severity": None})
+        e.update(rule=obs["rule"], metric=obs["metric"], slot=obs["slot"])
+        if not obs["breached"]:
+            e.update(active=False, status="cleared", last_cleared=day, severity=obs["severity"])
+            return e
+        sev = obs["severity"]
+        if base and base["active"]:
+            e["status"] = "ongoing"
+            peak = e["peak_severity"]
+            e["peak_severity"] = sev if peak is None else max(peak, sev) if sev is not None else peak
+        else:
+            e.update(status="new", first_breached=day, peak_severity=sev)
+        e.update(active=True, last_seen=day, severity=sev,
+                 days=int(np.busday_count(e["first_breached"], day)) + 1)
+        return e
+
+    def update(self, day, observations):
+        """day(YYYY-MM-DD) 관측 반영 → {"new": n, "ongoing": n, "cleared": n}"""
+        day = pd.Timestamp(day).strftime("%Y-%m-%d")
+        seen = set()
+        for obs in observations:
+            key = obs["key"]
+            seen.add(key)
+            cur = self.entries.get(key)
+            # 같은 기준일 재실행이면 그날 이전 상태에서 다시 계산
+            base = cur.get("base") if cur and cur.get("asof") == day else cur
+            if base is not None:
+                base = {k: v for k, v in base.items() if k not in ("base", "asof")}
+            e = self._step(base, obs, day)
+            if e is None:
+                self.entries.pop(key, None)
+            else:
+                # 전달 기록은 base 가 아닌 현재 항목 기준 (같은 날 전송 후 재실행해도 다시 보내지 않음)
+                told = {k: v for k, v in (cur or {}).items() if k.startswith("notified_")}
+                self.entries[key] = dict(e, asof=day, base=base, **told)
+        # 룰이 빠졌거나 이번에 평가되지 않은 키: 상태 유지, 전이 표시는 지움
+        for key, e in self.entries.items():
+            if key not in seen and e.get("asof") != day:
+                e["status"] = ""
+        self.asof = day
+        self._index()
+        return {s: len(keys) for s, keys in self._by_status.items()}
+
+    def keys(self, status):
+        return list(self._by_status[status])
+
+    def new(self):
+        return self.keys("new")
+
+    def ongoing(self):
+        return self.keys("ongoing")
+
+    def cleared(self):
+        return self.keys("cleared")
+
+    def transitions(self):
+        """하류(텔레그램 등)가 처리할 변화: 신규 + 해소"""
+        return self.new() + self.cleared()
+
+    def table(self, statuses=("new", "ongoing", "cleared")):
+        """기준일 상태 표 (엑셀 alert_state 시트) - new → ongoing → cleared 순"""
+        cols = ["key", "rule", "metric", "slot", "status", "first_breached", "days", "last_cleared",
+                "severity", "peak_severity"]
+        recs = [{"key": k, **{c: self.entries[k].get(c) for c in cols[1:]}}
+                for s in statuses for k in self._by_status[s]]
+        return pd.DataFrame(recs, columns=cols)
+
+
 # -----------------------------
 # 5) 데이터 수집
 # -----------------------------
-hist = fetch_hist_with_field_prefs(
+RUN_STARTED = time.perf_counter()
+SHARED_PLAN = None
+if SHARED_FETCH_PLAN:
+    SHARED_PLAN = SharedFetchPlan()
+    try:
+        SHARED_PLAN.add(
+            "ind", load_ind_request(IND_INPUT_PATH),
+            (pd.Timestamp(TODAY) - timedelta(days=IND_LOOKBACK_DAYS)).strftime("%Y-%m-%d"), END_DATE,
+            opts=IND_BDH_OPTS,
+        )
+    except Exception as e:
+        print(f"⚠️ indicator.xlsx 읽기 실패 → IND 단계는 별도 조회: {e}")
+
+panel = fetch_hist_with_field_prefs(
     ticker_map=TICKERS,
     cds_map=CDS_TICKERS,
     field_prefs=FIELD_PREFS,
     start_date=START_DATE,
     end_date=END_DATE,
+    plan=SHARED_PLAN,
 )
+hist = panel.to_frame()
+BDAY_PANEL = panel
 
-# series 접근용 맵 구성 (키: TICKERS/국가명)
+# series 접근용 맵 구성 (키: TICKERS/국가명) - 패널 컬럼 view (복사 없음)
 series_map = {}
 for k in TICKERS.keys():
-    if k in hist.columns:
-        series_map[k] = hist[k]
+    if k in panel:
+        series_map[k] = panel.series(k)
 for name in CDS_TICKERS.keys():
-    if name in hist.columns:
-        series_map[name] = hist[name]
+    if name in panel:
+        series_map[name] = panel.series(name)
 
 # -----------------------------
 # 6) 임계 로직
 # -----------------------------
-rows = []
-
-# ---- (A) 원화금리 - 국고 3년 ----
-if has_data(series_map.get("KR3Y", pd.Series(dtype=float))):
-    kr3y_1d = bp_change(series_map["KR3Y"], 1)
-    kr3y_10d = bp_change(series_map["KR3Y"], 10)
-    rows.append({
-        "metric": "KR 3Y KTB Yield",
-        "ticker": TICKERS["KR3Y"],
-        "latest": last_value(series_map["KR3Y"]),
-        "chg_1d": f"{kr3y_1d:.1f}bp" if pd.notna(kr3y_1d) else np.nan,
-        "threshold_1d": "±15bp",
-        "breach_1d": (abs(kr3y_1d) >= THRESHOLDS["KR3Y_1d_bp"]) if pd.notna(kr3y_1d) else np.nan,
-        "chg_10d": f"{kr3y_10d:.1f}bp" if pd.notna(kr3y_10d) else np.nan,
-        "threshold_10d": "±50bp",
-        "breach_10d": (abs(kr3y_10d) >= THRESHOLDS["KR3Y_10d_bp"]) if pd.notna(kr3y_10d) else np.nan,
-        "note": "원화 3Y: 수익률 bp 기준",
-    })
+# - RULE_SPECS(3-1)를 1번 컴파일 → 패널 행렬(시장 영업일 lag, 월평균, 63일 평균)을 모든 룰이 공유
+# - 룰 이름/의존 키(식에 쓰인 키)는 장중 실시간 모드(8)에서 틱이 들어온 키의 룰만 재평가할 때 사용
+RULES = compile_rules(RULE_SPECS)
+
+
+if ROLLING_STATE:
+    ROLLING = RollingStateStore.load(ROLLING_STATE_PATH, RULES)
+    _sync = ROLLING.sync(panel, RULES)
+    ROLLING.save(ROLLING_STATE_PATH)
+    print(f"🔁 롤링 상태: 키 {len(panel.keys)}개 중 이어서 갱신 {_sync['resumed']}개 (+{_sync['appended']}행), "
+          f"재구성 {len(_sync['rebuilt'])}개")
+
+
+def rule_context(panel):
+    """마지막 시점 평가용: 롤링 상태가 패널 마지막 날짜까지 반영돼 있으면 O(1) 컨텍스트, 아니면 전 시점 행렬"""
+    if ROLLING is not None and ROLLING.covers(panel):
+        return RollingContext(ROLLING, panel)
+    return RuleContext(panel)
+
+
+def evaluate_rules(panel, names=None, t=-1, ctx=None):
+    """룰별 결과 {룰 이름: [row, ...]} (names 를 주면 해당 룰만, t: 평가 시점 행 번호)"""
+    if ctx is None:
+        ctx = rule_context(panel) if t in (-1, len(panel.index) - 1) else RuleContext(panel)
+    return {rule.name: rule.rows(ctx, -1 if isinstance(ctx, RollingContext) else t)
+            for rule in RULES if names is None or rule.name in names}
+
+
+RULE_CTX = rule_context(panel)
+rule_rows = evaluate_rules(panel, ctx=RULE_CTX)
+if EXPR_DEBUG:
+    print(RULE_CTX.dump_graph())
+
+# 국가별 CDS 스트레스 순위 (룰 P 행렬 재사용 → 추가 계산 없음)
+CDS_STRESS = group_stress_table(next(r for r in RULES if r.name == "cds"), RULE_CTX)
+if len(CDS_STRESS):
+    print("🌡 CDS 스트레스 상위: " + ", ".join(
+        f"{r.member} {r.value:+.1f}%" + (" 🚨" if r.breach else "") for r in CDS_STRESS.head(5).itertuples()))
+rows = [r for rule in RULES for r in rule_rows[rule.name]]
+
+# 알림 상태 갱신: 패널 마지막 데이터 날짜 관측 → 신규/지속/해소
+# (주말/휴일 실행이 비영업일을 first_breached/last_cleared 로 찍지 않도록 실행일(TODAY)이 아닌 데이터 날짜 기준,
+#  텔레그램 셀은 마지막 전달 이후의 신규·해소를 모아 보내고 전송 성공 시 전달 기록을 남김)
+ALERT_STATES = None
+if ALERT_STATE:
+    ALERT_STATES = AlertStateStore.load(ALERT_STATE_PATH)
+    _n = ALERT_STATES.update(panel.index[-1], alert_observations(RULES, RULE_CTX))
+    ALERT_STATES.save(ALERT_STATE_PATH)
+    print(f"🔔 알림 상태({ALERT_STATES.asof}): 신규 {_n['new']}, 지속 {_n['ongoing']}, 해소 {_n['cleared']}")
 
-# ---- (B) 원화금리 - 국고 10년 ----
-if has_data(series_map.get("KR10Y", pd.Series(dtype=float))):
-    kr10y_1d = bp_change(series_map["KR10Y"], 1)
-    kr10y_10d = bp_change(series_map["KR10Y"], 10)
-    rows.append({
-        "metric": "KR 10Y KTB Yield",
-        "ticker": TICKERS["KR10Y"],
-        "latest": last_value(series_map["KR10Y"]),
-        "chg_1d": f"{kr10y_1d:.1f}bp" if pd.notna(kr10y_1d) else np.nan,
-        "threshold_1d": "±15bp",
-        "breach_1d": (abs(kr10y_1d) >= THRESHOLDS["KR10Y_1d_bp"]) if pd.notna(kr10y_1d) else np.nan,
-        "chg_10d": f"{kr10y_10d:.1f}bp" if pd.notna(kr10y_10d) else np.nan,
-        "threshold_10d": "±45bp",
-        "breach_10d": (abs(kr10y_10d) >= THRESHOLDS["KR10Y_10d_bp"]) if pd.notna(kr10y_10d) else np.nan,
-        "note": "원화 10Y: 수익률 bp 기준",
-    })
+# -----------------------------
+# 7) 저장: 열 단위 파일(alerts / raw_data) + 엑셀 내보내기
+# -----------------------------
+order_cols = [
+    "metric","ticker","latest",
+    "chg_1d","threshold_1d","breach_1d",
+    "chg_10d","threshold_10d","breach_10d",
+    "breach_3m","note",
+]
 
-# ---- (C) 미10Y: 3M 평균 대비 ±100bp ----
-if has_data(series_map.get("US10Y", pd.Series(dtype=float))):
-    us10y_last = last_value(series_map["US10Y"])
-    us10y_3m = trailing_3m_avg(series_map["US10Y"])
-    dev_bp = (us10y_last - us10y_3m) * 100.0 if pd.notna(us10y_last) and pd.notna(us10y_3m) else np.nan
-    rows.append({
-        "metric": "US 10Y vs 3M Avg",
-        "ticker": TICKERS["US10Y"],
-        "latest": us10y_last,
-        "breach_3m": (abs(dev_bp) >= THRESHOLDS["G3M_dev_bp"]) if pd.notna(dev_bp) else np.nan,
-        "note": f"3M avg={us10y_3m:.4f}, dev={dev_bp:.1f}bp; 임계±{THRESHOLDS['G3M_dev_bp']}bp" if pd.notna(dev_bp) else "데이터 부족",
-    })
 
-# ---- (D) TSFR 6M: 3M 평균 대비 ±100bp ----
-if has_data(series_map.get("TSFR6M", pd.Series(dtype=float))):
-    ts6_last = last_value(series_map["TSFR6M"])
-    ts6_3m = trailing_3m_avg(series_map["TSFR6M"])
-    dev_bp = (ts6_last - ts6_3m) * 100.0 if pd.notna(ts6_last) and pd.notna(ts6_3m) else np.nan
-    rows.append({
-        "metric": "TSFR 6M vs 3M Avg",
-        "ticker": TICKERS["TSFR6M"],
-        "latest": ts6_last,
-        "breach_3m": (abs(dev_bp) >= THRESHOLDS["G3M_dev_bp"]) if pd.notna(dev_bp) else np.nan,
-        "note": f"3M avg={ts6_3m:.4f}, dev={dev_bp:.1f}bp; 임계±{THRESHOLDS['G3M_dev_bp']}bp" if pd.notna(dev_bp) else "데이터 부족",
-    })
+def build_alerts_df(rows):
+    """룰 결과 행 → alerts 표 (열 순서 고정, 없는 열은 NaN)"""
+    df = pd.DataFrame(rows)
+    for c in order_cols:
+        if c not in df.columns:
+            df[c] = np.nan
+    return df[order_cols]
 
-# ---- (E) USDKRW: 1일 ±2%, 10일 ±5% ----
-if has_data(series_map.get("USDKRW", pd.Series(dtype=float))):
-    krw_1d = pct_change(series_map["USDKRW"], 1)
-    krw_10d = pct_change(series_map["USDKRW"], 10)
-    rows.append({
-        "metric": "USDKRW Spot",
-        "ticker": TICKERS["USDKRW"],
-        "latest": last_value(series_map["USDKRW"]),
-        "chg_1d": f"{krw_1d:.2f}%" if pd.notna(krw_1d) else np.nan,
-        "threshold_1d": "±2.0%",
-        "breach_1d": (abs(krw_1d) >= THRESHOLDS["USFX_1d_pct"]) if pd.notna(krw_1d) else np.nan,
-        "chg_10d": f"{krw_10d:.2f}%" if pd.notna(krw_10d) else np.nan,
-        "threshold_10d": "±5.0%",
-        "breach_10d": (abs(krw_10d) >= THRESHOLDS["USFX_10d_pct"]) if pd.notna(krw_10d) else np.nan,
-        "note": "원/달러 환율: % 기준",
-    })
 
-# ---- (F) KOSPI: 1일 -3.5%, 10일 -10% (하락만) ----
-if has_data(series_map.get("KOSPI", pd.Series(dtype=float))):
-    k1 = pct_change(series_map["KOSPI"], 1)
-    k10 = pct_change(series_map["KOSPI"], 10)
-    rows.append({
-        "metric": "KOSPI Index",
-        "ticker": TICKERS["KOSPI"],
-        "latest": last_value(series_map["KOSPI"]),
-        "chg_1d": f"{k1:.2f}%" if pd.notna(k1) else np.nan,
-        "threshold_1d": "≤ -3.5%",
-        "breach_1d": (k1 <= THRESHOLDS["KOSPI_1d_down_pct"]) if pd.notna(k1) else np.nan,
-        "chg_10d": f"{k10:.2f}%" if pd.notna(k10) else np.nan,
-        "threshold_10d": "≤ -10.0%",
-        "breach_10d": (k10 <= THRESHOLDS["KOSPI_10d_down_pct"]) if pd.notna(k10) else np.nan,
-        "note": "하락 방향만 트리거",
-    })
+def typed_alerts(alerts_df):
+    """alerts 표 → 열 타입 고정 (breach_* = nullable boolean, latest = float, 나머지 문자열)"""
+    df = alerts_df.copy()
+    for c in df.columns:
+        if c.startswith("breach"):
+            df[c] = df[c].astype("boolean")
+        elif c == "latest":
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+        else:
+            df[c] = df[c].astype("string")
+    return df
 
-# ---- (G) VKOSPI: 1일 +5pp, 10일 +10pp (상승만) ----
-if has_data(series_map.get("VKOSPI", pd.Series(dtype=float))):
-    v1 = pp_change(series_map["VKOSPI"], 1)
-    v10 = pp_change(series_map["VKOSPI"], 10)
-    rows.append({
-        "metric": "VKOSPI (Vol Index)",
-        "ticker": TICKERS["VKOSPI"],
-        "latest": last_value(series_map["VKOSPI"]),
-        "chg_1d": f"{v1:.2f}pp" if pd.notna(v1) else np.nan,
-        "threshold_1d": "≥ +5.0pp",
-        "breach_1d": (v1 >= THRESHOLDS["VKOSPI_1d_up_pp"]) if pd.notna(v1) else np.nan,
-        "chg_10d": f"{v10:.2f}pp" if pd.notna(v10) else np.nan,
-        "threshold_10d": "≥ +10.0pp",
-        "breach_10d": (v10 >= THRESHOLDS["VKOSPI_10d_up_pp"]) if pd.notna(v10) else np.nan,
-        "note": "상승만 트리거(pp)",
-    })
 
-# ---- (H) USDKRW 1Y IV: 1일 ±5pp, 10일 ±10pp ----
-if has_data(series_map.get("KRW_IV1Y", pd.Series(dtype=float))):
-    iv1 = pp_change(series_map["KRW_IV1Y"], 1)
-    iv10 = pp_change(series_map["KRW_IV1Y"], 10)
-    rows.append({
-        "metric": "USDKRW 1Y Implied Vol",
-        "ticker": TICKERS["KRW_IV1Y"],
-        "latest": last_value(series_map["KRW_IV1Y"]),
-        "chg_1d": f"{iv1:.2f}pp" if pd.notna(iv1) else np.nan,
-        "threshold_1d": "±5.0pp",
-        "breach_1d": (abs(iv1) >= THRESHOLDS["KRWIV_1d_pp"]) if pd.notna(iv1) else np.nan,
-        "chg_10d": f"{iv10:.2f}pp" if pd.notna(iv10) else np.nan,
-        "threshold_10d": "±10.0pp",
-        "breach_10d": (abs(iv10) >= THRESHOLDS["KRWIV_10d_pp"]) if pd.notna(iv10) else np.nan,
-        "note": "절대 pp 기준",
-    })
+def alert_records(alerts_df):
+    """
+    alerts 표 → 타입 고정 레코드 배열 (같은 프로세스의 텔레그램 셀에 엑셀 대신 전달)
+    - breach_* bool (평가 불가 NaN → False), latest float64, 나머지 고정 길이 문자열 (NaN → "")
+    """
+    df = typed_alerts(alerts_df)
+    dtypes = {}
+    for c in df.columns:
+        if c.startswith("breach"):
+            df[c] = df[c].fillna(False).astype(bool)
+            dtypes[c] = np.bool_
+        elif c == "latest":
+            dtypes[c] = np.float64
+        else:
+            df[c] = df[c].fillna("").astype(str)
+            dtypes[c] = f"U{max(1, int(df[c].str.len().max() or 0))}"
+    return df.to_records(index=False, column_dtypes=dtypes)
 
-# ---- (I) 외화 월평균 장단기: (SOFR OIS 1Y - TSFR 1M) MTD ≥ +150bp ----
-if has_data(series_map.get("SOFR_OIS_1Y", pd.Series(dtype=float))) and has_data(series_map.get("TSFR1M", pd.Series(dtype=float))):
-    ois1y_mtd = month_avg(series_map["SOFR_OIS_1Y"], 0)
-    tsfr1m_mtd = month_avg(series_map["TSFR1M"], 0)
-    mtd_spread = (ois1y_mtd - tsfr1m_mtd) * 100.0 if pd.notna(ois1y_mtd) and pd.notna(tsfr1m_mtd) else np.nan
-    rows.append({
-        "metric": "USD OIS 1Y - TSFR 1M (MTD avg)",
-        "ticker": f"{TICKERS['SOFR_OIS_1Y']} vs {TICKERS['TSFR1M']}",
-        "chg_1d": f"{mtd_spread:.1f}bp (MTD spread)" if pd.notna(mtd_spread) else np.nan,
-        "threshold_1d": f"≥ +{THRESHOLDS['SPREAD_SOFR1M_vs_OIS1Y_MTD_bp']:.0f}bp",
-        "breach_1d": (mtd_spread >= THRESHOLDS["SPREAD_SOFR1M_vs_OIS1Y_MTD_bp"]) if pd.notna(mtd_spread) else np.nan,
-        "note": f"MTD OIS1Y={ois1y_mtd:.4f}, TSFR1M={tsfr1m_mtd:.4f}" if pd.notna(mtd_spread) else "데이터/틱커 확인 필요",
-    })
 
-# ---- (J) KR 1Y - 기준금리: 5영업일 연속 < -24bp ----
-if has_data(series_map.get("KR1Y", pd.Series(dtype=float))) and has_data(series_map.get("KRBASERATE", pd.Series(dtype=float))):
-    spr_bp = (series_map["KR1Y"] - series_map["KRBASERATE"]) * 100.0
-    rows.append({
-        "metric": "KR 1Y - BaseRate (level)",
-        "ticker": f"{TICKERS['KR1Y']} - {TICKERS['KRBASERATE']}",
-        "latest": float(spr_bp.dropna().iloc[-1]) if spr_bp.dropna().size else np.nan,
-        "threshold_1d": "5영업일 연속 < -24bp",
-        "breach_1d": consec_last_n(spr_bp < THRESHOLDS["KR_1Y_minus_BASE_5d_level_bp"], 5) if spr_bp.dropna().size else np.nan,
-        "note": "레벨 기준(일별 스프레드)",
-    })
+def _columnar_format(fmt=None):
+    """요청 형식을 쓸 수 있으면 그대로, pyarrow 가 없으면 "pickle" """
+    fmt = fmt or COLUMNAR_FORMAT
+    if fmt in ("parquet", "feather"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return "pickle"
+    return fmt
 
-# ---- (K) 기준금리 - 콜금리: > +40bp ----
-if has_data(series_map.get("KRBASERATE", pd.Series(dtype=float))) and has_data(series_map.get("KRCALL", pd.Series(dtype=float))):
-    base_call = (series_map["KRBASERATE"] - series_map["KRCALL"]) * 100.0
-    rows.append({
-        "metric": "KR Base - Call (level)",
-        "ticker": f"{TICKERS['KRBASERATE']} - {TICKERS['KRCALL']}",
-        "latest": float(base_call.dropna().iloc[-1]) if base_call.dropna().size else np.nan,
-        "threshold_1d": f"> +{THRESHOLDS['BASE_minus_CALL_bp']:.0f}bp",
-        "breach_1d": (base_call.dropna().iloc[-1] > THRESHOLDS["BASE_minus_CALL_bp"]) if base_call.dropna().size else np.nan,
-        "note": "레벨 기준",
-    })
 
-# ---- (L) TSFR 3M: MTD-PrevM 절대변화 > 75bp ----
-if has_data(series_map.get("TSFR3M", pd.Series(dtype=float))):
-    ts3_cur = month_avg(series_map["TSFR3M"], 0)
-    ts3_prev = month_avg(series_map["TSFR3M"], 1)
-    ts3_diff = (ts3_cur - ts3_prev) * 100.0 if pd.notna(ts3_cur) and pd.notna(ts3_prev) else np.nan
-    rows.append({
-        "metric": "TSFR 3M (MTD - PrevM)",
-        "ticker": TICKERS["TSFR3M"],
-        "chg_1d": f"{ts3_diff:.1f}bp (Δavg)" if pd.notna(ts3_diff) else np.nan,
-        "threshold_1d": f"abs(Δ) > {THRESHOLDS['TSFR3M_prevM_abs_bp']:.0f}bp",
-        "breach_1d": (abs(ts3_diff) > THRESHOLDS["TSFR3M_prevM_abs_bp"]) if pd.notna(ts3_diff) else np.nan,
-        "note": f"MTD={ts3_cur:.4f}, PrevM={ts3_prev:.4f}" if pd.notna(ts3_diff) else "데이터/틱커 확인 필요",
-    })
+_COLUMNAR_SUFFIX = {"parquet": ".parquet", "feather": ".feather", "pickle": ".pkl"}
 
-# ---- (M) JPY 3M TIBOR: MTD-PrevM 절대변화 > 25bp ----
-if has_data(series_map.get("JPY_TIBOR3M", pd.Series(dtype=float))):
-    tib_cur = month_avg(series_map["JPY_TIBOR3M"], 0)
-    tib_prev = month_avg(series_map["JPY_TIBOR3M"], 1)
-    tib_diff = (tib_cur - tib_prev) * 100.0 if pd.notna(tib_cur) and pd.notna(tib_prev) else np.nan
-    rows.append({
-        "metric": "JPY TIBOR 3M (MTD - PrevM)",
-        "ticker": TICKERS["JPY_TIBOR3M"],
-        "chg_1d": f"{tib_diff:.1f}bp (Δavg)" if pd.notna(tib_diff) else np.nan,
-        "threshold_1d": f"abs(Δ) > {THRESHOLDS['JPY_TIBOR3M_prevM_abs_bp']:.0f}bp",
-        "breach_1d": (abs(tib_diff) > THRESHOLDS["JPY_TIBOR3M_prevM_abs_bp"]) if pd.notna(tib_diff) else np.nan,
-        "note": f"MTD={tib_cur:.4f}, PrevM={tib_prev:.4f}" if pd.notna(tib_diff) else "데이터/틱커 확인 필요",
-    })
 
-# ---- (N) 한국 5Y CDS: PrevM +100bp 3D / M-3 +200bp 3D ----
-if has_data(series_map.get("Korea", pd.Series(dtype=float))):
-    cds_kr = series_map["Korea"]
-    prevM_avg = month_avg(cds_kr, 1)
-    m3_avg = month_avg(cds_kr, 3)
+def write_columnar(df, stem, fmt=None):
+    """DataFrame 1개 → stem + 형식 확장자 (feather 는 인덱스를 열로 풀어서 저장) / 반환: 경로"""
+    fmt = _columnar_format(fmt)
+    path = Path(str(stem) + _COLUMNAR_SUFFIX[fmt])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == "parquet":
+        df.to_parquet(path, compression="zstd")
+    elif fmt == "feather":
+        df.reset_index().to_feather(path, compression="zstd")
+    else:
+        df.to_pickle(path)
+    return path
 
-    if pd.notna(prevM_avg):
-        dev_prev = cds_kr - prevM_avg
-        rows.append({
-            "metric": "KR 5Y CDS vs PrevM (3D consec)",
-            "ticker": CDS_TICKERS["Korea"],
-            "latest": last_value(cds_kr),
-            "threshold_1d": f"> +{THRESHOLDS['KR5YCDS_prevM_bp_3d']:.0f}bp for 3D",
-            "breach_1d": consec_last_n(dev_prev > THRESHOLDS["KR5YCDS_prevM_bp_3d"], 3),
-            "note": f"PrevM avg={prevM_avg:.1f}bp",
-        })
 
-    if pd.notna(m3_avg):
-        dev_m3 = cds_kr - m3_avg
-        rows.append({
-            "metric": "KR 5Y CDS vs M-3 (3D consec)",
-            "ticker": CDS_TICKERS["Korea"],
-            "latest": last_value(cds_kr),
-            "threshold_1d": f"> +{THRESHOLDS['KR5YCDS_M3ago_bp_3d']:.0f}bp for 3D",
-            "breach_1d": consec_last_n(dev_m3 > THRESHOLDS["KR5YCDS_M3ago_bp_3d"], 3),
-            "note": f"M-3 avg={m3_avg:.1f}bp",
-        })
+def read_columnar(stem):
+    """write_columnar 로 저장한 파일 읽기 (있는 확장자 순서대로: parquet → feather → pickle)"""
+    for fmt, suffix in _COLUMNAR_SUFFIX.items():
+        path = Path(str(stem) + suffix)
+        if path.exists():
+            if fmt == "parquet":
+                return pd.read_parquet(path)
+            if fmt == "feather":
+                df = pd.read_feather(path)
+                return df.set_index(df.columns[0]) if df.columns[0] in ("Date", "index") else df
+            return pd.read_pickle(path)
+    raise FileNotFoundError(f"열 단위 파일 없음: {stem}.*")
 
-# ---- (O) KR Term Spread (10Y-3Y): 5D 역전 지속 ----
-if has_data(series_map.get("KR10Y", pd.Series(dtype=float))) and has_data(series_map.get("KR3Y", pd.Series(dtype=float))):
-    term_spread = (series_map["KR10Y"] - series_map["KR3Y"]) * 100.0
-    rows.append({
-        "metric": "KR Term Spread 10Y-3Y (5D inversion)",
-        "ticker": f"{TICKERS['KR10Y']} - {TICKERS['KR3Y']}",
-        "latest": float(term_spread.dropna().iloc[-1]) if term_spread.dropna().size else np.nan,
-        "threshold_1d": "< 0bp for 5D",
-        "breach_1d": consec_last_n(term_spread <= 0.0, THRESHOLDS["KR_10Y_3Y_inversion_5d"]) if term_spread.dropna().size else np.nan,
-        "note": "10Y-3Y ≤ 0bp 상태 5D 연속",
-    })
 
-# ---- (P) 국가별 CDS 17개국: 전월 평균 대비 +30% 상승 ----
-for country, bb in CDS_TICKERS.items():
-    if country == "Korea":
-        continue  # 한국은 위에서 bp 기준 3D 연속 로직 적용
-    s = series_map.get(country, pd.Series(dtype=float))
-    if has_data(s):
-        mtd, prev = month_avg(s, 0), month_avg(s, 1)
-        pct_up = ((mtd / prev - 1.0) * 100.0) if (pd.notna(mtd) and pd.notna(prev) and prev != 0) else np.nan
-        rows.append({
-            "metric": f"CDS 5Y: {country} (MTD vs PrevM)",
-            "ticker": bb,
-            "latest": last_value(s),
-            "chg_1d": f"{pct_up:.1f}%" if pd.notna(pct_up) else np.nan,
-            "threshold_1d": f"> +{THRESHOLDS['CDS_prevM_pct_up']:.0f}%",
-            "breach_1d": (pct_up > THRESHOLDS["CDS_prevM_pct_up"]) if pd.notna(pct_up) else np.nan,
-            "note": f"MTD={mtd:.1f}, PrevM={prev:.1f}" if pd.notna(pct_up) else "데이터/틱커 확인 필요",
-        })
+def columnar_stem(day, kind, out_dir=None):
+    """COLUMNAR_DIR/risk_{kind}_YYYYMMDD (kind: alerts | raw)"""
+    return Path(out_dir or COLUMNAR_DIR) / f"risk_{kind}_{pd.Timestamp(day):%Y%m%d}"
 
-# ---- (Q) (회사채/국고) 3Y 비율: 전월평균 대비 +16% 상승 ----
-if has_data(series_map.get("KR3Y", pd.Series(dtype=float))) and has_data(series_map.get("KR_CORP3Y_AA-", pd.Series(dtype=float))):
-    ktb3y_mtd  = month_avg(series_map["KR3Y"], 0)
-    corp3y_mtd = month_avg(series_map["KR_CORP3Y_AA-"], 0)
-    ktb3y_prev  = month_avg(series_map["KR3Y"], 1)
-    corp3y_prev = month_avg(series_map["KR_CORP3Y_AA-"], 1)
-
-    ratio_cur  = (ktb3y_mtd / corp3y_mtd) if (pd.notna(ktb3y_mtd) and pd.notna(corp3y_mtd) and corp3y_mtd != 0) else np.nan
-    ratio_prev = (ktb3y_prev / corp3y_prev) if (pd.notna(ktb3y_prev) and pd.notna(corp3y_prev) and corp3y_prev != 0) else np.nan
-    ratio_pct  = ((ratio_cur / ratio_prev - 1.0) * 100.0) if (pd.notna(ratio_cur) and pd.notna(ratio_prev) and ratio_prev != 0) else np.nan
-
-    rows.append({
-        "metric": "KTB3Y / Corp(AA-) 3Y (MTD vs PrevM)",
-        "ticker": "KR3Y / KR_CORP3Y_AA-",
-        "chg_1d": f"{ratio_pct:.1f}%" if pd.notna(ratio_pct) else np.nan,
-        "threshold_1d": f"> +{THRESHOLDS['CorpAAminus_KTB3Y_ratio_prevM_pct']:.0f}%",
-        "breach_1d": (ratio_pct > THRESHOLDS["CorpAAminus_KTB3Y_ratio_prevM_pct"]) if pd.notna(ratio_pct) else np.nan,
-        "note": f"MTD={ratio_cur:.4f}, PrevM={ratio_prev:.4f}" if pd.notna(ratio_pct) else "데이터/틱커 확인 필요",
-    })
 
-# ---- (R) 월평균 장단기 (금융채1Y - CD3M): MTD 스프레드 ≥ +70bp ----
-if has_data(series_map.get("KR_FIN1Y_AAA", pd.Series(dtype=float))) and has_data(series_map.get("KR_CD3M", pd.Series(dtype=float))):
-    fin1y_mtd = month_avg(series_map["KR_FIN1Y_AAA"], 0)
-    cd3m_mtd  = month_avg(series_map["KR_CD3M"], 0)
-    fin_cd_bp = (fin1y_mtd - cd3m_mtd) * 100.0 if pd.notna(fin1y_mtd) and pd.notna(cd3m_mtd) else np.nan
-    rows.append({
-        "metric": "(MTD) Fin 1Y - CD 3M",
-        "ticker": f"{TICKERS['KR_FIN1Y_AAA']} - {TICKERS['KR_CD3M']}",
-        "chg_1d": f"{fin_cd_bp:.1f}bp" if pd.notna(fin_cd_bp) else np.nan,
-        "threshold_1d": f"≥ +{THRESHOLDS['Fin1Y_minus_CD3M_MTD_bp']:.0f}bp",
-        "breach_1d": (fin_cd_bp >= THRESHOLDS["Fin1Y_minus_CD3M_MTD_bp"]) if pd.notna(fin_cd_bp) else np.nan,
-        "note": f"MTD Fin1Y={fin1y_mtd:.4f}, CD3M={cd3m_mtd:.4f}" if pd.notna(fin_cd_bp) else "데이터/틱커 확인 필요",
-    })
+def write_columnar_outputs(day, alerts_df, hist, out_dir=None, fmt=None):
+    """기본 출력: alerts(타입 고정) + raw_data(Date 인덱스, float 열) → [경로, 경로]"""
+    raw_df = hist.copy()
+    raw_df.index.name = "Date"
+    raw_df.columns = [str(c) for c in raw_df.columns]
+    return [write_columnar(typed_alerts(alerts_df), columnar_stem(day, "alerts", out_dir), fmt),
+            write_columnar(raw_df, columnar_stem(day, "raw", out_dir), fmt)]
+
+
+def _excel_cells(df):
+    """DataFrame → 행 단위 셀 값 (NaN/NA → 빈 셀, Timestamp → datetime)"""
+    obj = df.astype(object).where(df.notna(), None)
+    for c, dt in df.dtypes.items():
+        if pd.api.types.is_datetime64_any_dtype(dt):
+            obj[c] = [v.to_pydatetime() if v is not None else None for v in obj[c]]
+    return obj.itertuples(index=False, name=None)
+
+
+def _write_sheets_streaming(path, sheets):
+    """openpyxl write-only 워크북: 시트마다 헤더 1행 + 데이터 행을 순서대로 append (셀 객체를 메모리에 두지 않음)"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    for name, df in sheets:
+        ws = wb.create_sheet(name)
+        header = []
+        for c in df.columns:
+            cell = WriteOnlyCell(ws, value=str(c))
+            cell.font = Font(bold=True)
+            header.append(cell)
+        ws.append(header)
+        for row in _excel_cells(df):
+            ws.append(row)
+    wb.save(path)
 
-# ---- (S) Fin1Y AAA - KTB1Y: 5영업일 연속 ≥ +50bp ----
-if has_data(series_map.get("KR_FIN1Y_AAA", pd.Series(dtype=float))) and has_data(series_map.get("KR1Y", pd.Series(dtype=float))):
-    fin_minus_ktb1y = (series_map["KR_FIN1Y_AAA"] - series_map["KR1Y"]) * 100.0
-    rows.append({
-        "metric": "Fin 1Y(AAA) - KTB 1Y (5D consec ≥50bp)",
-        "ticker": f"{TICKERS['KR_FIN1Y_AAA']} - {TICKERS['KR1Y']}",
-        "latest": float(fin_minus_ktb1y.dropna().iloc[-1]) if fin_minus_ktb1y.dropna().size else np.nan,
-        "threshold_1d": f"≥ +{THRESHOLDS['Fin1YAAA_minus_KTB1Y_5d_bp']:.0f}bp for 5D",
-        "breach_1d": consec_last_n(fin_minus_ktb1y >= THRESHOLDS["Fin1YAAA_minus_KTB1Y_5d_bp"], 5) if fin_minus_ktb1y.dropna().size else np.nan,
-        "note": "레벨 기준(일별 스프레드)",
-    })
 
-# ---- (T) S&P 500: 1일 ≤ -3%, 10일 ≤ -12% ----
-if has_data(series_map.get("SPX", pd.Series(dtype=float))):
-    spx_1d = pct_change(series_map["SPX"], 1)
-    spx_10d = pct_change(series_map["SPX"], 10)
-    rows.append({
-        "metric": "S&P 500",
-        "ticker": TICKERS["SPX"],
-        "latest": last_value(series_map["SPX"]),
-        "chg_1d": f"{spx_1d:.2f}%" if pd.notna(spx_1d) else np.nan,
-        "threshold_1d": "≤ -3.0%",
-        "breach_1d": (spx_1d <= THRESHOLDS["SPX_1d_down_pct"]) if pd.notna(spx_1d) else np.nan,
-        "chg_10d": f"{spx_10d:.2f}%" if pd.notna(spx_10d) else np.nan,
-        "threshold_10d": "≤ -12.0%",
-        "breach_10d": (spx_10d <= THRESHOLDS["SPX_10d_down_pct"]) if pd.notna(spx_10d) else np.nan,
-        "note": "하락만 트리거",
-    })
+def write_thresholds_excel(path, alerts_df, hist, issues=None, extra=None, streaming=None):
+    """
+    risk_thresholds 엑셀 (alerts + raw_data [+ extra 시트들] [+ fetch_issues]) - 일일 실행/과거 재생성 공통
+    - streaming=True(기본 EXCEL_STREAMING): write-only 행 단위 기록 / False: pandas ExcelWriter
+    """
+    raw_df = hist.copy()
+    raw_df.index.name = "Date"
+    sheets = [("alerts", alerts_df), ("raw_data", raw_df.reset_index())]
+    sheets += list((extra or {}).items())
+    if issues:
+        # 조회 실패/격리 티커 (같은 티커가 여러 번 조회된 경우 마지막 상태만)
+        sheets.append(("fetch_issues", pd.DataFrame(issues).drop_duplicates("ticker", keep="last")))
+    if EXCEL_STREAMING if streaming is None else streaming:
+        _write_sheets_streaming(path, sheets)
+        return
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for name, df in sheets:
+            df.to_excel(writer, sheet_name=name, index=False)
+
+
+class AlertArchive:
+    """
+    일별 alerts 행 누적 저장소 (SQLite 1파일) - 키 (date, metric), 엑셀을 열지 않고 조회
+    - 날짜 단위 append: 과거 날짜 행은 건드리지 않고, 같은 날짜를 다시 쓰면(overwrite=True) 그 날짜 행만 교체
+    - row_no: 그날 alerts 행 순서 (1부터, 엑셀 2행 = row_no 1 → C1 업데이트의 IND 번호 매핑에 사용)
+    - 인덱스: (date, metric) 기본키 → 최신일/기간 조회, (metric, date) → 지표별 이력
+    - 파일이 처음 생길 때 seed_dir 의 기존 risk_thresholds_YYYYMMDD.xlsx alerts 시트를 1번 가져옴
+    """
 
-# ---- (U) EuroStoxx50: 1일 |Δ| ≥ 3%, 10일 ≤ -12% ----
-if has_data(series_map.get("SX5E", pd.Series(dtype=float))):
-    sx_1d = pct_change(series_map["SX5E"], 1)
-    sx_10d = pct_change(series_map["SX5E"], 10)
-    rows.append({
-        "metric": "EuroStoxx50",
-        "ticker": TICKERS["SX5E"],
-        "latest": last_value(series_map["SX5E"]),
-        "chg_1d": f"{sx_1d:.2f}%" if pd.notna(sx_1d) else np.nan,
-        "threshold_1d": f"abs ≥ {THRESHOLDS['SX5E_1d_abs_pct']:.1f}%",
-        "breach_1d": (abs(sx_1d) >= THRESHOLDS["SX5E_1d_abs_pct"]) if pd.notna(sx_1d) else np.nan,
-        "chg_10d": f"{sx_10d:.2f}%" if pd.notna(sx_10d) else np.nan,
-        "threshold_10d": "≤ -12.0%",
-        "breach_10d": (sx_10d <= THRESHOLDS["SX5E_10d_down_pct"]) if pd.notna(sx_10d) else np.nan,
-        "note": "1D는 절대값, 10D는 하락만",
-    })
+    COLS = ["metric", "ticker", "latest", "chg_1d", "threshold_1d", "breach_1d",
+            "chg_10d", "threshold_10d", "breach_10d", "breach_3m", "note"]
+    _BOOL = ("breach_1d", "breach_10d", "breach_3m")
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS alerts (
+            date TEXT NOT NULL, metric TEXT NOT NULL, row_no INTEGER NOT NULL,
+            ticker TEXT, latest REAL, chg_1d TEXT, threshold_1d TEXT, breach_1d INTEGER,
+            chg_10d TEXT, threshold_10d TEXT, breach_10d INTEGER, breach_3m INTEGER, note TEXT,
+            any_breach INTEGER NOT NULL, written_at TEXT NOT NULL,
+            PRIMARY KEY (date, metric)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS ix_alerts_metric_date ON alerts (metric, date);
+    """
+
+    def __init__(self, path, seed_dir=None):
+        self.path = Path(path)
+        fresh = not self.path.exists()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(self._SCHEMA)
+        if fresh and seed_dir is not None:
+            n = self.import_workbooks(seed_dir)
+            if n:
+                print(f"🗄 아카이브 생성: 기존 risk_thresholds 엑셀 {n}개 가져옴 → {self.path.name}")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # 조회/쓰기마다 짧게 연결 (과거 재생성 스레드에서도 그대로 사용, 쓰기 충돌은 timeout 동안 대기)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @classmethod
+    def _records(cls, day, alerts_df):
+        df = alerts_df.reindex(columns=cls.COLS).astype(object)
+        df = df.where(df.notna(), None)
+        for c in cls._BOOL:
+            df[c] = [None if v is None else int(bool(v)) for v in df[c]]
+        hit = df[list(cls._BOOL)].eq(1).any(axis=1).astype(int)
+        stamp = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+        return [(day, str(row[0]), i, *row[1:], int(h), stamp)
+                for i, (row, h) in enumerate(zip(df.itertuples(index=False, name=None), hit), start=1)]
+
+    def append(self, day, alerts_df, overwrite=True):
+        """day 의 alerts 행 저장 → 저장한 행 수 (이미 있는 날짜는 overwrite=True 일 때만 교체, 아니면 0)"""
+        day = pd.Timestamp(day).strftime("%Y-%m-%d")
+        recs = self._records(day, alerts_df)
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM alerts WHERE date = ? LIMIT 1", (day,)).fetchone():
+                if not overwrite:
+                    return 0
+                conn.execute("DELETE FROM alerts WHERE date = ?", (day,))
+            conn.executemany(f"INSERT INTO alerts VALUES ({', '.join('?' * 15)})", recs)
+        return len(recs)
+
+    def import_workbooks(self, folder, overwrite=False):
+        """folder 의 risk_thresholds_YYYYMMDD.xlsx alerts 시트 → 아카이브 (가져온 파일 수)"""
+        n = 0
+        for p in sorted(Path(folder).glob("risk_thresholds_*.xlsx")):
+            m = re.fullmatch(r"risk_thresholds_(\d{8})\.xlsx", p.name)
+            if not m:
+                continue
+            try:
+                df = pd.read_excel(p, sheet_name="alerts")
+            except Exception as e:
+                print(f"⚠️ 아카이브 가져오기 실패: {p.name} ({e})")
+                continue
+            n += bool(self.append(pd.Timestamp(m.group(1)), df, overwrite=overwrite))
+        return n
+
+    def _query(self, sql, params=()):
+        with self._connect() as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        for c in self._BOOL:
+            df[c] = df[c].map({1: True, 0: False}).astype("boolean")
+        return df
+
+    def dates(self):
+        with self._connect() as conn:
+            return [d for (d,) in conn.execute("SELECT DISTINCT date FROM alerts ORDER BY date")]
+
+    def latest_date(self):
+        """가장 최근 저장일 (YYYY-MM-DD, 없으면 None)"""
+        with self._connect() as conn:
+            return conn.execute("SELECT MAX(date) FROM alerts").fetchone()[0]
+
+    def rows(self, day=None):
+        """그날 alerts 행 (row_no 순 = 엑셀 행 순서), day=None 이면 최신일"""
+        day = self.latest_date() if day is None else pd.Timestamp(day).strftime("%Y-%m-%d")
+        return self._query("SELECT * FROM alerts WHERE date = ? ORDER BY row_no", (day,))
+
+    def between(self, start, end=None, breached_only=False):
+        """start~end 기간 행 (date, row_no 순)"""
+        end = pd.Timestamp(end or TODAY).strftime("%Y-%m-%d")
+        sql = "SELECT * FROM alerts WHERE date BETWEEN ? AND ?" + (" AND any_breach = 1" if breached_only else "")
+        return self._query(sql + " ORDER BY date, row_no", (pd.Timestamp(start).strftime("%Y-%m-%d"), end))
+
+    def history(self, metric, start=None, end=None):
+        """지표 1개의 날짜별 행 (metric, date 인덱스 사용)"""
+        start = pd.Timestamp(start).strftime("%Y-%m-%d") if start else "0000-00-00"
+        end = pd.Timestamp(end).strftime("%Y-%m-%d") if end else "9999-99-99"
+        return self._query("SELECT * FROM alerts WHERE metric = ? AND date BETWEEN ? AND ? ORDER BY date",
+                           (metric, start, end))
+
+
+def bench_outputs(alerts_df, hist, repeat=3, out_dir=None):
+    """
+    저장 형식별 alerts + raw_data 쓰기 시간(중앙값)/파일 크기 비교 → DataFrame
+    [format, sec, size_kb, speedup, size_ratio] (기준: pandas ExcelWriter 엑셀)
+    """
+    import tempfile
+    import shutil
+
+    tmp = Path(out_dir or tempfile.mkdtemp(prefix="risk_bench_"))
+    tmp.mkdir(parents=True, exist_ok=True)
+
+    def excel(streaming):
+        def fn(d):
+            write_thresholds_excel(d / "x.xlsx", alerts_df, hist, streaming=streaming)
+            return [d / "x.xlsx"]
+        return fn
+
+    cases = {"excel (pandas)": excel(False), "excel (streaming)": excel(True)}
+    for fmt in ("parquet", "feather", "pickle"):
+        if _columnar_format(fmt) == fmt:
+            cases[fmt] = lambda d, fmt=fmt: write_columnar_outputs(TODAY, alerts_df, hist, d, fmt)
+    out = []
+    try:
+        for name, fn in cases.items():
+            secs, paths = [], []
+            for i in range(repeat):
+                d = tmp / f"{name.split()[0]}_{i}"
+                d.mkdir(exist_ok=True)
+                t0 = time.perf_counter()
+                paths = fn(d)
+                secs.append(time.perf_counter() - t0)
+            out.append({"format": name, "sec": float(np.median(secs)),
+                        "size_kb": sum(p.stat().st_size for p in paths) / 1024})
+    finally:
+        if out_dir is None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    df = pd.DataFrame(out)
+    df["speedup"] = df["sec"].iloc[0] / df["sec"]
+    df["size_ratio"] = df["size_kb"] / df["size_kb"].iloc[0]
+    return df
+
+
+alerts_df = build_alerts_df(rows)
+# 텔레그램 셀 인계용 (같은 프로세스에서 실행되면 엑셀을 다시 읽지 않음)
+ALERT_RECORDS = alert_records(alerts_df)
+ALERT_RECORDS_DATE = TODAY
+_t_write = time.perf_counter()
+if COLUMNAR_OUTPUT:
+    if _columnar_format() != COLUMNAR_FORMAT:
+        print(f"⚠️ {COLUMNAR_FORMAT} 저장에 pyarrow 필요 → pickle 로 저장 (pip install pyarrow)")
+    columnar_paths = write_columnar_outputs(TODAY, alerts_df, hist)
+    print(f"✅ 저장 완료: {', '.join(p.name for p in columnar_paths)} ({COLUMNAR_DIR})")
+if EXCEL_EXPORT:
+    _extra = {"cds_stress": CDS_STRESS}
+    if ALERT_STATES is not None:
+        _extra["alert_state"] = ALERT_STATES.table()
+    write_thresholds_excel(output_path, alerts_df, hist, FETCH_ISSUES, extra=_extra)
+    print(f"✅ 저장 완료: {output_path}")
+ALERT_ARCHIVE = None
+if ARCHIVE:
+    ALERT_ARCHIVE = AlertArchive(ARCHIVE_PATH, seed_dir=output_path.parent)
+    _n = ALERT_ARCHIVE.append(TODAY, alerts_df)
+    print(f"🗄 아카이브 저장: {TODAY} {_n}행 → {ARCHIVE_PATH.name} (누적 {len(ALERT_ARCHIVE.dates())}일)")
+print(f"💾 저장 시간 {time.perf_counter() - _t_write:.2f}s")
+if OUTPUT_BENCH:
+    print("⏱ 저장 형식 비교 (alerts + raw_data):")
+    print(bench_outputs(alerts_df, hist).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+run_report = write_run_report(RUN_REPORT_PATH, panel, time.perf_counter() - RUN_STARTED)
+print(f"📊 실행 리포트: {RUN_REPORT_PATH.name} (BDH {run_report['bdh_units']}건, "
+      f"필드 변경 {sum(k['field_changed'] for k in run_report['keys'])}개, "
+      f"보정 50% 이상 {sum((k['synth_pct'] or 0) >= 50 for k in run_report['keys'])}개)")
+print("▶ alerts 미리보기 (상위 20행):")
+print(alerts_df.head(20))
 
-# ---- (V) 3M FRA-OIS: PrevM 대비 +30bp ----
-if has_data(series_map.get("US_FRAOIS_3M", pd.Series(dtype=float))):
-    fraois_mtd  = month_avg(series_map["US_FRAOIS_3M"], 0)
-    fraois_prev = month_avg(series_map["US_FRAOIS_3M"], 1)
-    diff_bp = (fraois_mtd - fraois_prev) * 100.0 if pd.notna(fraois_mtd) and pd.notna(fraois_prev) else np.nan
-    rows.append({
-        "metric": "USD 3M FRA-OIS (MTD - PrevM)",
-        "ticker": TICKERS["US_FRAOIS_3M"],
-        "chg_1d": f"{diff_bp:.1f}bp (Δavg)" if pd.notna(diff_bp) else np.nan,
-        "threshold_1d": f"> +{THRESHOLDS['FRAOIS_prevM_bp']:.0f}bp",
-        "breach_1d": (diff_bp > THRESHOLDS["FRAOIS_prevM_bp"]) if pd.notna(diff_bp) else np.nan,
-        "note": f"MTD={fraois_mtd:.2f}, PrevM={fraois_prev:.2f}" if pd.notna(diff_bp) else "데이터/틱커 확인 필요",
-    })
 
 # -----------------------------
-# 7) 엑셀 저장 (alerts + raw_data)
+# 7-1) 백테스트 (BACKTEST=True 일 때만)
 # -----------------------------
-alerts_df = pd.DataFrame(rows)
+if BACKTEST:
+    bt_panel = load_cached_panel(panel.key_prefs) if BACKTEST_FROM_CACHE else panel
+    if bt_panel is None:
+        print("⚠️ 백테스트: 히스토리 캐시가 비어 있음 → 이번 조회 구간으로 대체")
+        bt_panel = panel
+    bt_breaches, bt_summary = run_backtest(bt_panel, RULES)
+    with pd.ExcelWriter(BACKTEST_PATH, engine="openpyxl") as writer:
+        bt_summary.to_excel(writer, sheet_name="summary", index=False)
+        bt_breaches.reset_index().to_excel(writer, sheet_name="breaches", index=False)
+    print(f"🧪 백테스트 저장: {BACKTEST_PATH} ({bt_panel.index[0]:%Y-%m-%d}~{bt_panel.index[-1]:%Y-%m-%d}, "
+          f"{len(bt_panel.index)}일 x 룰 {len(bt_summary)}개)")
+    print(bt_summary.sort_values("fires", ascending=False).head(10)[["metric", "slot", "fires", "first_fire", "last_fire"]])
 
-order_cols = [
-    "metric","ticker","latest",
-    "chg_1d","threshold_1d","breach_1d",
-    "chg_10d","threshold_10d","breach_10d",
-    "breach_3m","note",
-]
-for c in order_cols:
-    if c not in alerts_df.columns:
-        alerts_df[c] = np.nan
 
-alerts_df = alerts_df[order_cols]
+# -----------------------------
+# 7-1-1) 임계값 민감도 스윕 (SWEEP=True 일 때만)
+# -----------------------------
+if SWEEP:
+    sw_panel = load_cached_panel(panel.key_prefs) if BACKTEST_FROM_CACHE else panel
+    if sw_panel is None:
+        sw_panel = panel
+    sw_grid = sweep_grid(RULES, grid=SWEEP_GRID)
+    t0 = time.perf_counter()
+    sweep_df = run_sweep(sw_panel, RULES, sw_grid)
+    with pd.ExcelWriter(SWEEP_PATH, engine="openpyxl") as writer:
+        sweep_df.to_excel(writer, sheet_name="sensitivity", index=False)
+    print(f"🎚 민감도 스윕 저장: {SWEEP_PATH} (임계 키 {len(sw_grid)}개, 후보값 {sum(map(len, sw_grid.values()))}개, "
+          f"{len(sw_panel.index)}일, {time.perf_counter() - t0:.2f}s)")
+    # 키별 후보값 → 전체 발생 횟수 ([ ] = 현재값)
+    for key, g in sweep_df.groupby("threshold", sort=False):
+        fires = g.groupby(["value", "current"], sort=False)["fires"].sum()
+        print(f"  {key}: " + " | ".join(f"[{v:g}]→{n}" if cur else f"{v:g}→{n}" for (v, cur), n in fires.items()))
+
 
-with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-    alerts_df.to_excel(writer, sheet_name="alerts", index=False)
-    raw_df = hist.copy()
-    raw_df.index.name = "Date"
-    raw_df.reset_index().to_excel(writer, sheet_name="raw_data", index=False)
+# -----------------------------
+# 7-2) 과거 날짜 재생성 (BACKFILL=True 일 때만)
+# -----------------------------
+def backfill_asof(start, end=None, key_prefs=None, out_dir=None, overwrite=BACKFILL_OVERWRITE,
+                  workers=BACKFILL_WORKERS):
+    """
+    start~end 영업일마다 risk_thresholds_YYYYMMDD.xlsx 를 히스토리 캐시로 재생성 (BDH 조회 없음)
+    - 캐시는 1번만 읽고, 날짜별 평가+엑셀 저장을 스레드 풀로 분산
+    - 이미 있는 파일은 overwrite=True 일 때만 다시 씀
+    - 캐시 시작일이 그날 420일 구간보다 늦으면 short_history=True (raw_data 시트가 일일 실행보다 짧음)
+    반환: DataFrame [date, path, status, breaches, short_history, sec]
+    """
+    if start is None:
+        raise ValueError("backfill_asof: 시작일(start)이 필요합니다 (예: \"2025-10-01\")")
+    key_prefs = key_prefs or panel.key_prefs
+    out_dir = Path(out_dir or output_path.parent)
+    raw = load_cached_raw(key_prefs)
+    if raw is None:
+        print("⚠️ 과거 재생성: 히스토리 캐시가 비어 있음")
+        return pd.DataFrame(columns=["date", "path", "status", "breaches", "short_history", "sec"])
+    dates = pd.bdate_range(start, end or pd.Timestamp(TODAY) - timedelta(days=1))
+
+    def one(d):
+        path = out_dir / f"risk_thresholds_{d:%Y%m%d}.xlsx"
+        res = {"date": d.strftime("%Y-%m-%d"), "path": str(path), "status": "", "breaches": np.nan,
+               "short_history": bool(raw.index[0] > d - timedelta(days=420)), "sec": 0.0}
+        if path.exists() and not overwrite:
+            res["status"] = "exists"
+            return res
+        t0 = time.perf_counter()
+        try:
+            rows_, sub = evaluate_asof(raw, key_prefs, d)
+            if rows_ is None:
+                res["status"] = "no data"
+                return res
+            df = build_alerts_df(rows_)
+            write_thresholds_excel(path, df, sub.to_frame())
+            if COLUMNAR_OUTPUT:
+                write_columnar_outputs(d, df, sub.to_frame())
+            if ALERT_ARCHIVE is not None:
+                ALERT_ARCHIVE.append(d, df, overwrite=overwrite)
+            res["breaches"] = int(df[["breach_1d", "breach_10d", "breach_3m"]].eq(True).any(axis=1).sum())
+            res["status"] = "written"
+        except Exception as e:
+            res["status"] = f"error: {type(e).__name__}: {e}"
+        res["sec"] = round(time.perf_counter() - t0, 3)
+        return res
+
+    t0 = time.perf_counter()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        report = pd.DataFrame(list(ex.map(one, dates)))
+    n = report["status"].value_counts() if len(report) else pd.Series(dtype=int)
+    print(f"🗂 과거 재생성: {len(dates)}영업일 ({dates[0]:%Y-%m-%d}~{dates[-1]:%Y-%m-%d}) → "
+          f"작성 {n.get('written', 0)}, 기존 유지 {n.get('exists', 0)}, 데이터 없음 {n.get('no data', 0)}, "
+          f"실패 {int(report['status'].str.startswith('error').sum())} / {time.perf_counter() - t0:.1f}s"
+          if len(dates) else "🗂 과거 재생성: 대상 영업일 없음")
+    short = report[report["status"].eq("written") & report["short_history"]] if len(report) else report
+    if len(short):
+        print(f"⚠️ 히스토리 캐시 시작일({raw.index[0]:%Y-%m-%d})이 420일 구간보다 늦은 날짜 {len(short)}개 "
+              f"({short['date'].iloc[0]}~{short['date'].iloc[-1]}) → raw_data 가 일일 실행보다 짧음")
+    return report
+
+
+if BACKFILL and BACKFILL_FROM is None:
+    print("⚠️ 과거 재생성 생략: BACKFILL_FROM(시작일, 예: \"2025-10-01\")을 지정하세요")
+elif BACKFILL:
+    backfill_report = backfill_asof(BACKFILL_FROM, BACKFILL_TO)
+
+
+# -----------------------------
+# 8) 장중 실시간 모니터 (LIVE_MONITOR=True 일 때만)
+# -----------------------------
+class FakeTickSource:
+    """터미널 없이 쓰는 가상 틱 소스: 키별 마지막 값에서 랜덤워크 (rate: 초당 틱 수)"""
+
+    def __init__(self, last_values, rate=FAKE_TICK_RATE, vol=5e-4, seed=0):
+        self.last = dict(last_values)
+        self.rate = rate
+        self.vol = vol
+        self.rng = np.random.default_rng(seed)
+        self._running = False
+        self._thread = None
+
+    def start(self, emit):
+        keys = list(self.last)
+        self._running = True
+
+        def loop():
+            burst = max(1, self.rate // 100)   # 10ms 마다 burst 개씩
+            while self._running:
+                t0 = time.perf_counter()
+                for i, step in zip(self.rng.integers(len(keys), size=burst), self.rng.normal(0, self.vol, burst)):
+                    key = keys[i]
+                    self.last[key] *= 1.0 + step
+                    emit(key, self.last[key])
+                time.sleep(max(0.0, 0.01 - (time.perf_counter() - t0)))
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+
+
+class BlpapiTickSource:
+    """blpapi //blp/mktdata 구독 → emit(키, 값) (LIVE_FIELDS 중 먼저 들어온 필드 사용)"""
+
+    def __init__(self, subscriptions, fields=LIVE_FIELDS, host="localhost", port=8194):
+        self.subscriptions = dict(subscriptions)   # {키: 블룸버그 티커}
+        self.fields = list(fields)
+        self.host, self.port = host, port
+        self.session = None
+        self._running = False
+        self._thread = None
+
+    def start(self, emit):
+        import blpapi
+
+        opts = blpapi.SessionOptions()
+        opts.setServerHost(self.host)
+        opts.setServerPort(self.port)
+        self.session = blpapi.Session(opts)
+        if not self.session.start() or not self.session.openService("//blp/mktdata"):
+            raise RuntimeError("blpapi 세션/서비스(//blp/mktdata) 시작 실패 - 터미널 로그인 확인")
+
+        keys = list(self.subscriptions)
+        subs = blpapi.SubscriptionList()
+        for i, key in enumerate(keys):
+            subs.add(self.subscriptions[key], self.fields, [], blpapi.CorrelationId(i))
+        self.session.subscribe(subs)
+        self._running = True
+
+        def loop():
+            while self._running:
+                ev = self.session.nextEvent(500)
+                if ev.eventType() != blpapi.Event.SUBSCRIPTION_DATA:
+                    continue
+                for msg in ev:
+                    key = keys[msg.correlationIds()[0].value()]
+                    for f in self.fields:
+                        if msg.hasElement(f) and not msg.getElement(f).isNull():
+                            emit(key, msg.getElementAsFloat(f))
+                            break
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        if self.session is not None:
+            self.session.stop()
+
+
+def _breached(row):
+    return any(isinstance(row.get(c), (bool, np.bool_)) and bool(row[c]) for c in ("breach_1d", "breach_10d", "breach_3m"))
+
+
+class LiveThresholdMonitor:
+    """
+    실시간 틱 → 패널 마지막 행 제자리 갱신 → 영향받는 룰만 재평가
+    - 롤링 상태(ROLLING)가 있으면 마지막 값 교체도 O(1) 로 반영 → 룰 평가가 히스토리 길이와 무관
+    - 들어온 틱은 키별 최신값 1개로 합치고(coalesce), 큐에는 '갱신 대기 키'만 1번씩 넣음
+      → 틱이 몰려도 큐 크기는 구독 키 수 이내, 최신값은 버려지지 않음 (큐가 차면 소스 쪽이 대기)
+    - 한 번에 최대 batch_max 개 키를 꺼내 반영하고 해당 룰만 평가
+    - rows(): 일일 배치와 같은 순서의 alerts 행 목록
+    """
 
-print(f"✅ 저장 완료: {output_path}")
-print("▶ alerts 미리보기 (상위 20행):")
-print(alerts_df.head(20))
+    def __init__(self, panel, source, queue_max=LIVE_QUEUE_MAX, batch_max=LIVE_BATCH_MAX):
+        self.panel = panel
+        self.source = source
+        self.batch_max = batch_max
+        self.q = queue.Queue(maxsize=queue_max)
+        self._pending = {}   # {키: (최신값, 첫 틱 도착 시각)}
+        self._lock = threading.Lock()
+        self.stats = {"received": 0, "coalesced": 0, "applied": 0, "batches": 0, "rule_evals": 0,
+                      "max_latency_ms": 0.0}
+        # 오늘 행이 없으면(장 시작 전 배치) 직전 값으로 추가 → 틱은 항상 마지막 행에 반영
+        if self.panel.extend_to(TODAY) and ROLLING is not None:
+            ROLLING.sync(self.panel, RULES)   # 메모리에서만 (당일 행은 저장하지 않음)
+        self.rules_by_key = {}
+        for rule in RULES:
+            for k in rule.deps:
+                self.rules_by_key.setdefault(k, []).append(rule.name)
+        self.rule_rows = evaluate_rules(self.panel)
+
+    def offer(self, key, value):
+        """소스 스레드에서 호출: 같은 키의 대기 중인 틱이 있으면 값만 덮어씀"""
+        with self._lock:
+            self.stats["received"] += 1
+            prev = self._pending.get(key)
+            self._pending[key] = (value, prev[1] if prev else time.perf_counter())
+        if prev is None:
+            self.q.put((key,))
+        else:
+            self.stats["coalesced"] += 1
+
+    def process_batch(self, timeout=0.5):
+        """갱신 대기 키를 최대 batch_max 개 꺼내 반영 → 상태가 바뀐 (룰, 행) 목록"""
+        try:
+            keys = [self.q.get(timeout=timeout)[0]]
+        except queue.Empty:
+            return []
+        while len(keys) < self.batch_max:
+            try:
+                keys.append(self.q.get_nowait()[0])
+            except queue.Empty:
+                break
+        with self._lock:
+            latest = {k: self._pending.pop(k) for k in keys}
+
+        affected, first_ts = set(), min(t for _, t in latest.values())
+        for key, (value, _) in latest.items():
+            if key in self.panel and np.isfinite(value):
+                self.panel.set_last(key, value)
+                if ROLLING is not None:
+                    ROLLING.replace_last(self.panel, key)
+                affected.update(self.rules_by_key.get(key, ()))
+        self.stats["applied"] += len(latest)
+
+        new_rows = evaluate_rules(self.panel, affected)
+        changes = []
+        for name, rows_ in new_rows.items():
+            before = {r["metric"]: _breached(r) for r in self.rule_rows.get(name, [])}
+            for r in rows_:
+                if _breached(r) != before.get(r["metric"], False):
+                    changes.append((name, r))
+            self.rule_rows[name] = rows_
+        self.stats["batches"] += 1
+        self.stats["rule_evals"] += len(new_rows)
+        lat = (time.perf_counter() - first_ts) * 1000.0
+        self.stats["max_latency_ms"] = max(self.stats["max_latency_ms"], lat)
+        return changes
+
+    def rows(self):
+        return [r for rule in RULES for r in self.rule_rows.get(rule.name, [])]
+
+    def run(self, duration_sec=LIVE_DURATION_SEC):
+        print(f"⚡ 실시간 모니터 시작: {type(self.source).__name__}, 키 {len(self.panel.keys)}개, "
+              f"룰 {len(RULES)}개, {duration_sec}s")
+        self.source.start(self.offer)
+        t0 = time.perf_counter()
+        try:
+            while time.perf_counter() - t0 < duration_sec:
+                for name, r in self.process_batch():
+                    flag = "🚨 신규 초과" if _breached(r) else "✅ 해소"
+                    print(f"  {flag}: {r['metric']} ({r.get('chg_1d', r.get('latest'))})")
+        except KeyboardInterrupt:
+            print("⏹ 실시간 모니터 중단")
+        finally:
+            self.source.stop()
+        el = time.perf_counter() - t0
+        st = self.stats
+        print(f"⚡ 실시간 모니터 종료: 틱 {st['received']:,}개 ({st['received'] / el:,.0f}/s), "
+              f"합침 {st['coalesced']:,}, 반영 {st['applied']:,}, 배치 {st['batches']:,}, "
+              f"룰 평가 {st['rule_evals']:,}회 (전체 재평가 대비 "
+              f"{st['rule_evals'] / max(1, st['batches'] * len(RULES)):.0%}), 최대 지연 {st['max_latency_ms']:.1f}ms")
+        return self.rows()
+
+
+if LIVE_MONITOR:
+    if LIVE_TICK_SOURCE == "fake":
+        tick_source = FakeTickSource({k: last_value(s) for k, s in series_map.items() if has_data(s)})
+    else:
+        tick_source = BlpapiTickSource({**TICKERS, **CDS_TICKERS})
+    live_monitor = LiveThresholdMonitor(panel, tick_source)
+    live_rows = live_monitor.run(LIVE_DURATION_SEC)
 
 
 #!/usr/bin/env python
@@ -722,6 +3291,8 @@ print(alerts_df.head(20))
 - 기존 'risk_thresholds_YYYYMMDD.xlsx' (alerts 시트)를 읽어서
 - breach_1d / breach_10d / breach_3m 중 하나라도 True인 항목만 골라
 - 텔레그램으로 요약 메시지를 전송하고, 마지막 줄에 대시보드 링크를 추가한다.
+- alert_state 시트가 있으면 신규 초과/해소된 항목만 보낸다 (지속 중인 초과는 건수만, 변화 없으면 전송 생략).
+- 임계치 스크립트와 같은 프로세스(노트북)에서 실행하면 엑셀 대신 메모리의 ALERT_RECORDS / ALERT_STATES 를 쓴다.
 
 전제:
 - 앞서 팀장님이 실행하신 Bloomberg/xbbg 스크립트와 동일한 날짜 기준으로
@@ -730,13 +3301,34 @@ print(alerts_df.head(20))
 
 필요 패키지:
     pip install pandas requests openpyxl
+
+전송 방식:
+- 세션(연결 풀) 1개를 재사용, 429 는 retry_after 만큼 / 5xx·연결 오류는 지수 백오프로 제한 횟수 재시도
+- 4096자 제한을 넘는 메시지는 줄 단위로 나눠 순서대로 전송
+- CHAT_IDS 여러 개면 채팅별로 동시에 전송
+- TELEGRAM_MOCK=True 면 로컬 가짜 텔레그램 서버로 보냄 (테스트/지연 벤치마크: bench_telegram_dispatch)
+
+알림 채널:
+- NOTIFY_CHANNELS 의 채널(telegram / email / webhook)에 같은 알림을 동시에 전달
+- 본문은 형식(text / html / json)별로 한 번만 만들어 채널끼리 공유, 채널별 제한 시간(CHANNEL_TIMEOUT_SEC)
+- StubChannel 로 네트워크 없이 점검
 """
 
 from pathlib import Path
 from datetime import date
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.message import EmailMessage
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import html
+import json
+import smtplib
+import threading
+import time
 import pandas as pd
 import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 
 # ==========================
 # 1. 텔레그램 설정값
@@ -746,6 +3338,40 @@ CHAT_ID   = "-4956067497"                                     # 팀장님 채널
 
 TELEGRAM_API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
 
+# - 여러 채팅/채널로 보낼 때 추가 (채팅별로 동시에 전송)
+CHAT_IDS = [CHAT_ID]
+
+# - 전송 설정
+TELEGRAM_MAX_CHARS = 4096   # 텔레그램 메시지 1건 최대 글자 수 → 넘으면 줄 단위로 분할
+SEND_TIMEOUT_SEC = 10
+SEND_RETRIES = 4            # 429/5xx/연결 오류 시 재시도 횟수 (최초 전송 제외)
+SEND_BACKOFF_SEC = 1.0      # 재시도 대기: 1, 2, 4, ... 초 (429 는 retry_after 우선)
+SEND_BACKOFF_MAX_SEC = 30.0
+SEND_WORKERS = 4            # 동시에 보낼 채팅 수 (= 연결 풀 크기)
+
+# - True: 실제 텔레그램 대신 로컬 가짜 서버로 전송 (토큰/채널 없이 점검)
+TELEGRAM_MOCK = False
+
+# ==========================
+# 1-1. 알림 채널 설정
+# ==========================
+# - 알림을 보낼 채널: "telegram" / "email" / "webhook" (동시에 전달, 설정이 빈 채널은 제외)
+NOTIFY_CHANNELS = ["telegram"]
+
+# - 채널별 제한 시간(초): 넘기면 timeout 으로 기록하고 다른 채널 결과를 기다리지 않음
+CHANNEL_TIMEOUT_SEC = {"telegram": 60.0, "email": 30.0, "webhook": 10.0}
+
+# - 이메일 (SMTP, STARTTLS)
+SMTP_HOST = ""
+SMTP_PORT = 587
+SMTP_USER = ""
+SMTP_PASSWORD = ""
+EMAIL_FROM = ""
+EMAIL_TO: list[str] = []
+
+# - 대시보드 웹훅 (json 본문 POST)
+WEBHOOK_URL = ""
+
 # ==========================
 # 2. 파일 경로 설정
 # ==========================
@@ -765,6 +3391,15 @@ def get_risk_excel_path(target_date: date | None = None) -> Path:
     return OUTPUT_DIR / fname
 
 
+# - True: 알림 상태(new/ongoing/cleared) 기준으로 변화만 전송
+#   (상태 파일도 alert_state 시트도 없는 예전 파일이면 기존처럼 breach 전체 전송)
+SEND_ONLY_CHANGES = True
+
+# - 알림 상태 파일 (임계치 스크립트가 갱신): 마지막 전달 이후의 변화를 모아 보내고,
+#   한 채널이라도 전송에 성공하면 항목마다 전달 기록(notified_*)을 남긴다
+ALERT_STATE_PATH = OUTPUT_DIR / "hist_cache" / "alert_state.json"
+
+
 # ==========================
 # 3. 엑셀에서 breach 항목 추출
 # ==========================
@@ -795,6 +3430,76 @@ def load_breach_rows(excel_path: Path) -> pd.DataFrame:
     return breach_df
 
 
+def load_breach_rows_from_records(records: np.recarray) -> pd.DataFrame:
+    """
+    임계치 스크립트가 남긴 alerts 레코드 배열(ALERT_RECORDS, breach_* 는 이미 bool)에서
+    breach 행만 골라 load_breach_rows 와 같은 모양의 DataFrame 으로 반환.
+    """
+    breach_cols = [c for c in records.dtype.names if c.startswith("breach")]
+    if not breach_cols:
+        return pd.DataFrame(records[:0])
+    mask = np.logical_or.reduce([records[c] for c in breach_cols])
+    return pd.DataFrame(records[mask])
+
+
+def load_alert_state(excel_path: Path) -> pd.DataFrame | None:
+    """
+    alert_state 시트 (key, rule, metric, slot, status, first_breached, days, last_cleared, ...) 를 읽는다.
+    시트가 없으면 None.
+    """
+    try:
+        return pd.read_excel(excel_path, sheet_name="alert_state")
+    except ValueError:
+        return None
+
+
+def load_alert_state_store() -> dict | None:
+    """
+    알림 상태 {"version", "asof", "entries"}: 같은 프로세스의 ALERT_STATES, 없으면 alert_state.json.
+    둘 다 없으면 None.
+    """
+    states = globals().get("ALERT_STATES")
+    if states is not None:
+        return {"version": states.VERSION, "asof": states.asof, "entries": states.entries}
+    try:
+        data = json.loads(ALERT_STATE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return data if data.get("version") == 1 else None
+
+
+def pending_alert_state(entries: dict) -> pd.DataFrame:
+    """
+    마지막 전달 이후 아직 알리지 않은 변화 → alert_state 시트와 같은 모양 (status 를 전달 기록 기준으로 다시 계산)
+    - new: 초과 중인데 이번 초과 구간(first_breached)을 아직 알리지 않음 (전송 실패/미실행일의 신규 포함)
+    - ongoing: 이미 알린 초과가 계속됨
+    - cleared: 마지막 전달일 이후 해소 (알리기 전에 시작해 해소된 구간 포함)
+    """
+    cols = ["key", "rule", "metric", "slot", "status", "first_breached", "days", "last_cleared",
+            "severity", "peak_severity"]
+    by_status = {"new": [], "ongoing": [], "cleared": []}
+    for key, e in entries.items():
+        told = e.get("notified_asof")
+        if e.get("active"):
+            announced = e.get("notified_active") and e.get("notified_first") == e.get("first_breached")
+            status = "ongoing" if announced else "new"
+        elif e.get("last_cleared") and (told is None or e["last_cleared"] > told):
+            status = "cleared"
+        else:
+            continue
+        by_status[status].append({**{c: e.get(c) for c in cols}, "key": key, "status": status})
+    return pd.DataFrame([r for recs in by_status.values() for r in recs], columns=cols)
+
+
+def mark_alert_state_notified(store: dict) -> None:
+    """전송 성공 후 모든 항목에 전달 기록을 남기고 저장 → 다음 전송은 이 시점 이후 변화만"""
+    for e in store["entries"].values():
+        e.update(notified_asof=store["asof"], notified_active=bool(e.get("active")),
+                 notified_first=e.get("first_breached"))
+    ALERT_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    ALERT_STATE_PATH.write_text(json.dumps(store, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
 # ==========================
 # 4. 텔레그램 메시지 텍스트 구성
 # ==========================
@@ -807,7 +3512,16 @@ def format_value(x) -> str:
     return str(x)
 
 
-def build_message_from_breach_df(breach_df: pd.DataFrame, target_date: date) -> str:
+def is_breached(x) -> bool:
+    """
+    breach 값 판정: True/1 만 초과로 본다.
+    (엑셀에서 읽은 breach 열은 1.0/0.0/NaN → bool(NaN) 이 True 가 되지 않도록 NaN 은 False)
+    """
+    return not pd.isna(x) and bool(x)
+
+
+def build_message_from_breach_df(breach_df: pd.DataFrame, target_date: date,
+                                 state_df: pd.DataFrame | None = None) -> str:
     """
     breach_df를 기반으로 텔레그램에 보낼 메시지 본문을 구성한다.
 
@@ -819,6 +3533,8 @@ def build_message_from_breach_df(breach_df: pd.DataFrame, target_date: date) ->
         * breach_1d / breach_10d / breach_3m 중 True인 것만 골라서
           변화량 + 기준을 한 줄씩 bullet 로 표시
         * note가 있으면 마지막에 괄호로 추가
+    - state_df(alert_state 시트)가 있으면 breach_df 는 신규 초과 항목만 들어오고,
+      해소 항목과 지속 중인 초과 건수를 뒤에 덧붙인다
     - 마지막 줄에 risk_monitor 링크 추가
     """
     header_lines = [
@@ -829,9 +3545,12 @@ def build_message_from_breach_df(breach_df: pd.DataFrame, target_date: date) ->
 
     body_lines: list[str] = []
 
+    if state_df is not None and not breach_df.empty:
+        body_lines.append("🚨 신규 초과")
     if breach_df.empty:
         # 임계치 초과 항목이 없을 때
-        body_lines.append("오늘은 설정된 임계수준을 초과한 지표가 없습니다.")
+        if state_df is None:
+            body_lines.append("오늘은 설정된 임계수준을 초과한 지표가 없습니다.")
     else:
         # 각 행별로 텍스트 정리
         for idx, row in breach_df.iterrows():
@@ -847,19 +3566,19 @@ def build_message_from_breach_df(breach_df: pd.DataFrame, target_date: date) ->
 
             # 어떤 breach가 발생했는지 정리
             # 1일
-            if bool(row.get("breach_1d", False)):
+            if is_breached(row.get("breach_1d", False)):
                 chg_1d = format_value(row.get("chg_1d", ""))
                 th_1d  = format_value(row.get("threshold_1d", ""))
                 body_lines.append(f"   - 1일 변화: {chg_1d} (기준 {th_1d})")
 
             # 10일
-            if bool(row.get("breach_10d", False)):
+            if is_breached(row.get("breach_10d", False)):
                 chg_10d = format_value(row.get("chg_10d", ""))
                 th_10d  = format_value(row.get("threshold_10d", ""))
                 body_lines.append(f"   - 10일 변화: {chg_10d} (기준 {th_10d})")
 
             # 3개월/기타 기준 (breach_3m 컬럼)
-            if bool(row.get("breach_3m", False)):
+            if is_breached(row.get("breach_3m", False)):
                 note = format_value(row.get("note", ""))
                 if note:
                     body_lines.append(f"   - 3개월/평균 기준 초과: {note}")
@@ -873,6 +3592,23 @@ def build_message_from_breach_df(breach_df: pd.DataFrame, target_date: date) ->
             # 항목 간 구분용 빈 줄
             body_lines.append("")
 
+    if state_df is not None:
+        # 해소: 지표 + 슬롯 + 초과 기간
+        cleared = state_df[state_df["status"] == "cleared"]
+        if not cleared.empty:
+            body_lines.append("✅ 해소")
+            for _, row in cleared.iterrows():
+                body_lines.append(
+                    f"• {format_value(row.get('metric'))} [{format_value(row.get('slot'))}] "
+                    f"{format_value(row.get('first_breached'))} ~ {format_value(row.get('last_cleared'))} "
+                    f"({format_value(row.get('days'))}영업일)"
+                )
+            body_lines.append("")
+        ongoing = state_df[state_df["status"] == "ongoing"]
+        if not ongoing.empty:
+            body_lines.append(f"⏳ 지속 중인 초과 {len(ongoing)}건: " + ", ".join(
+                f"{m} ({d}일째)" for m, d in zip(ongoing["metric"], ongoing["days"])))
+
     # footer: 링크 추가
     footer_lines = [
         "",
@@ -886,65 +3622,529 @@ def build_message_from_breach_df(breach_df: pd.DataFrame, target_date: date) ->
 
 
 # ==========================
-# 5. 텔레그램 전송 함수
+# 5. 텔레그램 전송 (세션 재사용 / 재시도 / 분할 / 다중 채팅)
 # ==========================
-def send_telegram_message(text: str) -> None:
+def split_message(text: str, limit: int = TELEGRAM_MAX_CHARS) -> list[str]:
     """
-    텔레그램 sendMessage API를 호출하여 지정된 CHAT_ID로 메시지를 전송한다.
+    limit 글자 이하 조각으로 분할. 줄 경계에서 자르고,
+    한 줄이 limit 보다 길 때만 줄 중간을 자른다.
     """
-    payload = {
-        "chat_id": CHAT_ID,
-        "text": text,
-        "parse_mode": "HTML",  # 필요시 Markdown 으로 변경 가능
-    }
-    try:
-        resp = requests.post(TELEGRAM_API_URL, data=payload, timeout=10)
+    if len(text) <= limit:
+        return [text]
+    chunks: list[str] = []
+    cur = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if cur:
+                chunks.append(cur)
+                cur = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        cand = line if not cur else cur + "\n" + line
+        if len(cand) <= limit:
+            cur = cand
+        else:
+            chunks.append(cur)
+            cur = line
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+
+class TelegramDispatcher:
+    """
+    텔레그램 sendMessage 전송기
+    - requests.Session 1개(연결 풀 = workers)를 계속 재사용 → 매번 TLS 연결을 새로 맺지 않음
+    - 429: 응답의 parameters.retry_after 초만큼 대기 후 재시도
+      5xx/연결 오류/타임아웃: backoff x 2^n 초 대기 후 재시도 (최대 retries 회)
+      그 밖의 4xx(잘못된 chat_id 등)는 재시도하지 않음
+    - send(): 메시지를 조각으로 나눠 채팅마다 순서대로, 채팅끼리는 동시에 전송
+    """
+
+    def __init__(self, api_url: str = TELEGRAM_API_URL, timeout: float = SEND_TIMEOUT_SEC,
+                 retries: int = SEND_RETRIES, backoff: float = SEND_BACKOFF_SEC,
+                 backoff_max: float = SEND_BACKOFF_MAX_SEC, workers: int = SEND_WORKERS,
+                 parse_mode: str | None = "HTML"):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.workers = workers
+        self.parse_mode = parse_mode
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, workers))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _wait_sec(self, resp, attempt: int) -> float:
+        if resp is not None and resp.status_code == 429:
+            try:
+                return float(resp.json()["parameters"]["retry_after"])
+            except (ValueError, KeyError, TypeError):
+                pass
+        return min(self.backoff * (2 ** attempt), self.backoff_max)
+
+    def post(self, chat_id: str, text: str) -> dict:
+        """1건 전송 → {"chat_id", "ok", "status", "attempts", "error"}"""
+        payload = {"chat_id": chat_id, "text": text}
+        if self.parse_mode:
+            payload["parse_mode"] = self.parse_mode
+        res = {"chat_id": chat_id, "ok": False, "status": None, "attempts": 0, "error": ""}
+        for attempt in range(self.retries + 1):
+            res["attempts"] = attempt + 1
+            resp = None
+            try:
+                resp = self.session.post(self.api_url, data=payload, timeout=self.timeout)
+                res["status"] = resp.status_code
+                if resp.ok:
+                    res["ok"], res["error"] = True, ""
+                    return res
+                res["error"] = resp.text[:200]
+                if resp.status_code != 429 and resp.status_code < 500:
+                    return res   # 요청 자체가 잘못됨 → 재시도해도 같음
+            except requests.RequestException as e:
+                res["error"] = f"{type(e).__name__}: {e}"
+            if attempt < self.retries:
+                time.sleep(self._wait_sec(resp, attempt))
+        return res
+
+    def send(self, text: str, chat_ids: list[str] | None = None) -> list[dict]:
+        """메시지 1개 → 조각 분할 → 채팅별 전송 결과 목록 (채팅 순서, 조각 순서)"""
+        chat_ids = list(chat_ids or CHAT_IDS)
+        chunks = split_message(text)
+
+        def to_chat(chat_id):
+            out = []
+            for i, chunk in enumerate(chunks, start=1):
+                r = dict(self.post(chat_id, chunk), part=f"{i}/{len(chunks)}")
+                out.append(r)
+                if not r["ok"]:
+                    break   # 앞 조각이 실패하면 뒤 조각은 보내지 않음 (순서가 뒤섞이지 않게)
+            return out
+
+        if len(chat_ids) == 1:
+            return to_chat(chat_ids[0])
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(chat_ids))) as ex:
+            return [r for rs in ex.map(to_chat, chat_ids) for r in rs]
+
+
+_DISPATCHER: TelegramDispatcher | None = None
+
+
+def get_dispatcher() -> TelegramDispatcher:
+    """프로세스 안에서 세션을 재사용하도록 전송기 1개를 공유"""
+    global _DISPATCHER
+    if _DISPATCHER is None:
+        _DISPATCHER = TelegramDispatcher(mock_telegram_url() if TELEGRAM_MOCK else TELEGRAM_API_URL)
+    return _DISPATCHER
+
+
+def send_telegram_message(text: str, chat_ids: list[str] | None = None) -> list[dict]:
+    """
+    CHAT_IDS(또는 chat_ids)로 메시지를 전송한다.
+    parse_mode=HTML 이므로 본문의 <, >, & 는 이스케이프 (임계 문구 '< 0bp' 등이 태그로 해석되지 않게).
+    """
+    results = get_dispatcher().send(html.escape(text, quote=False), chat_ids)
+    failed = [r for r in results if not r["ok"]]
+    if not failed:
+        print(f"✅ 텔레그램 전송 성공 (채팅 {len({r['chat_id'] for r in results})}개, {len(results)}건)")
+    for r in failed:
+        print(f"⚠️ 텔레그램 전송 실패: chat_id={r['chat_id']} 조각 {r['part']} "
+              f"(HTTP {r['status']}, {r['attempts']}회 시도) {r['error']}")
+    return results
+
+
+# ==========================
+# 5-1. 로컬 가짜 텔레그램 서버 (테스트/벤치마크)
+# ==========================
+class MockTelegramServer:
+    """
+    로컬 HTTP 서버로 sendMessage 흉내
+    - 받은 요청은 received 에 (chat_id, text) 로 기록
+    - latency: 응답 지연(초), script: 앞에서부터 차례로 돌려줄 응답 [(status, retry_after 또는 None), ...]
+      (비면 항상 200) → 429/5xx 재시도 점검용
+    - keep-alive(HTTP/1.1) 지원 → 세션 재사용 효과 측정 가능
+    """
+
+    def __init__(self, latency: float = 0.0, script: list | None = None, port: int = 0):
+        self.latency = latency
+        self.script = list(script or [])
+        self.received: list[tuple[str, str]] = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True   # keep-alive 에서 헤더/본문 분할 전송 시 지연 ACK 대기(40ms) 방지
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                form = {k: v[0] for k, v in parse_qs(body).items()}
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    status, retry_after = server.script.pop(0) if server.script else (200, None)
+                    if status == 200:
+                        server.received.append((form.get("chat_id"), form.get("text", "")))
+                if status == 200:
+                    out = {"ok": True, "result": {"message_id": len(server.received)}}
+                elif status == 429:
+                    out = {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                           "parameters": {"retry_after": retry_after or 1}}
+                else:
+                    out = {"ok": False, "error_code": status, "description": "mock error"}
+                data = json.dumps(out).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/bot0:mock/sendMessage"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+_MOCK_SERVER: MockTelegramServer | None = None
+
+
+def mock_telegram_url() -> str:
+    """TELEGRAM_MOCK=True 일 때 쓰는 로컬 가짜 서버 주소 (처음 호출 시 서버 시작)"""
+    global _MOCK_SERVER
+    if _MOCK_SERVER is None:
+        _MOCK_SERVER = MockTelegramServer()
+        print(f"🧪 가짜 텔레그램 서버: {_MOCK_SERVER.url}")
+    return _MOCK_SERVER.url
+
+
+def bench_telegram_dispatch(n_messages: int = 20, n_chats: int = 3, latency: float = 0.02,
+                            message_chars: int = 1500) -> pd.DataFrame:
+    """
+    가짜 서버로 전송 방식별 지연 비교 → DataFrame [mode, messages, requests, connections, sec, ms_per_message]
+    - bare: 예전 방식 (요청마다 requests.post, 채팅 순차)
+    - session: 전송기 1개 (연결 재사용, 채팅 동시 전송)
+    """
+    chat_ids = [f"-100{i}" for i in range(n_chats)]
+    text = "\n".join(f"• 지표 {i:03d}: 1일 변화 {i * 0.1:.1f}bp (기준 ±15bp)" for i in range(message_chars // 30))
+    out = []
+    for mode in ("bare", "session"):
+        srv = MockTelegramServer(latency=latency)
+        try:
+            t0 = time.perf_counter()
+            if mode == "bare":
+                for _ in range(n_messages):
+                    for chat_id in chat_ids:
+                        requests.post(srv.url, data={"chat_id": chat_id, "text": text}, timeout=SEND_TIMEOUT_SEC)
+            else:
+                disp = TelegramDispatcher(srv.url, workers=n_chats)
+                for _ in range(n_messages):
+                    disp.send(text, chat_ids)
+                disp.close()
+            sec = time.perf_counter() - t0
+        finally:
+            srv.close()
+        out.append({"mode": mode, "messages": n_messages, "requests": len(srv.received),
+                    "connections": srv.connections, "sec": round(sec, 3),
+                    "ms_per_message": round(sec / n_messages * 1000, 1)})
+    return pd.DataFrame(out)
+
+
+# ==========================
+# 5-2. 알림 버스 (텔레그램 / 이메일 / 웹훅, 형식별 1회 렌더링)
+# ==========================
+class AlertPayload:
+    """
+    채널에 넘기는 알림 1건 (대상 날짜 + breach 행 + alert_state 표)
+    - render(fmt): 형식별 본문을 처음 한 번만 만들고 캐시 (채널이 동시에 요청해도 1번)
+      text = 텔레그램/이메일 본문, html = 이메일 HTML, json = 웹훅(대시보드) dict
+    """
+
+    def __init__(self, breach_df: pd.DataFrame, target_date: date, state_df: pd.DataFrame | None = None):
+        self.breach_df = breach_df
+        self.target_date = target_date
+        self.state_df = state_df
+        self.renders = 0   # 실제 렌더링 횟수 (캐시 확인용)
+        self._cache: dict = {}
+        self._locks = {fmt: threading.Lock() for fmt in _RENDERERS}
+
+    def render(self, fmt: str):
+        with self._locks[fmt]:
+            if fmt not in self._cache:
+                self._cache[fmt] = _RENDERERS[fmt](self)
+                self.renders += 1
+            return self._cache[fmt]
+
+
+def _records(df: pd.DataFrame | None) -> list[dict]:
+    if df is None or df.empty:
+        return []
+    return json.loads(df.to_json(orient="records", force_ascii=False, date_format="iso"))
+
+
+def _render_json(p: AlertPayload) -> dict:
+    """웹훅 본문: 날짜, 신규/해소/지속 목록과 breach 행 (NaN → null)"""
+    out = {"date": f"{p.target_date:%Y-%m-%d}", "breaches": _records(p.breach_df)}
+    if p.state_df is not None:
+        for status in ("new", "ongoing", "cleared"):
+            out[status] = _records(p.state_df[p.state_df["status"] == status])
+    return out
+
+
+_RENDERERS = {
+    "text": lambda p: build_message_from_breach_df(p.breach_df, p.target_date, p.state_df),
+    "html": lambda p: ("<html><body><pre style=\"font-family:monospace\">"
+                       + html.escape(p.render("text")) + "</pre></body></html>"),
+    "json": _render_json,
+}
+
+
+class TelegramChannel:
+    name, fmt = "telegram", "text"
+
+    def __init__(self, chat_ids: list[str] | None = None):
+        self.chat_ids = chat_ids
+
+    def deliver(self, payload: AlertPayload, timeout: float) -> str:
+        results = send_telegram_message(payload.render("text"), self.chat_ids)
+        failed = [r for r in results if not r["ok"]]
+        if failed:
+            raise RuntimeError(f"{len(failed)}/{len(results)}건 실패 (HTTP {failed[0]['status']})")
+        return f"{len(results)}건"
+
+
+class EmailChannel:
+    """SMTP (STARTTLS) 로 text + html 대체 본문 메일 1통"""
+    name, fmt = "email", "html"
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, user: str = SMTP_USER,
+                 password: str = SMTP_PASSWORD, sender: str = EMAIL_FROM, to: list[str] | None = None,
+                 starttls: bool = True):
+        self.host, self.port, self.user, self.password = host, port, user, password
+        self.sender, self.to, self.starttls = sender, list(to or EMAIL_TO), starttls
+
+    def deliver(self, payload: AlertPayload, timeout: float) -> str:
+        msg = EmailMessage()
+        msg["Subject"] = f"[리스크 임계치 초과 알림] {payload.target_date:%Y-%m-%d}"
+        msg["From"] = self.sender
+        msg["To"] = ", ".join(self.to)
+        msg.set_content(payload.render("text"))
+        msg.add_alternative(payload.render("html"), subtype="html")
+        with smtplib.SMTP(self.host, self.port, timeout=timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            smtp.send_message(msg)
+        return f"{len(self.to)}명"
+
+
+class WebhookChannel:
+    """대시보드 웹훅: json 형식 본문을 POST"""
+    name, fmt = "webhook", "json"
+
+    def __init__(self, url: str = WEBHOOK_URL):
+        self.url = url
+        self.session = requests.Session()
+
+    def deliver(self, payload: AlertPayload, timeout: float) -> str:
+        resp = self.session.post(self.url, json=payload.render("json"), timeout=timeout)
         resp.raise_for_status()
-        print("✅ 텔레그램 전송 성공")
-    except requests.RequestException as e:
-        print("⚠️ 텔레그램 전송 중 오류 발생:", e)
+        return f"HTTP {resp.status_code}"
+
+
+class StubChannel:
+    """
+    오프라인 점검용 채널: 렌더링 결과를 delivered 에 쌓기만 함
+    - delay: 전달 지연(초), fail: True 면 예외 → 느린/실패 채널 흉내
+    """
+
+    def __init__(self, name: str, fmt: str = "text", delay: float = 0.0, fail: bool = False):
+        self.name, self.fmt, self.delay, self.fail = name, fmt, delay, fail
+        self.delivered: list = []
+
+    def deliver(self, payload: AlertPayload, timeout: float) -> str:
+        body = payload.render(self.fmt)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("stub failure")
+        self.delivered.append(body)
+        return "stub"
+
+
+class NotificationBus:
+    """
+    알림 1건을 모든 채널에 동시에 전달
+    - 채널마다 스레드 1개, 채널별 제한 시간(timeouts[이름], 없으면 default_timeout)
+    - 제한 시간을 넘긴 채널은 timeout 으로 기록하고 기다리지 않음 → 느린 채널이 다른 채널 결과를 늦추지 않음
+    - 본문은 AlertPayload 캐시를 공유 (형식별 1번 렌더링)
+    """
+
+    def __init__(self, channels: list, timeouts: dict | None = None, default_timeout: float = 30.0):
+        self.channels = list(channels)
+        self.timeouts = dict(CHANNEL_TIMEOUT_SEC if timeouts is None else timeouts)
+        self.default_timeout = default_timeout
+
+    def timeout_of(self, channel) -> float:
+        return float(self.timeouts.get(channel.name, self.default_timeout))
+
+    @staticmethod
+    def _run(channel, payload, timeout, t0):
+        try:
+            detail = channel.deliver(payload, timeout)
+            return {"channel": channel.name, "status": "sent", "detail": detail,
+                    "sec": round(time.perf_counter() - t0, 3)}
+        except Exception as e:
+            return {"channel": channel.name, "status": "failed", "detail": f"{type(e).__name__}: {e}",
+                    "sec": round(time.perf_counter() - t0, 3)}
+
+    def publish(self, payload: AlertPayload) -> list[dict]:
+        """채널별 결과 [{channel, status: sent/failed/timeout, detail, sec}, ...] (채널 순서)"""
+        if not self.channels:
+            return []
+        t0 = time.perf_counter()
+        ex = ThreadPoolExecutor(max_workers=len(self.channels), thread_name_prefix="notify")
+        # 결과는 채널 위치로 보관 (이름이 같은 채널이 있어도 서로 덮어쓰지 않음)
+        futs = {ex.submit(self._run, ch, payload, self.timeout_of(ch), t0): i for i, ch in enumerate(self.channels)}
+        results, pending = {}, set(futs)
+        while pending:
+            elapsed = time.perf_counter() - t0
+            next_deadline = min(self.timeout_of(self.channels[futs[f]]) for f in pending)
+            done, pending = wait(pending, timeout=max(0.0, next_deadline - elapsed), return_when=FIRST_COMPLETED)
+            for f in done:
+                results[futs[f]] = f.result()
+            elapsed = time.perf_counter() - t0
+            for f in [f for f in pending if elapsed >= self.timeout_of(self.channels[futs[f]])]:
+                ch = self.channels[futs[f]]
+                results[futs[f]] = {"channel": ch.name, "status": "timeout",
+                                    "detail": f"{self.timeout_of(ch):g}s 초과", "sec": round(elapsed, 3)}
+                pending.discard(f)
+        ex.shutdown(wait=False, cancel_futures=True)   # 시간 초과 채널 스레드는 뒤에서 마저 끝남
+        return [results[i] for i in range(len(self.channels))]
+
+
+def build_channels(names: list[str] | None = None) -> list:
+    """NOTIFY_CHANNELS 이름 → 채널 객체 (설정이 비어 있는 채널은 경고 후 제외, 중복 이름은 1번만)"""
+    out = []
+    for name in dict.fromkeys(NOTIFY_CHANNELS if names is None else names):
+        if name == "telegram":
+            out.append(TelegramChannel())
+        elif name == "email":
+            if not (SMTP_HOST and EMAIL_TO):
+                print("⚠️ 이메일 채널: SMTP_HOST / EMAIL_TO 미설정 → 제외")
+                continue
+            out.append(EmailChannel())
+        elif name == "webhook":
+            if not WEBHOOK_URL:
+                print("⚠️ 웹훅 채널: WEBHOOK_URL 미설정 → 제외")
+                continue
+            out.append(WebhookChannel())
+        else:
+            raise ValueError(f"알 수 없는 알림 채널: {name}")
+    return out
 
 
 # ==========================
 # 6. 메인 실행 흐름
 # ==========================
-def send_risk_alert_via_telegram(target_date: date | None = None) -> None:
+def send_risk_alert(target_date: date | None = None, channels: list | None = None) -> list[dict]:
     """
     통합 실행 함수:
-    1) 대상 날짜의 risk_thresholds 엑셀 경로 계산
+    1) 같은 실행의 메모리 레코드(ALERT_RECORDS) 또는 대상 날짜의 risk_thresholds 엑셀
     2) breach 행만 필터링
-    3) 텍스트 메시지 구성
-    4) 텔레그램 전송
+    3) 알림 1건 구성 (본문은 채널이 요청한 형식만 1번씩 렌더링)
+    4) NOTIFY_CHANNELS(또는 channels: 채널 이름/객체 목록)에 동시 전달 → 채널별 결과
     """
     if target_date is None:
         target_date = date.today()
 
-    excel_path = get_risk_excel_path(target_date)
-    print(f"▶ 임계치 파일: {excel_path}")
-
-    breach_df = load_breach_rows(excel_path)
+    # 같은 프로세스에서 방금 계산한 결과가 있으면 메모리에서 바로 (엑셀은 대체 경로)
+    records = globals().get("ALERT_RECORDS")
+    excel_path = None
+    if records is not None and globals().get("ALERT_RECORDS_DATE") == target_date:
+        print(f"▶ 임계치: 메모리 alerts 레코드 {len(records)}행 (엑셀 읽기 생략)")
+        breach_df = load_breach_rows_from_records(records)
+    else:
+        excel_path = get_risk_excel_path(target_date)
+        print(f"▶ 임계치 파일: {excel_path}")
+        breach_df = load_breach_rows(excel_path)
     print(f"▶ 임계치 초과 지표 수: {len(breach_df)}")
 
-    msg = build_message_from_breach_df(breach_df, target_date)
+    # 알림 상태: 마지막 전달 이후 변화 (상태 파일이 없으면 엑셀 alert_state 시트의 당일 전이)
+    state_df, store = None, None
+    if SEND_ONLY_CHANGES:
+        store = load_alert_state_store()
+        if store is not None:
+            state_df = pending_alert_state(store["entries"])
+            print(f"▶ 알림 상태: {store['asof']} 기준, 마지막 전달 이후 변화")
+        elif excel_path is not None:
+            state_df = load_alert_state(excel_path)
+
+    # 변화만 전송: 신규 초과가 있는 지표만 남기고, 신규/해소가 하나도 없으면 전송 생략
+    if state_df is not None:
+        new_metrics = set(state_df.loc[state_df["status"] == "new", "metric"])
+        breach_df = breach_df[breach_df["metric"].isin(new_metrics)]
+        n_cleared = int((state_df["status"] == "cleared").sum())
+        print(f"▶ 신규 초과 지표 {len(breach_df)}개, 해소 {n_cleared}건, "
+              f"지속 {int((state_df['status'] == 'ongoing').sum())}건")
+        if breach_df.empty and n_cleared == 0:
+            print("▶ 신규/해소 없음 → 전송 생략")
+            return []
+
+    payload = AlertPayload(breach_df, target_date, state_df)
     print("▶ 전송 메시지 미리보기:")
     print("=" * 60)
-    print(msg)
+    print(payload.render("text"))
     print("=" * 60)
 
-    # 실제 텔레그램 전송
-    send_telegram_message(msg)
+    # 채널 동시 전달 (이름이면 설정으로 채널 생성)
+    if channels is None or all(isinstance(c, str) for c in channels):
+        channels = build_channels(channels)
+    results = NotificationBus(channels).publish(payload)
+    for r in results:
+        flag = {"sent": "✅", "failed": "⚠️", "timeout": "⏱"}[r["status"]]
+        print(f"{flag} {r['channel']}: {r['status']} ({r['detail']}, {r['sec']:.2f}s)")
+
+    # 전달 기록은 실제로 보낸 뒤에만 → 실패/미실행이면 다음 전송에 그대로 포함
+    if store is not None and any(r["status"] == "sent" for r in results):
+        mark_alert_state_notified(store)
+    return results
+
+
+def send_risk_alert_via_telegram(target_date: date | None = None) -> list[dict]:
+    """텔레그램으로만 전송 (기존 호출 호환)"""
+    return send_risk_alert(target_date, ["telegram"])
 
 
 # ==========================
 # 7. 직접 실행 시 진입점
 # ==========================
 if __name__ == "__main__":
-    # 기본은 오늘 날짜 기준으로 동작
-    send_risk_alert_via_telegram()
+    # 기본은 오늘 날짜 기준으로 NOTIFY_CHANNELS 에 전송
+    send_risk_alert()
 
     # 특정 날짜 파일을 보내고 싶으면 예시처럼 호출
     # from datetime import datetime
-    # send_risk_alert_via_telegram(datetime(2025, 11, 17).date())
+    # send_risk_alert(datetime(2025, 11, 17).date())
 
 
 # ───────────────────────────────────────────────────────────────────────────────
@@ -953,10 +4153,18 @@ if __name__ == "__main__":
 # ───────────────────────────────────────────────────────────────────────────────
 
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import pandas as pd
-import blpapi                                   # Bloomberg low‑level API
-from xbbg import blp                            # xbbg 래퍼
+
+# 데이터 소스: 위 리스크 임계치 셀에서 구성한 DATA_SOURCE(live/record/replay)를 재사용
+try:
+    DATA_SOURCE
+except NameError:
+    import blpapi                               # Bloomberg low‑level API
+    from xbbg import blp as DATA_SOURCE         # xbbg 래퍼 (단독 실행 시)
 
 # 1) 환경 설정
 # ───────────────────────────────────────────────────────────────────────────────
@@ -971,6 +4179,15 @@ today      = datetime.today()
 end_date   = today.strftime("%Y-%m-%d")                        # 예: '2025-07-29'
 start_date = (today - timedelta(days=365)).strftime("%Y-%m-%d")  # 예: '2024-07-29'
 
+# 배치 조회 설정
+CHUNK_SIZE   = 25     # BDH 1회 요청에 묶을 티커 수
+MAX_WORKERS  = 4      # 동시에 처리할 청크 수 (bounded worker pool)
+MAX_RETRIES  = 3      # 청크별 최대 시도 횟수
+BACKOFF_SEC  = 2.0    # 재시도 대기 = BACKOFF_SEC × 2^(시도-1) 초
+# ⚠️ xbbg는 블룸버그 세션 1개를 공유하므로 실제 BDH 송수신은 한 번에 하나씩만 수행
+#    (replay/fake 소스처럼 스레드 안전한 백엔드는 병렬 그대로 수행)
+SERIALIZE_BDH = getattr(DATA_SOURCE, "name", "live") != "replay"
+
 # 2) 출력 폴더 준비
 # ───────────────────────────────────────────────────────────────────────────────
 os.makedirs(output_dir, exist_ok=True)  # 없으면 생성
@@ -984,37 +4201,146 @@ required_cols = {'Indicator_ID', 'Bloomberg_Ticker'}
 if not required_cols.issubset(df_ind.columns):
     raise KeyError(f"'{', '.join(required_cols)}' 칼럼이 모두 필요합니다. 파일을 확인해주세요.")
 
-# 4) 티커별 조회 및 저장
+
+# 4) 배치 다운로드 엔진
 # ───────────────────────────────────────────────────────────────────────────────
-total = len(df_ind)
-for idx, row in df_ind.iterrows():
-    indicator_id = row['Indicator_ID'].strip()      # 지표 고유 ID
-    ticker       = row['Bloomberg_Ticker'].strip()   # 블룸버그 티커
+_BDH_LOCK = threading.Lock()
+
+
+def _bdh_px_last(bdh_api, tickers, start_date, end_date):
+    """PX_LAST(종가) 일별 시계열 조회 (여러 티커를 한 번에)"""
+    kwargs = dict(
+        tickers=tickers,         # 리스트 형태로 입력
+        flds='PX_LAST',          # 조회 필드: 종가
+        start_date=start_date,   # 시작일
+        end_date=end_date,       # 종료일
+        Per='D',                 # 일별 데이터
+        adjust='all',            # 배당·분할 등 조정 반영
+    )
+    if SERIALIZE_BDH:
+        with _BDH_LOCK:
+            return bdh_api.bdh(**kwargs)
+    return bdh_api.bdh(**kwargs)
 
-    print(f"[{idx+1}/{total}] 조회 시작 ▶ {indicator_id} ({ticker})")
 
-    try:
-        # PX_LAST(종가) 일별 시계열 조회
-        df_ts = blp.bdh(
-            tickers=[ticker],        # 리스트 형태로 입력
-            flds='PX_LAST',          # 조회 필드: 종가
-            start_date=start_date,   # 시작일
-            end_date=end_date,       # 종료일
-            Per='D',                 # 일별 데이터
-            adjust='all'             # 배당·분할 등 조정 반영
-        )
-    except Exception as e:
-        print(f"⚠️ 조회 실패: {indicator_id} ({ticker}) → {e}")
-        continue
+def _fetch_chunk(bdh_api, chunk_no, tickers, start_date, end_date, retries, backoff):
+    """
+    청크 1개 조회 (재시도/백오프 포함)
+    반환: (wide DataFrame, 통계 dict) / 최종 실패 시 wide=None
+    """
+    t0 = time.perf_counter()
+    last_err = None
+    for attempt in range(1, retries + 1):
+        try:
+            wide = _bdh_px_last(bdh_api, tickers, start_date, end_date)
+            return wide, {
+                "chunk": chunk_no, "tickers": len(tickers), "attempts": attempt,
+                "latency_sec": round(time.perf_counter() - t0, 3), "error": None,
+            }
+        except Exception as e:
+            last_err = e
+            if attempt < retries:
+                wait = backoff * 2 ** (attempt - 1)
+                print(f"  ↻ 청크 {chunk_no} 재시도 {attempt}/{retries - 1} ({wait:.1f}s 후) → {e}")
+                time.sleep(wait)
+    return None, {
+        "chunk": chunk_no, "tickers": len(tickers), "attempts": retries,
+        "latency_sec": round(time.perf_counter() - t0, 3), "error": str(last_err),
+    }
+
+
+def _split_wide(wide, ticker):
+    """여러 티커 결과(wide)에서 한 티커 분량만 잘라 기존 단건 조회와 같은 모양으로 반환"""
+    if wide is None or wide.empty:
+        return None
+    if isinstance(wide.columns, pd.MultiIndex):
+        if ticker not in wide.columns.get_level_values(0):
+            return None
+        df_ts = wide.loc[:, [ticker]]
+    else:
+        df_ts = wide.copy()
+        df_ts.columns = pd.MultiIndex.from_product([[ticker], df_ts.columns])
+    df_ts = df_ts.dropna(how='all')
+    return df_ts if not df_ts.empty else None
+
+
+def download_indicators_batched(pairs, start_date, end_date, bdh_api=None,
+                                chunk_size=CHUNK_SIZE, max_workers=MAX_WORKERS,
+                                retries=MAX_RETRIES, backoff=BACKOFF_SEC):
+    """
+    (Indicator_ID, Bloomberg_Ticker) 목록을 청크 단위 BDH 요청으로 묶어 병렬 조회.
+    - 티커 중복은 1번만 조회하고, 결과를 지표별로 다시 분배
+    - 청크가 끝내 실패하면 해당 청크의 티커만 1개씩 개별 조회 (불량 티커 격리)
+    - bdh_api: blp.bdh 와 같은 시그니처의 bdh()를 가진 모듈/객체 (기본 DATA_SOURCE, 테스트용 fake 주입 가능)
+    반환: (results {indicator_id: DataFrame 또는 None}, chunk_stats [dict])
+    """
+    bdh_api = bdh_api or DATA_SOURCE
+    tickers = list(dict.fromkeys(t for _, t in pairs))
+    chunks = [tickers[i:i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+
+    per_ticker = {}
+    chunk_stats = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_fetch_chunk, bdh_api, no, chunk, start_date, end_date, retries, backoff): chunk
+            for no, chunk in enumerate(chunks, start=1)
+        }
+        for fut in as_completed(futures):
+            chunk = futures[fut]
+            wide, stat = fut.result()
+            chunk_stats.append(stat)
+            status = "OK" if stat["error"] is None else f"실패 → 개별 조회 ({stat['error']})"
+            print(f"  [청크 {stat['chunk']}/{len(chunks)}] 티커 {stat['tickers']}개, "
+                  f"{stat['latency_sec']:.2f}s, 시도 {stat['attempts']}회 {status}")
+            if wide is not None:
+                for t in chunk:
+                    per_ticker[t] = _split_wide(wide, t)
+                continue
+            # 청크 전체 실패 → 티커 단위로 쪼개서 재조회
+            for t in chunk:
+                single, _ = _fetch_chunk(bdh_api, stat["chunk"], [t], start_date, end_date, 1, backoff)
+                per_ticker[t] = _split_wide(single, t)
+
+    chunk_stats.sort(key=lambda x: x["chunk"])
+    results = {ind_id: per_ticker.get(t) for ind_id, t in pairs}
+    return results, chunk_stats
 
-    if df_ts.empty:
+
+# 5) 청크 조회 및 지표별 저장
+# ───────────────────────────────────────────────────────────────────────────────
+pairs = [
+    (str(ind_id).strip(), str(ticker).strip())
+    for ind_id, ticker in zip(df_ind['Indicator_ID'], df_ind['Bloomberg_Ticker'])
+    if pd.notna(ind_id) and pd.notna(ticker)
+]
+total = len(pairs)
+print(f"▶ 지표 {total}개 조회 시작 (청크 {CHUNK_SIZE}개 단위, 워커 {MAX_WORKERS}개)")
+
+t_all = time.perf_counter()
+shared_plan = globals().get("SHARED_PLAN")
+if shared_plan is not None and "ind" in shared_plan.consumers and shared_plan.raw is not None:
+    # 위 임계치 셀에서 공통 계획으로 이미 조회한 프레임에서 잘라 사용 (추가 BDH 없음)
+    ind_raw = shared_plan.slice("ind")
+    ind_raw.index = ind_raw.index.date  # 단독 조회(blp.bdh)와 같은 date 인덱스 → 엑셀 날짜 서식 동일
+    results = {ind_id: _split_wide(ind_raw, t) for ind_id, t in pairs}
+    print(f"⏱️ 공통 조회 프레임 재사용: {time.perf_counter() - t_all:.2f}s")
+else:
+    results, chunk_stats = download_indicators_batched(pairs, start_date, end_date)
+    lat = [c["latency_sec"] for c in chunk_stats]
+    if lat:
+        print(f"⏱️ 청크 {len(lat)}개, 총 {time.perf_counter() - t_all:.2f}s "
+              f"(청크 평균 {sum(lat) / len(lat):.2f}s, 최대 {max(lat):.2f}s)")
+
+for idx, (indicator_id, ticker) in enumerate(pairs):
+    df_ts = results.get(indicator_id)
+    if df_ts is None or df_ts.empty:
         print(f"⚠️ 데이터 없음: {indicator_id} ({ticker}) 는 스킵합니다.")
         continue
 
     # 엑셀로 저장
     output_path = os.path.join(output_dir, f"{indicator_id}.xlsx")
     df_ts.to_excel(output_path, engine='openpyxl')
-    print(f"✅ 저장 완료: {output_path}")
+    print(f"✅ [{idx+1}/{total}] 저장 완료: {output_path}")
 
 print("🎉 모든 지표 조회 및 저장이 완료되었습니다! 수고하셨습니다.")
 
@@ -1039,6 +4365,8 @@ IND001 ~ IND151 엑셀 파일에 대해:
 
 import os
 import re
+import json
+import hashlib
 import numpy as np
 import pandas as pd
 from datetime import datetime
@@ -1057,6 +4385,12 @@ MIN_PERIODS = max(30, WINDOW // 2)  # 최소 계산 데이터 길이(짧은 데
 # 컬럼 이름 힌트(우선 매칭)
 DATE_COL_HINTS = ["date", "날짜", "일자", "time", "일시"]
 VALUE_COL_HINTS = ["close", "price", "value", "index", "지수", "종가", "가격", "값", "수치", "PX_LAST"]
+
+# 레이아웃 캐시: 파일 상단 레이아웃 지문이 같으면 헤더/날짜/값 컬럼 감지를 건너뜀
+# (다운로드 셀이 매일 파일을 다시 써도 레이아웃이 같으면 재사용)
+SCHEMA_CACHE = True
+SCHEMA_CACHE_PATH = os.path.join(BASE_DIR, "_ind_schema_cache.json")  # 파생지표 셀과 공유
+SCHEMA_FLAG_CELLS = {(0, 2), (0, 3), (0, 4)}  # C1/D1/E1 (행, 열 0-based): 지문에서 글자 대신 종류만
 # ====================================================
 
 # ✅ [추가] 지표별 고정 임계치 설정 (방식 A: 절대값 기준)
@@ -1305,20 +4639,183 @@ def _pick_value_col(df: pd.DataFrame, exclude_cols: list) -> Optional[str]:
     return candidates[0][0]
 
 
+# ---------------- 단일 패스 로더 + 레이아웃 캐시 ----------------
+def read_sheet_rows(path: str, sheet_name=0) -> list:
+    """
+    워크북을 read_only 모드로 **한 번만** 파싱해 셀 값 행 목록 반환.
+    pandas.read_excel과 같은 규칙으로 정리:
+      - 정수값 float → int, 빈 문자열 → None
+      - 행 끝의 빈 셀/파일 끝의 빈 행 제거 후 가장 넓은 행 기준으로 None 패딩
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        rows = []
+        for r in ws.iter_rows(values_only=True):
+            row = [
+                int(v) if isinstance(v, float) and v.is_integer()
+                else (None if v == "" else v)
+                for v in r
+            ]
+            while row and row[-1] is None:
+                row.pop()
+            rows.append(row)
+    finally:
+        wb.close()
+
+    while rows and not rows[-1]:
+        rows.pop()
+    width = max((len(r) for r in rows), default=0)
+    return [r + [None] * (width - len(r)) for r in rows]
+
+
+def _frame_from_rows(rows: list, header: Optional[int], scanned: bool = False) -> pd.DataFrame:
+    """
+    행 목록 → DataFrame (detect_header_and_read와 같은 컬럼명 규칙)
+      - header=None : 헤더 없음(0..n-1)
+      - scanned=False: header=0 일반 로드 규칙(빈 헤더 → 'Unnamed: i')
+      - scanned=True : 후보 스캔 규칙(원본 전체에서 header 행을 컬럼명으로)
+    """
+    if header is None:
+        df = pd.DataFrame(rows)
+    elif not scanned:
+        names = [f"Unnamed: {j}" if v is None else v for j, v in enumerate(rows[0])] if rows else []
+        df = pd.DataFrame(rows[1:], columns=_make_unique(names))
+    else:
+        raw = pd.DataFrame(rows)
+        raw.columns = _make_unique(raw.iloc[header].astype(str).str.strip())
+        df = raw.iloc[header + 1:].reset_index(drop=True)
+    return _clean_columns(df)
+
+
+def detect_header_from_rows(rows: list, max_scan: int = 10) -> Tuple[Optional[int], bool, pd.DataFrame]:
+    """
+    detect_header_and_read와 같은 판정을 이미 읽은 행 목록 위에서 수행.
+    후보 헤더마다 프레임을 복사하지 않고, 상단 (max_scan + 5)행의 숫자 여부를
+    열마다 한 번만 계산한 뒤 후보 바로 아래 5행 창으로 스코어링.
+    반환: (header 행 번호 또는 None, 후보 스캔 여부, 정리된 DataFrame)
+    """
+    header = 0 if len(rows) > 1 else None  # header=0 로드 결과가 비면 header=None
+    df0 = _frame_from_rows(rows, header)
+    if _likely_good(df0):
+        return header, False, df0
+
+    raw = pd.DataFrame(rows)
+    nrows = min(max_scan, len(raw))
+    top = raw.iloc[: nrows + 5]
+    numlike = np.array([_as_numeric_series(top[c]).notna().to_numpy() for c in top.columns]).T  # (행, 열)
+    best_score, best_row = -1e9, 0
+    for hdr in range(nrows):
+        names = _make_unique(raw.iloc[hdr].astype(str).str.strip())
+        win = numlike[hdr + 1:hdr + 6]
+        score_num = int((win.mean(axis=0) >= 0.5).sum()) if len(win) else 0  # = _numeric_score
+        penalty = sum(1 for name in names if str(name).lower() in ("nan", "nat", "", "none"))
+        score = score_num - 0.5 * penalty  # 나쁜 헤더 패널티
+
+        if score > best_score:
+            best_score, best_row = score, hdr
+
+    return best_row, True, _frame_from_rows(rows, best_row, scanned=True)
+
+
+def layout_fingerprint(rows: list, max_scan: int = 10) -> str:
+    """
+    헤더 감지가 보는 상단 (max_scan + 5)행의 레이아웃 지문
+    - 숫자/날짜는 값이 아닌 종류('n'/'d')만, 빈 값/대시류는 '', 그 외 문자열은 글자 그대로
+    - C1/D1/E1(이 스크립트가 쓰는 플래그 셀)은 글자 대신 종류만 → G↔Y 가 바뀌어도 같은 지문
+    → 다운로드 셀이 매일 다시 저장해도(mtime 변경) 데이터만 바뀌었으면 같은 지문
+    """
+    def kind(v, text):
+        if v is None:
+            return ""
+        if isinstance(v, bool):
+            return "b"
+        if isinstance(v, (int, float)):
+            return "n"
+        if hasattr(v, "isoformat"):
+            return "d"
+        t = re.sub(r"\s+", " ", str(v)).strip()
+        if t in ("", "-", "—", "_", "nan", "NaN", "None"):
+            return ""
+        try:
+            float(t.replace(",", "").replace("%", "").strip("()"))
+            return "n"
+        except ValueError:
+            return t if text else "s"
+
+    top = [[kind(v, (i, j) not in SCHEMA_FLAG_CELLS) for j, v in enumerate(r)]
+           for i, r in enumerate(rows[: max_scan + 5])]
+    return hashlib.sha1(json.dumps(top, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def load_schema_cache(path: str = SCHEMA_CACHE_PATH) -> dict:
+    """레이아웃 캐시 로드 (없거나 깨졌거나 예전 형식이면 빈 캐시)"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") == 2:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {"version": 2, "files": {}}
+
+
+def save_schema_cache(cache: dict, path: str = SCHEMA_CACHE_PATH) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def schema_cache_get(cache: Optional[dict], fpath: str, key: str, fingerprint: str) -> Optional[dict]:
+    """경로 + 단계(key)의 레이아웃이 있고 지문이 같을 때만 반환"""
+    if cache is None:
+        return None
+    schema = cache["files"].get(os.path.abspath(fpath), {}).get(key)
+    if not schema or schema.get("fingerprint") != fingerprint:
+        return None
+    return schema
+
+
+def schema_cache_put(cache: Optional[dict], fpath: str, key: str, fingerprint: str, schema: dict) -> None:
+    if cache is None:
+        return
+    cache["files"].setdefault(os.path.abspath(fpath), {})[key] = dict(schema, fingerprint=fingerprint)
+
+
 # ---------------- 로딩/계산 ----------------
-def _load_timeseries(path: str, sheet_name=0) -> Tuple[pd.Series, pd.DataFrame]:
+def _load_timeseries(path: str, sheet_name=0, cache: Optional[dict] = None) -> Tuple[pd.Series, pd.DataFrame]:
     """
     엑셀에서 시계열(날짜, 값)을 추출해 Series 반환.
+    - 워크북은 한 번만 파싱, cache에 같은 지문의 레이아웃이 있으면 감지 생략
     - 날짜 컬럼이 있으면 DatetimeIndex 정렬
     - 없으면 단순 순번 인덱스
     """
-    df = detect_header_and_read(path, sheet_name=sheet_name)
-
-    date_col = _pick_date_col(df)
-    value_col = _pick_value_col(df, exclude_cols=[date_col] if date_col else [])
-
-    if value_col is None:
-        raise ValueError("숫자형 시계열 컬럼을 찾지 못했습니다. (헤더/형식 확인 필요)")
+    rows = read_sheet_rows(path, sheet_name=sheet_name)
+    key = f"vol_band:{sheet_name}"
+    fingerprint = layout_fingerprint(rows)
+    schema = schema_cache_get(cache, path, key, fingerprint)
+
+    if schema is not None:
+        df = _frame_from_rows(rows, schema["header"], schema["scanned"])
+        date_col = None if schema["date_col"] is None else df.columns[schema["date_col"]]
+        value_col = df.columns[schema["value_col"]]
+    else:
+        header, scanned, df = detect_header_from_rows(rows)
+        date_col = _pick_date_col(df)
+        value_col = _pick_value_col(df, exclude_cols=[date_col] if date_col else [])
+
+        if value_col is None:
+            raise ValueError("숫자형 시계열 컬럼을 찾지 못했습니다. (헤더/형식 확인 필요)")
+
+        schema_cache_put(cache, path, key, fingerprint, {
+            "header": header,
+            "scanned": scanned,
+            "date_col": None if date_col is None else df.columns.get_loc(date_col),
+            "value_col": df.columns.get_loc(value_col),
+        })
 
     if date_col is not None:
         dt = pd.to_datetime(df[date_col], errors="coerce", infer_datetime_format=True)
@@ -1484,6 +4981,7 @@ def write_results_to_excel(
 # ---------------- 메인 드라이버 ----------------
 def main():
     results = []
+    cache = load_schema_cache() if SCHEMA_CACHE else None
     for i in FILE_RANGE:
         fname = f"{FILE_PREFIX}{i:03d}.xlsx"
         fpath = os.path.join(BASE_DIR, fname)
@@ -1493,7 +4991,7 @@ def main():
             continue
 
         try:
-            s, _df = _load_timeseries(fpath, sheet_name=SHEET_NAME)
+            s, _df = _load_timeseries(fpath, sheet_name=SHEET_NAME, cache=cache)
 
             # ✅ [변경] 지표 ID를 넘겨서 임계치 기반 플래그 계산
             indicator_id = f"{FILE_PREFIX}{i:03d}"
@@ -1545,6 +5043,9 @@ def main():
                 print(f"  -> probe failed: {e2}")
             results.append((fname, "error", err_msg))
 
+    if cache is not None:
+        save_schema_cache(cache)
+
     # 요약 CSV 저장
     summary_path = os.path.join(
         BASE_DIR,
@@ -1596,6 +5097,7 @@ import os
 import re
 import json
 import math
+import hashlib
 import numpy as np
 import pandas as pd
 from datetime import datetime
@@ -1619,6 +5121,11 @@ DATE_COL_HINTS  = ["date", "날짜", "일자", "time", "일시"]
 VALUE_COL_HINTS = ["close", "price", "value", "index", "지수", "종가", "가격", "값", "수치"]
 
 MIN_PERIODS = 30  # 짧은 데이터 보호
+
+# 레이아웃 캐시(변동성 밴드 셀과 공유): 상단 레이아웃 지문이 같으면 헤더/컬럼 감지 생략
+SCHEMA_CACHE = True
+SCHEMA_CACHE_PATH = os.path.join(BASE_DIR, "_ind_schema_cache.json")
+SCHEMA_FLAG_CELLS = {(0, 2), (0, 3), (0, 4)}  # C1/D1/E1: 변동성 밴드 셀이 매일 쓰는 플래그 셀
 # ====================================================
 
 
@@ -1774,15 +5281,159 @@ def _pick_value_col(df: pd.DataFrame, exclude_cols: list) -> Optional[str]:
     return candidates[0][0]
 
 
-# ---------------- 시계열 로딩 ----------------
-def load_series_from_excel(path: str, sheet_name=0) -> pd.Series:
-    """엑셀에서 (날짜, 값) 시계열 Series 반환 (DatetimeIndex 정렬)"""
-    df = detect_header_and_read(path, sheet_name=sheet_name)
+# ---------------- 단일 패스 로더 + 레이아웃 캐시 ----------------
+def read_sheet_rows(path: str, sheet_name=0) -> list:
+    """워크북을 read_only 모드로 한 번만 파싱해 셀 값 행 목록 반환 (read_excel과 같은 트리밍)"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        rows = []
+        for r in ws.iter_rows(values_only=True):
+            row = [
+                int(v) if isinstance(v, float) and v.is_integer()
+                else (None if v == "" else v)
+                for v in r
+            ]
+            while row and row[-1] is None:
+                row.pop()
+            rows.append(row)
+    finally:
+        wb.close()
+
+    while rows and not rows[-1]:
+        rows.pop()
+    width = max((len(r) for r in rows), default=0)
+    return [r + [None] * (width - len(r)) for r in rows]
+
+def _frame_from_rows(rows: list, header: Optional[int], scanned: bool = False) -> pd.DataFrame:
+    """행 목록 → DataFrame (header=None: 헤더 없음 / scanned: 후보 스캔 규칙 / 그 외: header=0 규칙)"""
+    if header is None:
+        df = pd.DataFrame(rows)
+    elif not scanned:
+        names, seen = [], {}
+        for j, v in enumerate(rows[0] if rows else []):
+            n = f"Unnamed: {j}" if v is None else v
+            k = seen.get(n, 0)
+            seen[n] = k + 1
+            names.append(n if k == 0 else f"{n}.{k}")
+        df = pd.DataFrame(rows[1:], columns=names)
+    else:
+        raw = pd.DataFrame(rows)
+        raw.columns = raw.iloc[header].astype(str).str.strip()
+        df = raw.iloc[header + 1 :].reset_index(drop=True)
+    return _clean_columns(df)
+
+def detect_header_from_rows(rows: list, max_scan: int = 10) -> Tuple[Optional[int], bool, pd.DataFrame]:
+    """
+    detect_header_and_read와 같은 판정을 이미 읽은 행 목록 위에서 수행
+    (후보마다 복사하지 않고, 상단 행의 숫자 여부를 열마다 한 번 계산해 5행 창으로 스코어링).
+    반환: (header 행 번호 또는 None, 후보 스캔 여부, DataFrame)
+    """
+    header = 0 if len(rows) > 1 else None
+    df0 = _frame_from_rows(rows, header)
+    if _likely_good(df0):
+        return header, False, df0
 
-    date_col = _pick_date_col(df)
-    value_col = _pick_value_col(df, exclude_cols=[date_col] if date_col else [])
-    if value_col is None:
-        raise ValueError("숫자형 시계열 컬럼을 찾지 못했습니다.")
+    raw = pd.DataFrame(rows)
+    nrows = min(max_scan, len(raw))
+    top = raw.iloc[: nrows + 5]
+    numlike = np.array([_as_numeric_series(top[c], strict=False).notna().to_numpy() for c in top.columns]).T
+    best_score, best_row = -1, 0
+    for hdr in range(nrows):
+        win = numlike[hdr + 1 : hdr + 6]
+        score = int((win.mean(axis=0) >= 0.5).sum()) if len(win) else 0
+        if score > best_score:
+            best_score, best_row = score, hdr
+
+    return best_row, True, _frame_from_rows(rows, best_row, scanned=True)
+
+def layout_fingerprint(rows: list, max_scan: int = 10) -> str:
+    """
+    상단 (max_scan + 5)행의 레이아웃 지문 (숫자/날짜는 종류만, 문자열은 글자 그대로,
+    변동성 밴드 셀이 쓰는 C1/D1/E1 은 종류만) → 데이터만 바뀐 파일은 같은 지문
+    """
+    def kind(v, text):
+        if v is None:
+            return ""
+        if isinstance(v, bool):
+            return "b"
+        if isinstance(v, (int, float)):
+            return "n"
+        if hasattr(v, "isoformat"):
+            return "d"
+        t = re.sub(r"\s+", " ", str(v)).strip()
+        if t in ("", "-", "—", "_", "nan", "NaN", "None"):
+            return ""
+        try:
+            float(t.replace(",", "").replace("%", "").strip("()"))
+            return "n"
+        except ValueError:
+            return t if text else "s"
+
+    top = [[kind(v, (i, j) not in SCHEMA_FLAG_CELLS) for j, v in enumerate(r)]
+           for i, r in enumerate(rows[: max_scan + 5])]
+    return hashlib.sha1(json.dumps(top, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def load_schema_cache(path: str = SCHEMA_CACHE_PATH) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") == 2:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {"version": 2, "files": {}}
+
+def save_schema_cache(cache: dict, path: str = SCHEMA_CACHE_PATH) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+def schema_cache_get(cache: Optional[dict], fpath: str, key: str, fingerprint: str) -> Optional[dict]:
+    if cache is None:
+        return None
+    schema = cache["files"].get(os.path.abspath(fpath), {}).get(key)
+    if not schema or schema.get("fingerprint") != fingerprint:
+        return None
+    return schema
+
+def schema_cache_put(cache: Optional[dict], fpath: str, key: str, fingerprint: str, schema: dict) -> None:
+    if cache is None:
+        return
+    cache["files"].setdefault(os.path.abspath(fpath), {})[key] = dict(schema, fingerprint=fingerprint)
+
+
+# ---------------- 시계열 로딩 ----------------
+def load_series_from_excel(path: str, sheet_name=0, cache: Optional[dict] = None) -> pd.Series:
+    """엑셀에서 (날짜, 값) 시계열 Series 반환 (DatetimeIndex 정렬, 1회 파싱 + 레이아웃 캐시)"""
+    rows = read_sheet_rows(path, sheet_name=sheet_name)
+    key = f"market_data:{sheet_name}"
+    fingerprint = layout_fingerprint(rows)
+    schema = schema_cache_get(cache, path, key, fingerprint)
+
+    if schema is not None:
+        df = _frame_from_rows(rows, schema["header"], schema["scanned"])
+        date_col = None if schema["date_col"] is None else df.columns[schema["date_col"]]
+        value_col = df.columns[schema["value_col"]]
+    else:
+        header, scanned, df = detect_header_from_rows(rows)
+        date_col = _pick_date_col(df)
+        value_col = _pick_value_col(df, exclude_cols=[date_col] if date_col else [])
+        if value_col is None:
+            raise ValueError("숫자형 시계열 컬럼을 찾지 못했습니다.")
+
+        # 컬럼명이 중복이면 위치로 되찾을 수 없으므로 캐시하지 않음
+        locs = [df.columns.get_loc(c) for c in (date_col, value_col) if c is not None]
+        if all(isinstance(x, int) for x in locs):
+            schema_cache_put(cache, path, key, fingerprint, {
+                "header": header,
+                "scanned": scanned,
+                "date_col": None if date_col is None else locs[0],
+                "value_col": locs[-1],
+            })
 
     if date_col is not None:
         dt = pd.to_datetime(df[date_col], errors="coerce", infer_datetime_format=True)
@@ -1952,6 +5603,7 @@ def corr_rolling(x: pd.Series, y: pd.Series, days: int = 60) -> Optional[float]:
 # ---------------- 메인 파이프라인 ----------------
 def main():
     series_map: Dict[str, pd.Series] = {}
+    cache = load_schema_cache() if SCHEMA_CACHE else None
     for i in FILE_RANGE:
         fid = f"{FILE_PREFIX}{i:03d}"
         fpath = os.path.join(BASE_DIR, f"{fid}.xlsx")
@@ -1959,11 +5611,13 @@ def main():
             print(f"[SKIP] {fid}: file not found")
             continue
         try:
-            s = load_series_from_excel(fpath, sheet_name=SHEET_NAME)
+            s = load_series_from_excel(fpath, sheet_name=SHEET_NAME, cache=cache)
             series_map[fid] = s
         except Exception as e:
             # 핵심: 문자열 처리/컬럼매핑 실패 시에도 원인 출력하고 계속
             print(f"[SKIP] {fid}: {e}")
+    if cache is not None:
+        save_schema_cache(cache)
 
     if not series_map:
         raise RuntimeError("유효한 IND 시계열을 하나도 찾지 못했습니다.")
@@ -2095,6 +5749,7 @@ if __name__ == "__main__":
 목적:
 - C:/Users/amongpapa/chartup/raw_data 폴더의 risk_thresholds_YYYYMMDD.xlsx 파일들 중,
   파일명 날짜(YYYYMMDD)가 '가장 최신'인 파일을 자동 선택
+  (risk_archive.sqlite 가 있으면 엑셀 대신 아카이브의 최신일 alerts 행을 row_no 순서로 사용)
 - 해당 파일의 alerts 시트를 읽어서,
   엑셀 2행 → IND500, 3행 → IND501, ... 규칙으로 매핑
 - 각 행에 'TRUE'가 한 칸이라도 있으면 C1='Y', 아니면 'G'를
@@ -2112,6 +5767,7 @@ if __name__ == "__main__":
 from pathlib import Path  # ✅ 윈도우에서도 안전한 경로 처리
 from datetime import datetime
 import re
+import sqlite3
 import pandas as pd
 from openpyxl import load_workbook
 
@@ -2124,6 +5780,9 @@ RISK_DIR = Path(r"C:\Users\amongpapa\chartup\raw_data")
 # alerts 시트명
 ALERTS_SHEET = "alerts"
 
+# 일별 alerts 누적 아카이브 (리스크 임계치 스크립트가 매일 저장) - 없으면 엑셀 파일 방식
+ARCHIVE_PATH = RISK_DIR / "risk_archive.sqlite"
+
 # IND 엑셀들이 있는 폴더(업데이트 대상)
 TARGET_DIR = Path(r"C:\Users\amongpapa\chartup\go_scen\data\set")
 
@@ -2165,6 +5824,32 @@ def pick_risk_file_by_name_date() -> Path:
     return best
 
 
+# ---------------- 아카이브에서 최신일 alerts 행 ----------------
+def load_latest_rows_from_archive():
+    """
+    아카이브 최신일 alerts 행을 엑셀 시트(header=None)와 같은 모양으로 반환: (날짜, 행 목록)
+    - 행 목록[0] = 헤더, 행 목록[k] = row_no k (= 엑셀 k+1행)
+    - breach_* 는 1/0 → True/False (row_has_true 가 불리언 True 로 판정)
+    - 아카이브가 없거나 비어 있으면 (None, None)
+    """
+    if not ARCHIVE_PATH.exists():
+        return None, None
+    conn = sqlite3.connect(ARCHIVE_PATH)
+    try:
+        day = conn.execute("SELECT MAX(date) FROM alerts").fetchone()[0]
+        if day is None:
+            return None, None
+        cur = conn.execute(
+            "SELECT metric, ticker, latest, chg_1d, threshold_1d, breach_1d, chg_10d, threshold_10d,"
+            " breach_10d, breach_3m, note FROM alerts WHERE date = ? ORDER BY row_no", (day,))
+        header = [d[0] for d in cur.description]
+        rows = [[(v == 1) if c.startswith("breach") and v is not None else v for c, v in zip(header, r)]
+                for r in cur.fetchall()]
+    finally:
+        conn.close()
+    return day, [header] + rows
+
+
 # ---------------- 엑셀 행 → IND 번호 매핑 ----------------
 def excel_row_to_ind(excel_row: int) -> int:
     """
@@ -2213,12 +5898,17 @@ def update_c1_flag(ind_num: int, flag: str) -> bool:
 
 # ---------------- 메인 루틴 ----------------
 def main():
-    # 1) 최신 risk_thresholds 파일 선택(파일명 날짜 기준)
-    risk_file = pick_risk_file_by_name_date()
-    print(f"▶ 기준 파일(파일명 날짜 최신): {risk_file.name}")
+    # 1) 아카이브 최신일 행 (없으면 최신 risk_thresholds 파일 선택 - 파일명 날짜 기준)
+    day, rows = load_latest_rows_from_archive()
+    if rows is not None:
+        print(f"▶ 기준: 아카이브 최신일 {day} ({ARCHIVE_PATH.name})")
+        df = pd.DataFrame(rows, dtype=object)
+    else:
+        risk_file = pick_risk_file_by_name_date()
+        print(f"▶ 기준 파일(파일명 날짜 최신): {risk_file.name}")
 
-    # 2) alerts 시트를 헤더 없이(raw) 로드 → 엑셀 실제 행 번호와 1:1 매핑 가능
-    df = pd.read_excel(risk_file, sheet_name=ALERTS_SHEET, header=None, engine="openpyxl")
+        # 2) alerts 시트를 헤더 없이(raw) 로드 → 엑셀 실제 행 번호와 1:1 매핑 가능
+        df = pd.read_excel(risk_file, sheet_name=ALERTS_SHEET, header=None, engine="openpyxl")
     nrows = df.shape[0]
 
     total_updated = 0